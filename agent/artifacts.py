@@ -0,0 +1,231 @@
+import contextlib
+import difflib
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+from agent.workspace import Workspace
+
+# Snapshot the generated files of every run after each coder step and validation round
+ARTIFACTS_ENABLED = os.getenv("ARTIFACTS_ENABLED", "true").lower() in ("1", "true", "yes")
+ARTIFACTS_PATH = pathlib.Path(os.getenv("ARTIFACTS_PATH", pathlib.Path(__file__).parent / ".state" / "artifacts"))
+# Blobs younger than this are never collected, so a snapshot another process
+# (e.g. the CLI) is still taking keeps the blobs it has just written
+ARTIFACTS_GC_GRACE_SECONDS = int(os.getenv("ARTIFACTS_GC_GRACE_SECONDS", "600"))
+
+
+def content_digest(content: str) -> str:
+    """The sha256 blobs are stored under; the same hash ``Workspace.content_hash`` computes."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    """Content-addressed file blobs plus snapshot manifests that point at them.
+
+    Every distinct file content is stored once, zlib-compressed, under its
+    sha256 in ``blobs/``. A snapshot is a {path: digest} manifest of one run
+    at one point (e.g. after a coder step), kept in SQLite, so taking,
+    listing and diffing snapshots never copies file contents. Blobs no
+    snapshot refers to any more are removed by ``collect_garbage``; it holds
+    ``lock``, which ``snapshot_workspace`` also holds from the first ``put``
+    until its manifest is recorded.
+    """
+
+    def __init__(self, root: pathlib.Path = ARTIFACTS_PATH):
+        self.root = pathlib.Path(root)
+        self.blobs = self.root / "blobs"
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        self.path = self.root / "snapshots.sqlite3"
+        self.lock = threading.Lock()
+        self.gc_lock = threading.Lock()
+        self.gc_pending = False
+        # Digests known to be on disk, so repeated snapshots cost no stat calls
+        self.known: set[str] = set()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, label TEXT NOT NULL,"
+                " created_at REAL NOT NULL, manifest TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS snapshots_run ON snapshots (run_id, id)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def blob_path(self, digest: str) -> pathlib.Path:
+        return self.blobs / digest[:2] / digest[2:]
+
+    def has(self, digest: str) -> bool:
+        if digest in self.known:
+            return True
+        if self.blob_path(digest).exists():
+            self.known.add(digest)
+            return True
+        return False
+
+    def put(self, content: str, digest: Optional[str] = None) -> str:
+        """Stores a file content unless it is already present and returns its digest."""
+        digest = digest or content_digest(content)
+        if self.has(digest):
+            return digest
+        path = self.blob_path(digest)
+        path.parent.mkdir(exist_ok=True)
+        # Write then rename, so a blob is either complete or absent
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(zlib.compress(content.encode("utf-8")))
+        os.replace(tmp, path)
+        self.known.add(digest)
+        return digest
+
+    def get(self, digest: str) -> str:
+        return zlib.decompress(self.blob_path(digest).read_bytes()).decode("utf-8")
+
+    def snapshot(self, run_id: str, label: str, manifest: dict[str, str]) -> int:
+        """Records a manifest of blobs already stored with ``put`` and returns the snapshot id."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO snapshots (run_id, label, created_at, manifest) VALUES (?, ?, ?, ?)",
+                (run_id, label, time.time(), json.dumps(manifest, sort_keys=True)),
+            )
+            return cursor.lastrowid
+
+    def snapshot_workspace(self, workspace: Workspace, run_id: str, label: str) -> int:
+        """Stores the workspace's files as blobs and records them as a snapshot."""
+        manifest = {}
+        # Until the manifest is recorded, nothing refers to its blobs
+        with self.lock:
+            for path in workspace.paths():
+                try:
+                    content = workspace.read(path)
+                except UnicodeDecodeError:
+                    # Only text files are generated; anything else is not part of the output
+                    continue
+                if content is not None:
+                    manifest[path] = self.put(content, workspace.content_hash(path))
+            return self.snapshot(run_id, label, manifest)
+
+    def snapshots(self, run_id: str) -> list[dict]:
+        """The run's snapshots, oldest first, without their manifests."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, label, created_at, manifest FROM snapshots WHERE run_id = ? ORDER BY id", (run_id,)
+            ).fetchall()
+        return [{"id": row[0], "label": row[1], "created_at": row[2], "files": len(json.loads(row[3]))}
+                for row in rows]
+
+    def get_snapshot(self, snapshot_id: int) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, run_id, label, created_at, manifest FROM snapshots WHERE id = ?", (snapshot_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "run_id": row[1], "label": row[2], "created_at": row[3], "manifest": json.loads(row[4])}
+
+    def diff(self, old: dict[str, str], new: dict[str, str], patch: bool = False) -> dict:
+        """Compares two manifests by digest; ``patch`` adds unified diffs of the changed files."""
+        result = {
+            "added": sorted(set(new) - set(old)),
+            "removed": sorted(set(old) - set(new)),
+            "changed": sorted(path for path in set(old) & set(new) if old[path] != new[path]),
+        }
+        if patch:
+            result["patches"] = {}
+            for path in result["added"] + result["removed"] + result["changed"]:
+                before = self.get(old[path]).splitlines(keepends=True) if path in old else []
+                after = self.get(new[path]).splitlines(keepends=True) if path in new else []
+                result["patches"][path] = "".join(difflib.unified_diff(before, after, f"a/{path}", f"b/{path}"))
+        return result
+
+    def materialize(self, manifest: dict[str, str], workspace: Workspace) -> dict:
+        """Makes the workspace hold exactly the snapshot's files, touching only the ones that differ."""
+        written, deleted = [], []
+        for path, digest in manifest.items():
+            if workspace.content_hash(path) != digest:
+                workspace.write(path, self.get(digest))
+                written.append(path)
+        for path in workspace.paths():
+            if path not in manifest:
+                workspace.delete(path)
+                deleted.append(path)
+        workspace.flush()
+        return {"written": sorted(written), "deleted": sorted(deleted)}
+
+    def delete_runs(self, run_ids: list[str]) -> None:
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM snapshots WHERE run_id = ?", [(run_id,) for run_id in run_ids])
+
+    def collect_garbage(self) -> int:
+        """Removes blobs no snapshot refers to and returns how many were removed."""
+        with self.lock:
+            with self._connect() as conn:
+                referenced = set()
+                for (manifest,) in conn.execute("SELECT manifest FROM snapshots"):
+                    referenced.update(json.loads(manifest).values())
+            cutoff = time.time() - ARTIFACTS_GC_GRACE_SECONDS
+            removed = 0
+            for path in self.blobs.glob("*/*"):
+                digest = path.parent.name + path.name
+                if digest in referenced or path.name.endswith(".tmp"):
+                    continue
+                try:
+                    if path.stat().st_mtime > cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                path.unlink(missing_ok=True)
+                self.known.discard(digest)
+                removed += 1
+            return removed
+
+    def schedule_garbage_collection(self) -> None:
+        """Runs ``collect_garbage`` on a background thread; requests made before it starts share one run."""
+        with self.gc_lock:
+            if self.gc_pending:
+                return
+            self.gc_pending = True
+        threading.Thread(target=self._collect_in_background, name="artifact-gc", daemon=True).start()
+
+    def _collect_in_background(self) -> None:
+        with self.gc_lock:
+            self.gc_pending = False
+        try:
+            removed = self.collect_garbage()
+        except Exception as e:
+            print(f"Artifact garbage collection failed: {e}")
+            return
+        if removed:
+            print(f"Removed {removed} unreferenced artifact blobs")
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore()
+        return _store
+
+
+def snapshot_run(workspace: Workspace, label: str) -> Optional[int]:
+    """Snapshots the workspace of the graph run this is called from, named after its checkpoint thread."""
+    if not ARTIFACTS_ENABLED:
+        return None
+    from langgraph.config import get_config
+    run_id = get_config()["configurable"]["thread_id"]
+    return get_artifact_store().snapshot_workspace(workspace, run_id, label)
@@ -0,0 +1,139 @@
+import json
+import os
+import pathlib
+import re
+import shutil
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, Optional
+
+# Graph compiled in each worker process with its own checkpointer connection
+_agent = None
+
+
+def load_prompts(path: pathlib.Path) -> list[dict]:
+    """Reads a JSONL file of {"prompt": ..., "id": ..., "no_cache": ...} entries.
+
+    Entries without an id are named after their line number, so a batch can be
+    resumed as long as the file is not reordered. A line may also be a bare
+    JSON string holding the prompt.
+    """
+    entries, seen = [], set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {"prompt": entry}
+            if not entry.get("prompt"):
+                raise ValueError(f"{path}:{line_number}: entry has no prompt")
+            job_id = re.sub(r"[^A-Za-z0-9_-]", "_", str(entry.get("id") or f"line-{line_number:05d}"))
+            if job_id in seen:
+                raise ValueError(f"{path}:{line_number}: duplicate id {job_id!r}")
+            seen.add(job_id)
+            entries.append({"id": job_id, "prompt": entry["prompt"], "no_cache": bool(entry.get("no_cache", False))})
+    return entries
+
+
+def completed_ids(results_path: pathlib.Path) -> set[str]:
+    """Ids already finished successfully in an earlier run of the batch."""
+    done = set()
+    if not results_path.exists():
+        return done
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off when the batch was killed
+                continue
+            if result.get("status") == "completed":
+                done.add(result["id"])
+    return done
+
+
+def _init_worker() -> None:
+    global _agent
+    from agent import validation
+    from agent.graph import graph, make_checkpointer
+    # The batch pool already runs jobs in parallel, and a validation pool forked
+    # from a worker that has running threads deadlocks; check files inline
+    validation.VALIDATION_WORKERS = 0
+    # A SQLite connection must not be shared with the parent process
+    _agent = graph.compile(checkpointer=make_checkpointer())
+
+
+def run_job(entry: dict, output_dir: str, recursion_limit: int = 100) -> dict:
+    """Generates one project into ``output_dir/<id>`` and returns its result line."""
+    from agent.graph import run_config
+    from agent.tools import use_project_root
+    from agent.workspace import close_workspace
+
+    project_dir = pathlib.Path(output_dir) / entry["id"]
+    # Leftovers of an interrupted attempt would leak into the new run
+    shutil.rmtree(project_dir, ignore_errors=True)
+    result = {"id": entry["id"], "prompt": entry["prompt"], "output_dir": str(project_dir), "pid": os.getpid()}
+    started = time.time()
+    nodes: dict[str, float] = {}
+    last = time.perf_counter()
+    final = {}
+    try:
+        with use_project_root(project_dir):
+            for update in _agent.stream({"user_prompt": entry["prompt"], "no_cache": entry["no_cache"]},
+                                        run_config(f"batch-{entry['id']}-{int(started)}", recursion_limit),
+                                        stream_mode="updates"):
+                now = time.perf_counter()
+                for node, values in update.items():
+                    nodes[node] = round(nodes.get(node, 0.0) + now - last, 3)
+                    final.update(values or {})
+                last = now
+        close_workspace(project_dir)
+        result.update(status="completed", files=len([p for p in project_dir.rglob("*") if p.is_file()]),
+                      validation=final.get("validation") or {})
+    except Exception as e:
+        close_workspace(project_dir)
+        traceback.print_exc()
+        result.update(status="error", error=str(e))
+    result.update(started_at=started, seconds=round(time.time() - started, 3), node_seconds=nodes)
+    return result
+
+
+def run_batch(entries: list[dict], output_dir: pathlib.Path, results_path: pathlib.Path, workers: int = 2,
+              recursion_limit: int = 100, max_pending: Optional[int] = None) -> Iterator[dict]:
+    """Runs the entries on a pool of worker processes and appends each result to ``results_path``.
+
+    Entries already completed according to ``results_path`` are skipped.
+    Results are written (and yielded) as jobs finish, so an interrupted batch
+    loses only the jobs that were running.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    done = completed_ids(results_path)
+    pending = [entry for entry in entries if entry["id"] not in done]
+    max_pending = max_pending or workers * 2
+
+    with open(results_path, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        queue = iter(pending)
+        running = set()
+        try:
+            while True:
+                # Submit lazily so a cancelled batch does not leave a long queue behind
+                for entry in queue:
+                    running.add(pool.submit(run_job, entry, str(output_dir), recursion_limit))
+                    if len(running) >= max_pending:
+                        break
+                if not running:
+                    return
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    out.write(json.dumps(result) + "\n")
+                    out.flush()
+                    yield result
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import io
+import json
+import posixpath
+import tarfile
+import time
+import zipfile
+from typing import Iterator, Optional
+
+from agent.workspace import Workspace
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+ARCHIVE_FORMATS = ("zip", "tar.gz")
+
+
+def build_manifest(workspace: Workspace, since: Optional[int] = None) -> dict:
+    """Describes a workspace's files (or only those changed after ``since``) with hashes and revisions."""
+    with workspace.lock:
+        if since is None:
+            paths, deleted = workspace.paths(), []
+        else:
+            paths, deleted = workspace.changes_since(since)
+        files = []
+        for path in paths:
+            content = workspace.read(path)
+            if content is None:
+                continue
+            files.append({
+                "name": posixpath.basename(path),
+                "path": path,
+                "sha256": workspace.content_hash(path),
+                "size": len(content.encode("utf-8")),
+                "revision": workspace.revisions.get(path, 0),
+                "content": content,
+            })
+        return {
+            "revision": workspace.revision,
+            "since": since,
+            "files": files,
+            "deleted": deleted,
+        }
+
+
+def manifest_etag(manifest: dict, variant: str, encoding: Optional[str] = None) -> str:
+    """A strong ETag over the file hashes, so it changes exactly when the content does.
+
+    Each content encoding of a response is a different representation and
+    gets its own tag, the way the preview cache suffixes its ETags.
+    """
+    digest = hashlib.sha256(variant.encode("utf-8"))
+    digest.update(str(manifest["since"]).encode("utf-8"))
+    for entry in manifest["files"]:
+        digest.update(f"{entry['path']}\0{entry['sha256']}\0".encode("utf-8"))
+    for path in manifest["deleted"]:
+        digest.update(f"-{path}\0".encode("utf-8"))
+    if encoding:
+        return f'"{digest.hexdigest()[:32]}-{encoding}"'
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks brotli when the client accepts it and the module is installed, else gzip."""
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def manifest_json(manifest: dict) -> bytes:
+    return json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that hands written bytes back in chunks."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_archive(manifest: dict, fmt: str, prefix: str = "project") -> Iterator[bytes]:
+    """Streams the manifest's files as a zip or tar.gz archive, one file at a time."""
+    buffer = _ChunkBuffer()
+    now = time.time()
+    if fmt == "zip":
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for entry in manifest["files"]:
+                info = zipfile.ZipInfo(f"{prefix}/{entry['path']}", time.localtime(now)[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(info, entry["content"])
+                yield buffer.drain()
+        yield buffer.drain()
+    elif fmt == "tar.gz":
+        with tarfile.open(fileobj=buffer, mode="w|gz") as archive:
+            for entry in manifest["files"]:
+                data = entry["content"].encode("utf-8")
+                info = tarfile.TarInfo(f"{prefix}/{entry['path']}")
+                info.size = len(data)
+                info.mtime = int(now)
+                archive.addfile(info, io.BytesIO(data))
+                yield buffer.drain()
+        yield buffer.drain()
+    else:
+        raise ValueError(f"Unsupported archive format: {fmt}")
@@ -0,0 +1,149 @@
+import asyncio
+import contextlib
+import hashlib
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+CACHE_PATH = pathlib.Path(os.getenv("LLM_CACHE_PATH", pathlib.Path(__file__).parent / ".cache" / "llm_cache.sqlite3"))
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+T = TypeVar("T", bound=BaseModel)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapses whitespace so prompts that only differ in spacing share an entry."""
+    return "\n".join(" ".join(line.split()) for line in prompt.strip().splitlines() if line.strip())
+
+
+def cache_key(prompt: str, model: str, template_version: str, schema: str) -> str:
+    raw = "\x1f".join([normalize_prompt(prompt), model, template_version, schema])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed cache of structured LLM responses with TTL and LRU eviction."""
+
+    def __init__(self, path: pathlib.Path = CACHE_PATH, ttl: int = CACHE_TTL_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = pathlib.Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._initialized = False
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Opens a connection, commits on success and always closes it."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            if not self._initialized:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    " key TEXT PRIMARY KEY, schema TEXT NOT NULL, value TEXT NOT NULL,"
+                    " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+                self._initialized = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    return row[0]
+                if row:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+    def set(self, key: str, schema: str, value: str) -> None:
+        now = time.time()
+        with self.lock:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, schema, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, schema, value, now, now),
+                )
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def clear(self) -> None:
+        with self.lock:
+            if self.path.exists():
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = 0
+            if self.path.exists():
+                with self._connect() as conn:
+                    entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "enabled": CACHE_ENABLED,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+llm_cache = LLMCache()
+
+
+def cached_structured_call(schema: Type[T], prompt: str, model: str, template_version: str,
+                           invoke: Callable[[], Optional[T]], bypass: bool = False) -> Optional[T]:
+    """Returns the cached ``schema`` response for this prompt, or calls ``invoke`` and caches it.
+
+    ``bypass`` skips the lookup but still stores the fresh response.
+    """
+    key = cache_key(prompt, model, template_version, schema.__name__)
+    if CACHE_ENABLED and not bypass:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return schema.model_validate_json(cached)
+
+    resp = invoke()
+    if CACHE_ENABLED and resp is not None:
+        llm_cache.set(key, schema.__name__, resp.model_dump_json())
+    return resp
+
+
+async def acached_structured_call(schema: Type[T], prompt: str, model: str, template_version: str,
+                                  invoke: Callable[[], Awaitable[Optional[T]]], bypass: bool = False) -> Optional[T]:
+    """Async version of ``cached_structured_call``; the SQLite lookups run on a worker thread."""
+    key = cache_key(prompt, model, template_version, schema.__name__)
+    if CACHE_ENABLED and not bypass:
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            return schema.model_validate_json(cached)
+
+    resp = await invoke()
+    if CACHE_ENABLED and resp is not None:
+        await asyncio.to_thread(llm_cache.set, key, schema.__name__, resp.model_dump_json())
+    return resp
@@ -0,0 +1,261 @@
+import ast
+import json
+import os
+import re
+import threading
+import weakref
+from html.parser import HTMLParser
+from typing import Optional
+
+from agent.routing import estimate_tokens
+from agent.validation import (CSS_REFERENCE, JS_EXTENSIONS, JS_IMPORT, REFERENCE_ATTRS, is_local_reference,
+                              resolve_reference)
+from agent.workspace import Workspace, normalize_relative
+
+# Tokens of project context put into a coder prompt: the target file, the full
+# text of its dependencies while they fit, and an outline of everything else
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+# Symbols listed per file in the outline
+MAX_OUTLINE_SYMBOLS = 40
+
+JS_SYMBOL = re.compile(
+    r"(?:^|;)\s*(?:export\s+(?:default\s+)?)?(?:async\s+)?(?:function\s*\*?\s*([A-Za-z_$][\w$]*)|class\s+([A-Za-z_$][\w$]*)"
+    r"|(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>|class\b))",
+    re.MULTILINE,
+)
+JS_EXPORT_LIST = re.compile(r"\bexport\s*\{([^}]*)\}")
+JS_DOM_ID = re.compile(r"""getElementById\(\s*["']([\w-]+)["']|querySelector(?:All)?\(\s*["']#([\w-]+)""")
+CSS_SELECTOR_ID = re.compile(r"#([A-Za-z_][\w-]*)")
+CSS_RULE = re.compile(r"([^{}]+)\{")
+
+
+class FileOutline:
+    """Symbols of one file: what it defines, the DOM ids it uses and the project files it references."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.symbols: list[str] = []
+        self.ids: list[str] = []
+        self.references: list[str] = []
+
+    def add(self, items: list[str], value: Optional[str]) -> None:
+        if value and value not in items:
+            items.append(value)
+
+    def render(self) -> str:
+        parts = [f"- {self.path} ({self.size} chars)"]
+        if self.symbols:
+            parts.append(f"  defines: {', '.join(self.symbols[:MAX_OUTLINE_SYMBOLS])}")
+        if self.ids:
+            parts.append(f"  ids: {', '.join('#' + i for i in self.ids[:MAX_OUTLINE_SYMBOLS])}")
+        if self.references:
+            parts.append(f"  uses: {', '.join(self.references)}")
+        return "\n".join(parts)
+
+
+class _HTMLOutliner(HTMLParser):
+    def __init__(self, outline: FileOutline):
+        super().__init__(convert_charrefs=True)
+        self.outline = outline
+        self.in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        self.outline.add(self.outline.ids, attrs.get("id"))
+        attr = REFERENCE_ATTRS.get(tag)
+        ref = attrs.get(attr) if attr else None
+        if ref and tag in ("script", "link") and is_local_reference(ref):
+            self.outline.add(self.outline.references, resolve_reference(self.outline.path, ref))
+        self.in_title = tag == "title"
+
+    def handle_data(self, data):
+        if self.in_title and data.strip():
+            self.outline.add(self.outline.symbols, f"title {data.strip()!r}")
+
+    def handle_endtag(self, tag):
+        self.in_title = False
+
+
+def _outline_html(outline: FileOutline, text: str) -> None:
+    parser = _HTMLOutliner(outline)
+    try:
+        parser.feed(text)
+        parser.close()
+    except Exception:
+        # A broken document still gets whatever was parsed before the error
+        pass
+
+
+def _outline_css(outline: FileOutline, text: str) -> None:
+    code = re.sub(r"/\*.*?\*/", "", text, flags=re.DOTALL)
+    for match in CSS_RULE.finditer(code):
+        selector = " ".join(match.group(1).split())
+        if selector.startswith("@") and not selector.startswith(("@media", "@keyframes")):
+            continue
+        outline.add(outline.symbols, selector)
+        for css_id in CSS_SELECTOR_ID.findall(selector):
+            # Hex colours never appear in selectors, so every #name here is an id
+            outline.add(outline.ids, css_id)
+    for match in CSS_REFERENCE.finditer(code):
+        ref = match.group(1) or match.group(2)
+        if ref and ref.endswith(".css") and is_local_reference(ref):
+            outline.add(outline.references, resolve_reference(outline.path, ref))
+
+
+def _outline_js(outline: FileOutline, text: str) -> None:
+    for match in JS_SYMBOL.finditer(text):
+        function, cls, variable = match.groups()
+        outline.add(outline.symbols, f"class {cls}" if cls else f"{function or variable}()")
+    for match in JS_EXPORT_LIST.finditer(text):
+        for name in match.group(1).split(","):
+            outline.add(outline.symbols, name.split(" as ")[-1].strip() or None)
+    for match in JS_DOM_ID.finditer(text):
+        outline.add(outline.ids, match.group(1) or match.group(2))
+    for match in JS_IMPORT.finditer(text):
+        ref = match.group(2)
+        if ref.startswith((".", "/")):
+            outline.add(outline.references, resolve_reference(outline.path, ref))
+
+
+def _outline_python(outline: FileOutline, text: str) -> None:
+    try:
+        tree = ast.parse(text)
+    except SyntaxError:
+        return
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            outline.add(outline.symbols, f"{node.name}()")
+        elif isinstance(node, ast.ClassDef):
+            methods = [item.name for item in node.body if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            outline.add(outline.symbols, f"class {node.name}({', '.join(methods)})" if methods else f"class {node.name}")
+        elif isinstance(node, ast.ImportFrom) and node.level:
+            # Relative imports are the only ones that certainly point into the project
+            module = (node.module or "").replace(".", "/")
+            base = "/".join(outline.path.split("/")[:-node.level])
+            outline.add(outline.references, "/".join(p for p in (base, module) if p) + ".py")
+
+
+def _outline_json(outline: FileOutline, text: str) -> None:
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return
+    if isinstance(data, dict):
+        outline.symbols.extend(f"key {key!r}" for key in list(data)[:MAX_OUTLINE_SYMBOLS])
+
+
+OUTLINERS = {
+    ".html": _outline_html,
+    ".htm": _outline_html,
+    ".css": _outline_css,
+    ".js": _outline_js,
+    ".mjs": _outline_js,
+    ".cjs": _outline_js,
+    ".jsx": _outline_js,
+    ".ts": _outline_js,
+    ".py": _outline_python,
+    ".json": _outline_json,
+}
+
+
+def outline_file(path: str, text: str) -> FileOutline:
+    outline = FileOutline(path, len(text))
+    outliner = OUTLINERS.get(os.path.splitext(path)[1].lower())
+    if outliner is not None:
+        outliner(outline, text)
+    return outline
+
+
+# Outlines per workspace and path, tagged with the revision of the file they
+# were built from; a write gives the file a new revision, which invalidates it
+_outlines: "weakref.WeakKeyDictionary[Workspace, dict[str, tuple[int, FileOutline]]]" = weakref.WeakKeyDictionary()
+_outlines_lock = threading.Lock()
+
+
+def workspace_outlines(workspace: Workspace) -> dict[str, FileOutline]:
+    """Returns the outline of every file in the workspace, re-parsing only files written since the last call."""
+    with workspace.lock:
+        revisions = {path: workspace.revisions.get(path, 0) for path in workspace.paths()}
+    with _outlines_lock:
+        cached = _outlines.setdefault(workspace, {})
+        stale = [path for path, revision in revisions.items() if cached.get(path, (None,))[0] != revision]
+        for path in set(cached) - set(revisions):
+            del cached[path]
+    for path in stale:
+        try:
+            text = workspace.read(path)
+        except (UnicodeDecodeError, OSError):
+            text = None
+        outline = outline_file(path, text) if text is not None else FileOutline(path, 0)
+        with _outlines_lock:
+            cached[path] = (revisions[path], outline)
+    with _outlines_lock:
+        return {path: cached[path][1] for path in sorted(revisions) if path in cached}
+
+
+def _resolve_dependency(path: str, outlines: dict[str, FileOutline]) -> Optional[str]:
+    try:
+        # Outlines are keyed by normalized paths; models write "./app.js" as well
+        path = normalize_relative(path)
+    except ValueError:
+        return None
+    for extension in JS_EXTENSIONS:
+        if path + extension in outlines:
+            return path + extension
+    return None
+
+
+def build_context(workspace: Workspace, filepath: str, depends_on: list[str],
+                  budget: Optional[int] = None) -> str:
+    """Assembles the project context of a coder prompt for ``filepath`` within a token budget.
+
+    The target file is always included in full. Its direct dependencies (the
+    task's ``depends_on`` plus the project files the target references) follow
+    in full while they fit, and every other file is listed as an outline of
+    the symbols and DOM ids it defines. When even the outline does not fit,
+    the remaining files are listed by name only.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    try:
+        filepath = normalize_relative(filepath)
+    except ValueError:
+        # Left as it is; the tools refuse the path when the coder tries to write it
+        pass
+    outlines = workspace_outlines(workspace)
+    target = outlines.get(filepath)
+    dependencies = []
+    for path in list(depends_on) + (target.references if target else []):
+        resolved = _resolve_dependency(path, outlines) if path else None
+        if resolved and resolved != filepath and resolved not in dependencies:
+            dependencies.append(resolved)
+
+    content = workspace.read(filepath) if target else None
+    sections = [f"Existing content of {filepath} :\n{content}" if content else f"{filepath} does not exist yet."]
+    remaining = budget - estimate_tokens(sections[0])
+
+    included = {filepath}
+    for path in dependencies:
+        text = workspace.read(path) or ""
+        section = f"Content of {path} (dependency) :\n{text}"
+        cost = estimate_tokens(section)
+        if cost <= remaining:
+            sections.append(section)
+            included.add(path)
+            remaining -= cost
+
+    others = [outline for path, outline in outlines.items() if path not in included]
+    if others:
+        lines, names = [], []
+        for outline in others:
+            rendered = outline.render()
+            cost = estimate_tokens(rendered)
+            if cost <= remaining and not names:
+                lines.append(rendered)
+                remaining -= cost
+            else:
+                names.append(outline.path)
+        if names:
+            lines.append(f"- also: {', '.join(names)}")
+        sections.append("Project outline (use read_file only if you need a file's full content) :\n" + "\n".join(lines))
+    return "\n\n".join(sections)
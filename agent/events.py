@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+from typing import Optional
+
+from langgraph.config import get_stream_writer
+
+# Events kept per job so reconnecting clients can resume with Last-Event-ID
+MAX_EVENTS_PER_JOB = 1000
+TERMINAL_STATUSES = ("completed", "error", "cancelled", "interrupted")
+
+
+def emit(event: str, **data) -> None:
+    """Publishes a progress event on the custom stream of the current graph run.
+
+    Does nothing when called outside a graph run (e.g. a tool used directly).
+    """
+    try:
+        writer = get_stream_writer()
+    except (RuntimeError, KeyError):
+        return
+    writer({"event": event, **data})
+
+
+class EventLog:
+    """Append-only, numbered event history of one job with blocking reads."""
+
+    def __init__(self):
+        self.events: list[dict] = []
+        self.next_id = 1
+        self.closed = False
+        self.condition = threading.Condition()
+        self.updated_at = time.time()
+
+    def append(self, event: str, data: dict) -> dict:
+        with self.condition:
+            entry = {"id": self.next_id, "event": event, "data": data}
+            self.next_id += 1
+            self.events.append(entry)
+            if len(self.events) > MAX_EVENTS_PER_JOB:
+                del self.events[: len(self.events) - MAX_EVENTS_PER_JOB]
+            if event == "status":
+                # A resumed job reopens its stream
+                self.closed = data.get("status") in TERMINAL_STATUSES
+            self.updated_at = time.time()
+            self.condition.notify_all()
+            return entry
+
+    @property
+    def last_id(self) -> int:
+        with self.condition:
+            return self.next_id - 1
+
+    def read(self, after_id: int = 0, timeout: Optional[float] = None) -> list[dict]:
+        """Returns the events newer than ``after_id``, waiting up to ``timeout`` for one to arrive."""
+        with self.condition:
+            if timeout and not self.closed and (not self.events or self.events[-1]["id"] <= after_id):
+                self.condition.wait(timeout)
+            return [entry for entry in self.events if entry["id"] > after_id]
+
+
+class EventBus:
+    """Per-job event logs shared between the job workers and the SSE endpoint."""
+
+    def __init__(self):
+        self.logs: dict[str, EventLog] = {}
+        self.lock = threading.Lock()
+
+    def log(self, request_id: str) -> EventLog:
+        with self.lock:
+            log = self.logs.get(request_id)
+            if log is None:
+                log = self.logs[request_id] = EventLog()
+            return log
+
+    def get(self, request_id: str) -> Optional[EventLog]:
+        with self.lock:
+            return self.logs.get(request_id)
+
+    def publish(self, request_id: str, event: str, **data) -> dict:
+        return self.log(request_id).append(event, data)
+
+    def discard(self, request_id: str) -> None:
+        with self.lock:
+            self.logs.pop(request_id, None)
+
+
+def format_sse(entry: dict) -> str:
+    """Formats one event log entry as a Server-Sent Events message."""
+    return f"id: {entry['id']}\nevent: {entry['event']}\ndata: {json.dumps(entry['data'])}\n\n"
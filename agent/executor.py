@@ -0,0 +1,378 @@
+import atexit
+import contextlib
+import json
+import os
+import queue
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+# Worker processes, i.e. commands that can run at the same time across all jobs
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", "2"))
+# Commands one job may run at the same time
+EXECUTOR_JOB_CONCURRENCY = int(os.getenv("EXECUTOR_JOB_CONCURRENCY", "1"))
+# Upper bound for the wall-clock timeout a caller asks for
+EXECUTOR_MAX_TIMEOUT = int(os.getenv("EXECUTOR_MAX_TIMEOUT", "120"))
+EXECUTOR_CPU_SECONDS = int(os.getenv("EXECUTOR_CPU_SECONDS", "30"))
+EXECUTOR_MEMORY_MB = int(os.getenv("EXECUTOR_MEMORY_MB", "1024"))
+EXECUTOR_FILE_MB = int(os.getenv("EXECUTOR_FILE_MB", "100"))
+# Output bytes per stream passed back; the rest is dropped
+EXECUTOR_MAX_OUTPUT = int(os.getenv("EXECUTOR_MAX_OUTPUT", "65536"))
+# "namespace" runs each command in its own user, mount and PID namespace
+# that sees only the system directories (read-only) and the project root;
+# "none" runs commands directly on the host, for systems without
+# unprivileged user namespaces. Trusted setups only.
+EXECUTOR_ISOLATION = os.getenv("EXECUTOR_ISOLATION", "namespace").lower()
+# Let isolated commands reach the network (e.g. for npm install)
+EXECUTOR_NETWORK = os.getenv("EXECUTOR_NETWORK", "false").lower() in ("1", "true", "yes")
+# Environment variables a command gets from the server; everything else
+# (API keys in particular) stays out of the sandbox
+PASSED_ENV = ("PATH", "LANG", "LC_ALL", "TZ", "NODE_PATH")
+# Slack on top of the command's timeout before the server gives up on a worker
+WORKER_GRACE_SECONDS = 5
+
+
+class CommandResult:
+    def __init__(self, returncode: int, stdout: str, stderr: str, timed_out: bool = False,
+                 truncated: bool = False, seconds: float = 0.0):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.truncated = truncated
+        self.seconds = seconds
+
+
+# ------------------- WORKER PROCESS ------------------- #
+# A worker is this file run as a stdlib-only script: it reads one JSON command
+# per line on stdin, runs it and answers with JSON lines of output chunks
+# followed by the exit status.
+
+def _limit_resources(memory_bytes: int, file_bytes: int) -> None:
+    """Limits the worker itself; the commands it starts inherit the limits."""
+    import resource
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (file_bytes, file_bytes))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+# Runs as root of a fresh user namespace: builds a root file system on a
+# tmpfs at $1 out of read-only binds of the system directories and a bind of
+# the project root at /workspace, then chroots into it. /root, /home, the
+# server's code and its state directories are not there.
+SANDBOX_SCRIPT = """
+set -e
+new=$1 root=$2 rel=$3 cpu=$4
+mount -t tmpfs -o mode=755 sandbox "$new"
+for dir in usr etc bin sbin lib lib32 lib64 libx32 opt; do
+    if [ -L "/$dir" ]; then
+        ln -s "$(readlink "/$dir")" "$new/$dir"
+    elif [ -d "/$dir" ]; then
+        mkdir "$new/$dir"
+        mount --rbind "/$dir" "$new/$dir"
+        mount -o remount,bind,ro "$new/$dir"
+    fi
+done
+mkdir "$new/dev" "$new/proc" "$new/tmp" "$new/workspace"
+mount --rbind /dev "$new/dev"
+mount -t proc proc "$new/proc"
+mount -t tmpfs -o mode=1777 tmp "$new/tmp"
+mount --bind "$root" "$new/workspace"
+cd "$new"
+exec chroot "$new" /bin/sh -c 'cd "/workspace/$1" && ulimit -t "$2" && exec /bin/sh -c "$3"' sh "$rel" "$cpu" "$5"
+"""
+
+# Set by worker_main: the empty directory the sandboxes of this worker mount
+# their root on (every command has its own mount namespace, so they can share
+# it), and why isolation is unavailable, if it is
+_mountpoint: Optional[str] = None
+_isolation_error: Optional[str] = None
+
+
+def _send(message: dict) -> None:
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def _run_request(request: dict) -> None:
+    root = os.path.realpath(request["root"])
+    cwd = os.path.realpath(request["cwd"])
+    if os.path.commonpath([root, cwd]) != root:
+        _send({"error": "Working directory is outside the project root"})
+        return
+    if _isolation_error:
+        _send({"error": _isolation_error})
+        return
+    os.makedirs(cwd, exist_ok=True)
+    started = time.monotonic()
+    deadline = started + request["timeout"]
+    # CPU time is limited per command by the shell; a limit on the worker
+    # would count the time of every command it ever ran. Without a
+    # preexec_fn, Popen can use vfork, which keeps the start cheap.
+    cpu = str(int(request["cpu_seconds"]))
+    if _mountpoint:
+        args = [*_unshare_args(request.get("network", False)), "/bin/sh", "-c", SANDBOX_SCRIPT, "sandbox",
+                _mountpoint, root, os.path.relpath(cwd, root), cpu, request["cmd"]]
+        env = {**request["env"], "HOME": "/workspace"}
+    else:
+        args = ["/bin/sh", "-c", 'ulimit -t "$1" && exec /bin/sh -c "$2"', "sh", cpu, request["cmd"]]
+        env = {**request["env"], "HOME": root}
+    try:
+        process = subprocess.Popen(
+            args, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True,
+        )
+    except OSError as e:
+        _send({"error": f"Could not start command: {e}"})
+        return
+
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+    selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+    sent = {"stdout": 0, "stderr": 0}
+    timed_out = truncated = False
+    while selector.get_map():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in selector.select(remaining):
+            data = os.read(key.fd, 65536)
+            if not data:
+                selector.unregister(key.fileobj)
+                continue
+            room = request["max_output"] - sent[key.data]
+            if len(data) > room:
+                truncated = True
+                data = data[:max(room, 0)]
+            if data:
+                sent[key.data] += len(data)
+                _send({"stream": key.data, "data": data.decode("utf-8", "replace")})
+    if timed_out:
+        # The whole session, so background children die with the command
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGKILL)
+    try:
+        returncode = process.wait(max(deadline - time.monotonic(), 0) + 1)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGKILL)
+        returncode = process.wait()
+    selector.close()
+    process.stdout.close()
+    process.stderr.close()
+    _send({"exit": returncode, "timed_out": timed_out, "truncated": truncated,
+           "seconds": round(time.monotonic() - started, 3)})
+
+
+def _unshare_args(network: bool) -> list[str]:
+    args = ["unshare", "--user", "--map-root-user", "--mount", "--pid", "--fork"]
+    return args if network else [*args, "--net"]
+
+
+def _start_isolation() -> None:
+    """Creates the worker's mountpoint and checks that a sandbox can be set up here."""
+    global _mountpoint, _isolation_error
+    import tempfile
+    _mountpoint = tempfile.mkdtemp(prefix="executor-root-")
+    atexit.register(os.rmdir, _mountpoint)
+    with tempfile.TemporaryDirectory(prefix="executor-probe-") as probe:
+        try:
+            result = subprocess.run(
+                [*_unshare_args(False), "/bin/sh", "-c", SANDBOX_SCRIPT, "sandbox", _mountpoint, probe, ".", "5", "true"],
+                stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=10,
+            )
+            detail = result.stderr.strip() if result.returncode else None
+        except (OSError, subprocess.TimeoutExpired) as e:
+            detail = str(e)
+    if detail is not None:
+        _isolation_error = (f"Commands cannot be isolated on this system ({detail}). Set EXECUTOR_ISOLATION=none "
+                            "to run them without isolation, on trusted setups only.")
+
+
+def worker_main() -> None:
+    """Runs commands read from stdin until it is closed."""
+    # Ctrl-C in the server's terminal is for the server, not for its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if sys.argv[3] == "namespace":
+        _start_isolation()
+    _limit_resources(int(sys.argv[1]), int(sys.argv[2]))
+    _send({"ready": os.getpid()})
+    for line in sys.stdin:
+        try:
+            _run_request(json.loads(line))
+        except Exception as e:
+            _send({"error": f"{type(e).__name__}: {e}"})
+
+
+# ------------------- SERVER SIDE ------------------- #
+
+class Worker:
+    """One worker process and its pipes."""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(EXECUTOR_MEMORY_MB * 1024 * 1024),
+             str(EXECUTOR_FILE_MB * 1024 * 1024), EXECUTOR_ISOLATION], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, bufsize=1, env={name: os.environ[name] for name in PASSED_ENV if name in os.environ},
+        )
+        self.lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        # A reader thread lets waits on the worker time out
+        threading.Thread(target=self._read, name=f"executor-{self.process.pid}", daemon=True).start()
+
+    def _read(self) -> None:
+        for line in self.process.stdout:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def next_message(self, timeout: float) -> dict:
+        line = self.lines.get(timeout=timeout)
+        if line is None:
+            raise RuntimeError("Executor worker exited")
+        return json.loads(line)
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+    def stop(self) -> None:
+        """Lets the worker exit on its own, so it removes its mountpoint; kills it if it does not."""
+        with contextlib.suppress(OSError):
+            self.process.stdin.close()
+        try:
+            self.process.wait(WORKER_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            self.kill()
+
+
+class ExecutorPool:
+    """Runs shell commands on pre-started worker processes.
+
+    Each command runs in a new session with CPU, memory and file size
+    limits, a wall-clock timeout and only a few environment variables of the
+    server. With EXECUTOR_ISOLATION=namespace (the default) it also runs in
+    its own user, mount, PID and network namespace, in which the file system
+    is the read-only system directories plus the job's project root at
+    /workspace; with "none" it can read and write anything the server's user
+    can. Workers stay alive between
+    commands, so a command costs a fork of a small process rather than of
+    the server. At most ``workers`` commands run at once, and at most
+    ``per_job`` of them for one project root.
+    """
+
+    def __init__(self, workers: int = EXECUTOR_WORKERS, per_job: int = EXECUTOR_JOB_CONCURRENCY):
+        self.size = max(workers, 1)
+        self.per_job = max(per_job, 1)
+        self.idle: "queue.Queue[Worker]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.job_slots: dict[str, list] = {}
+        for _ in range(self.size):
+            self.idle.put(Worker())
+
+    def _job_slot(self, root: str) -> threading.BoundedSemaphore:
+        with self.lock:
+            slot = self.job_slots.get(root)
+            if slot is None:
+                slot = self.job_slots[root] = [threading.BoundedSemaphore(self.per_job), 0]
+            slot[1] += 1
+            return slot[0]
+
+    def _release_job_slot(self, root: str) -> None:
+        with self.lock:
+            slot = self.job_slots[root]
+            slot[1] -= 1
+            if not slot[1]:
+                del self.job_slots[root]
+
+    def _take_worker(self) -> Worker:
+        worker = self.idle.get()
+        if not worker.alive():
+            worker.kill()
+            worker = Worker()
+        return worker
+
+    def run(self, root: str, cmd: str, cwd: Optional[str] = None, timeout: float = 30,
+            on_output: Optional[Callable[[str, str], None]] = None) -> CommandResult:
+        """Runs ``cmd`` with /bin/sh in ``cwd`` (default ``root``) within the resource limits and isolation.
+
+        ``on_output(stream, text)`` is called with output chunks as they
+        arrive. Waits for a free slot of the job and then for a free worker.
+        """
+        root = os.path.realpath(root)
+        timeout = min(max(timeout, 1), EXECUTOR_MAX_TIMEOUT)
+        request = {
+            "cmd": cmd, "root": root, "cwd": cwd or root, "timeout": timeout,
+            "cpu_seconds": EXECUTOR_CPU_SECONDS, "max_output": EXECUTOR_MAX_OUTPUT, "network": EXECUTOR_NETWORK,
+            "env": {name: os.environ[name] for name in PASSED_ENV if name in os.environ},
+        }
+        slot = self._job_slot(root)
+        try:
+            with slot:
+                worker = self._take_worker()
+                try:
+                    return self._run_on(worker, request, on_output)
+                except Exception:
+                    # A worker that broke the protocol or hung is not reused
+                    worker.kill()
+                    worker = Worker()
+                    raise
+                finally:
+                    self.idle.put(worker)
+        finally:
+            self._release_job_slot(root)
+
+    def _run_on(self, worker: Worker, request: dict, on_output) -> CommandResult:
+        worker.process.stdin.write(json.dumps(request) + "\n")
+        worker.process.stdin.flush()
+        deadline = time.monotonic() + request["timeout"] + WORKER_GRACE_SECONDS
+        output = {"stdout": [], "stderr": []}
+        while True:
+            try:
+                message = worker.next_message(max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                raise TimeoutError(f"Executor worker did not finish within {request['timeout']}s") from None
+            if "ready" in message:
+                continue
+            if "error" in message:
+                return CommandResult(-1, "", message["error"])
+            if "stream" in message:
+                output[message["stream"]].append(message["data"])
+                if on_output is not None:
+                    on_output(message["stream"], message["data"])
+                continue
+            return CommandResult(message["exit"], "".join(output["stdout"]), "".join(output["stderr"]),
+                                 message["timed_out"], message["truncated"], message["seconds"])
+
+    def close(self) -> None:
+        while True:
+            try:
+                self.idle.get_nowait().stop()
+            except queue.Empty:
+                return
+
+
+_pool: Optional[ExecutorPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_executor() -> ExecutorPool:
+    """Returns the process-wide pool, starting its workers on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExecutorPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+if __name__ == "__main__":
+    worker_main()
@@ -1,122 +1,428 @@
 # from tarfile import symlink_exception
 
 from dotenv import load_dotenv
-from langchain.globals import set_verbose,set_debug
-from langchain_groq import ChatGroq
 from langgraph.prebuilt import create_react_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
+import asyncio
 import os
-import time
+import pathlib
+import sqlite3
+import uuid
 from agent.states import *
 from agent.prompts import *
 from agent.tools import *
+from agent.scheduler import arun_parallel, build_dependency_graph, ready_batches, run_parallel, run_pipelined
+from agent.jsonstream import iter_array_items
+from agent.ratelimit import QUOTA_RETRIES, ainvoke_with_backoff, invoke_with_backoff, is_quota_error
+from agent.llm import get_llm, message_text, model_name
+from agent.jobs import check_cancelled
+from agent.events import emit
+from agent.cache import acached_structured_call, cached_structured_call
+from agent.context import build_context
+from agent.artifacts import snapshot_run
+from agent.validation import VALIDATION_MAX_REPAIRS, validate_workspace
+from agent.incremental import changed_files, completed_steps, file_hashes
+from agent.metrics import llm_retries, timed_node
+from agent.tracing import trace_callback
+from langgraph.checkpoint.sqlite import SqliteSaver
 from langgraph.constants import END
 from langgraph.graph import StateGraph
 
 
 _ = load_dotenv()
-set_debug(True)
-set_verbose(True)
-last_request_time = 0
-REQUEST_INTERVAL = 6 
+# Per-run traces (agent/tracing.py) are the way to inspect runs; LangChain's
+# global debug output formats every callback of every job on the console
+if os.getenv("LANGCHAIN_DEBUG", "false").lower() in ("1", "true", "yes"):
+    from langchain_core.globals import set_debug
+    set_debug(True)
 
-llm = ChatGroq(model="openai/gpt-oss-120b")
+# Stream the architect's tasks straight into the coders instead of waiting
+# for the whole task plan
+ARCHITECT_PIPELINE = os.getenv("ARCHITECT_PIPELINE", "false").lower() in ("1", "true", "yes")
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",  # or "gemini-1.5-flash" for faster responses
-    google_api_key=os.getenv("GEMINI_API_KEY")
-)
+# Let the coder run shell commands (builds, linters) through the sandboxed executor pool
+CODER_RUN_COMMANDS = os.getenv("CODER_RUN_COMMANDS", "false").lower() in ("1", "true", "yes")
 
-def safe_invoke(func, *args, **kwargs):
-    global last_request_time
-    elapsed = time.time() - last_request_time
-    if elapsed < REQUEST_INTERVAL:
-        time.sleep(REQUEST_INTERVAL - elapsed)
-    result = func(*args, **kwargs)
-    last_request_time = time.time()
-    return result
+# Chat models are created on first use from PLANNER_MODEL / ARCHITECT_MODEL /
+# CODER_MODEL (or LLM_MODEL), e.g. "google:gemini-2.5-flash" or
+# "groq:openai/gpt-oss-120b", so only the configured provider is imported.
 
 def planner_agent(state : dict) -> dict :
+    check_cancelled()
+    user_prompt = state["user_prompt"]
+    previous = state.get("previous")
+    if previous is not None and previous.user_prompt.strip() == user_prompt.strip():
+        # Only files were edited; the plan still stands
+        return { "plan" :previous.plan }
+    prompt = planner_prompt(user_prompt)
+    llm = get_llm("planner")
+    resp = cached_structured_call(
+        Plan, prompt, model_name(llm), PROMPT_VERSION,
+        lambda: invoke_with_backoff(llm.with_structured_output(Plan).invoke, prompt),
+        bypass=state.get("no_cache", False)
+    )
+    if resp is None:
+        raise ValueError("Planner did not return a valid response.")
+    return { "plan" :resp }
+
+async def aplanner_agent(state : dict) -> dict :
+    check_cancelled()
     user_prompt = state["user_prompt"]
-    resp = safe_invoke(
-        llm.with_structured_output(Plan).invoke,
-        planner_prompt(user_prompt)
+    previous = state.get("previous")
+    if previous is not None and previous.user_prompt.strip() == user_prompt.strip():
+        return { "plan" :previous.plan }
+    prompt = planner_prompt(user_prompt)
+    llm = get_llm("planner")
+    resp = await acached_structured_call(
+        Plan, prompt, model_name(llm), PROMPT_VERSION,
+        lambda: ainvoke_with_backoff(llm.with_structured_output(Plan).ainvoke, prompt),
+        bypass=state.get("no_cache", False)
     )
     if resp is None:
         raise ValueError("Planner did not return a valid response.")
     return { "plan" :resp }
 
 def architect_agent(state : dict) -> dict :
+    check_cancelled()
+    previous = state.get("previous")
+    if previous is not None:
+        return incremental_architect_agent(state, previous)
+    if ARCHITECT_PIPELINE:
+        return pipelined_architect_agent(state)
     plan = state["plan"]
-    resp =  safe_invoke(
-        llm.with_structured_output(TaskPlan).invoke,
-        architect_prompt(plan)
-        )
+    resp = plan_tasks(plan, state.get("no_cache", False))
+    return { "task_plan" :resp }
+
+async def aarchitect_agent(state : dict) -> dict :
+    check_cancelled()
+    previous = state.get("previous")
+    if previous is not None:
+        return await aincremental_architect_agent(state, previous)
+    if ARCHITECT_PIPELINE:
+        # The pipelined coders run on threads; keep them off the event loop
+        return await asyncio.to_thread(pipelined_architect_agent, state)
+    plan = state["plan"]
+    resp = await aplan_tasks(plan, state.get("no_cache", False))
+    return { "task_plan" :resp }
+
+def require_steps(task_plan: Optional[TaskPlan]) -> Optional[TaskPlan]:
+    """Refuses a task plan without steps, so it is never cached."""
+    if task_plan is not None and not task_plan.implementation_steps:
+        raise ValueError("Architect returned no implementation steps.")
+    return task_plan
+
+async def arequire_steps(pending) -> Optional[TaskPlan]:
+    return require_steps(await pending)
+
+def plan_tasks(plan: Plan, no_cache: bool = False) -> TaskPlan:
+    prompt = architect_prompt(plan)
+    llm = get_llm("architect")
+    resp = cached_structured_call(
+        TaskPlan, prompt, model_name(llm), PROMPT_VERSION,
+        lambda: require_steps(invoke_with_backoff(llm.with_structured_output(TaskPlan).invoke, prompt)),
+        bypass=no_cache
+    )
     if resp is None:
         raise Exception("Architect did not return a response.")
     resp.plan = plan
-    print(resp.model_dump_json())
-    return { "task_plan" :resp }
+    return resp
 
-def coder_agent(state : dict) -> dict :
-    coder_state = state.get("coder_state")
-    if coder_state is None:
-        coder_state = CoderState(task_plan=state["task_plan"],current_step_idx=0)
+async def aplan_tasks(plan: Plan, no_cache: bool = False) -> TaskPlan:
+    prompt = architect_prompt(plan)
+    llm = get_llm("architect")
+    resp = await acached_structured_call(
+        TaskPlan, prompt, model_name(llm), PROMPT_VERSION,
+        lambda: arequire_steps(ainvoke_with_backoff(llm.with_structured_output(TaskPlan).ainvoke, prompt)),
+        bypass=no_cache
+    )
+    if resp is None:
+        raise Exception("Architect did not return a response.")
+    resp.plan = plan
+    return resp
 
-    steps = coder_state.task_plan.implementation_steps
+def incremental_architect_agent(state : dict, previous: PreviousRun) -> dict :
+    """Plans tasks for an existing project and marks the tasks of unchanged files as done.
 
-    if coder_state.current_step_idx >= len(steps) :
-        return {"coder_state" :coder_state, "status" : "DONE"}
+    The previous task plan is reused when the plan did not change. The
+    pipelined architect is not used here, since the whole task plan is
+    needed to tell what changed.
+    """
+    plan = state["plan"]
+    if plan == previous.plan:
+        resp = previous.task_plan
+    else:
+        resp = plan_tasks(plan, state.get("no_cache", False))
+    return incremental_update(previous, plan, resp)
 
-    current_task = steps[coder_state.current_step_idx]
-    existing_content = read_file.run(current_task.filepath)
+async def aincremental_architect_agent(state : dict, previous: PreviousRun) -> dict :
+    plan = state["plan"]
+    if plan == previous.plan:
+        resp = previous.task_plan
+    else:
+        resp = await aplan_tasks(plan, state.get("no_cache", False))
+    return incremental_update(previous, plan, resp)
+
+def incremental_update(previous: PreviousRun, plan: Plan, resp: TaskPlan) -> dict :
+    changed = changed_files(previous, plan, resp, current_workspace())
+    completed = completed_steps(resp, changed)
+    emit("incremental_plan", changed=sorted(changed), kept_steps=len(completed),
+         steps=len(resp.implementation_steps))
+    coder_state = CoderState(task_plan=resp, completed_steps=completed, current_step_idx=len(completed))
+    return { "task_plan" :resp, "coder_state" :coder_state }
+
+def coder_messages(tasks: list[ImplementationTask]) -> dict:
+    """Builds the ReAct agent input for one or more tasks of the same file."""
+    filepath = tasks[0].filepath
+    workspace = current_workspace()
+    existing_content = workspace.read(filepath)
+    depends_on = [path for task in tasks for path in task.depends_on or ()]
+    context = build_context(workspace, filepath, depends_on)
     system_prompt = coder_system_prompt()
 
+    if len(tasks) == 1:
+        task_text = f"Task : {tasks[0].task_description} \n"
+    else:
+        task_text = "Tasks (implement all of them, in order) :\n" + "".join(
+            f"{number}. {task.task_description}\n" for number, task in enumerate(tasks, start=1)
+        )
+    if existing_content:
+        save_hint = "Use edit_file(path, edits) to change the existing content; only rewrite it with write_file(path, content) if most of it changes"
+    else:
+        save_hint = "Use write_file(path,content) to create the file"
     user_prompt= (
-        f"Task : {current_task.task_description} \n"
-        f"File : {current_task.filepath} \n"
-        f"Existing content : \n {existing_content}\n"
-        "Use write_file(path,content) to save your changes"
+        task_text +
+        f"File : {filepath} \n\n"
+        f"{context}\n\n"
+        f"{save_hint}"
     )
-
-    # resp = llm.invoke(system_prompt + user_prompt)
-
-
-    coder_tools = [read_file,write_file,list_files,get_current_directory]
-    react_agent = create_react_agent(llm,coder_tools)
-    safe_invoke(
-    react_agent.invoke,
-    {
+    return {
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
     }
-)
 
-    coder_state.current_step_idx += 1
+def coder_react_agent():
+    coder_tools = [read_file,write_file,edit_file,list_files,get_current_directory]
+    if CODER_RUN_COMMANDS:
+        coder_tools.append(run_cmd)
+    return create_react_agent(get_llm("coder"),coder_tools)
+
+def run_coder_batch(step_indices: list[int], tasks: list[ImplementationTask]) -> None:
+    """Implements one or more tasks of the same file in a single coder call."""
+    check_cancelled()
+    filepath = tasks[0].filepath
+    for step_idx in step_indices:
+        emit("step_started", index=step_idx, filepath=filepath)
+    # Not retried as a whole: that would repeat the tool calls already made.
+    # Each model call inside the loop waits on the rate limiter.
+    coder_react_agent().invoke(coder_messages(tasks))
+    for step_idx in step_indices:
+        emit("step_finished", index=step_idx, filepath=filepath)
+
+async def arun_coder_batch(step_indices: list[int], tasks: list[ImplementationTask]) -> None:
+    check_cancelled()
+    filepath = tasks[0].filepath
+    for step_idx in step_indices:
+        emit("step_started", index=step_idx, filepath=filepath)
+    await coder_react_agent().ainvoke(coder_messages(tasks))
+    for step_idx in step_indices:
+        emit("step_finished", index=step_idx, filepath=filepath)
+
+def stream_tasks(llm, prompt: str):
+    """Yields the architect's tasks one by one while its JSON answer is still streaming."""
+    for attempt in range(QUOTA_RETRIES + 1):
+        received = 0
+        try:
+            chunks = (message_text(chunk.content) for chunk in llm.stream(prompt))
+            for item in iter_array_items(chunks, "implementation_steps"):
+                check_cancelled()
+                task = ImplementationTask.model_validate(item)
+                emit("task_planned", index=received, filepath=task.filepath)
+                received += 1
+                yield task
+            return
+        except Exception as e:
+            # Once tasks have been handed out the stream cannot be replayed
+            if received or attempt == QUOTA_RETRIES or not is_quota_error(e):
+                raise
+            llm_retries.inc()
+
+def pipelined_architect_agent(state : dict) -> dict :
+    """Architect and coder in one node: each task is coded as soon as it has been planned."""
+    plan = state["plan"]
+    prompt = architect_prompt(plan) + architect_json_format()
+    llm = get_llm("architect")
+    completed = set()
+
+    def plan_and_code() -> TaskPlan:
+        steps, done = run_pipelined(stream_tasks(llm, prompt), run_coder_batch)
+        completed.update(done)
+        current_workspace().flush()
+        return require_steps(TaskPlan(implementation_steps=steps))
+
+    # A cached task plan has nothing to overlap with; the coder node runs it
+    resp = cached_structured_call(
+        TaskPlan, prompt, model_name(llm), PROMPT_VERSION, plan_and_code,
+        bypass=state.get("no_cache", False)
+    )
+    resp.plan = plan
+    if not completed:
+        return { "task_plan" :resp }
+    coder_state = CoderState(task_plan=resp, completed_steps=sorted(completed), current_step_idx=len(completed))
+    return { "task_plan" :resp, "coder_state" :coder_state }
+
+def coder_wave(state : dict):
+    """Returns the coder state, its steps, the completed steps and the batches that are ready to run."""
+    coder_state = state.get("coder_state")
+    if coder_state is None:
+        coder_state = CoderState(task_plan=state["task_plan"],current_step_idx=0)
+
+    steps = coder_state.task_plan.implementation_steps
+    completed = set(coder_state.completed_steps) or set(range(coder_state.current_step_idx))
+    if len(completed) >= len(steps) :
+        return coder_state, steps, completed, []
+
+    # Run every task whose dependencies are done, in parallel, then loop back
+    # to pick up the tasks they unblocked. Ready tasks of the same file share
+    # one coder call.
+    dependencies = build_dependency_graph(steps)
+    return coder_state, steps, completed, ready_batches(steps, dependencies, completed)
+
+def finish_wave(coder_state: CoderState, completed: set[int], batches: list[list[int]]) -> dict :
+    ready = [idx for batch in batches for idx in batch]
+    coder_state.completed_steps = sorted(completed | set(ready))
+    coder_state.current_step_idx = len(coder_state.completed_steps)
     return {"coder_state" :coder_state}
 
-graph = StateGraph(dict)
+def persist_wave(coder_state: CoderState) -> None:
+    """Writes the files of a finished coder step to disk and snapshots them."""
+    # Files are written in memory by the tools; persist them at step boundaries
+    workspace = current_workspace()
+    workspace.flush()
+    snapshot_run(workspace, f"coder {len(coder_state.completed_steps)}/{len(coder_state.task_plan.implementation_steps)}")
 
+def coder_agent(state : dict) -> dict :
+    check_cancelled()
+    coder_state, steps, completed, batches = coder_wave(state)
+    if not batches:
+        return {"coder_state" :coder_state, "status" : "DONE"}
+    run_parallel(lambda batch: run_coder_batch(batch, [steps[idx] for idx in batch]), batches)
+    update = finish_wave(coder_state, completed, batches)
+    persist_wave(coder_state)
+    return update
+
+async def acoder_agent(state : dict) -> dict :
+    check_cancelled()
+    coder_state, steps, completed, batches = coder_wave(state)
+    if not batches:
+        return {"coder_state" :coder_state, "status" : "DONE"}
+    await arun_parallel(lambda batch: arun_coder_batch(batch, [steps[idx] for idx in batch]), batches)
+    update = finish_wave(coder_state, completed, batches)
+    await asyncio.to_thread(persist_wave, coder_state)
+    return update
 
-graph.add_node("planner",planner_agent)
-graph.add_node("architect",architect_agent)
-graph.add_node("coder",coder_agent)
+def validator_agent(state : dict) -> dict :
+    """Checks the generated files locally and sends only the broken ones back to the coder."""
+    check_cancelled()
+    workspace = current_workspace()
+    workspace.flush()
+    problems = validate_workspace(workspace)
+    rounds = state.get("repair_rounds", 0)
+    for path, file_problems in problems.items():
+        emit("validation_failed", path=path, problems=file_problems)
+    if not problems or rounds >= VALIDATION_MAX_REPAIRS:
+        if problems:
+            print(f"Validation still fails for {', '.join(problems)} after {rounds} repair rounds")
+        snapshot_run(workspace, "final")
+        # Later incremental runs compare against these to find hand-edited files
+        return {"validation": problems, "file_hashes": file_hashes(workspace), "status": "DONE"}
+
+    # Each repair is a new step of the task plan, so the coder picks it up like
+    # any other pending task; depending on its own file keeps the diagnostics
+    # (which name other files) from serializing the repairs.
+    coder_state = state["coder_state"]
+    repairs = [
+        ImplementationTask(filepath=path, task_description=repair_task(path, file_problems), depends_on=[path])
+        for path, file_problems in problems.items()
+    ]
+    task_plan = coder_state.task_plan.model_copy(
+        update={"implementation_steps": coder_state.task_plan.implementation_steps + repairs}
+    )
+    coder_state = coder_state.model_copy(update={"task_plan": task_plan})
+    return {"coder_state": coder_state, "validation": problems, "repair_rounds": rounds + 1, "status": "REPAIRING"}
+
+async def avalidator_agent(state : dict) -> dict :
+    # The checks are local CPU and disk work
+    return await asyncio.to_thread(validator_agent, state)
+
+graph = StateGraph(AgentState)
+
+
+# Every node has a sync and an async implementation: invoke/stream use the
+# former, ainvoke/astream (the async job runner) the latter.
+graph.add_node("planner",timed_node("planner",planner_agent,aplanner_agent))
+graph.add_node("architect",timed_node("architect",architect_agent,aarchitect_agent))
+graph.add_node("coder",timed_node("coder",coder_agent,acoder_agent))
+graph.add_node("validator",timed_node("validator",validator_agent,avalidator_agent))
 
 graph.add_edge("planner","architect")
 graph.add_edge("architect","coder")
 graph.add_conditional_edges(
     "coder",
+    lambda s: "validator" if s.get("status") == "DONE" else "coder",
+    {"validator" : "validator","coder" : "coder"}
+)
+graph.add_conditional_edges(
+    "validator",
     lambda s: "END" if s.get("status") == "DONE" else "coder",
     {"END" : END,"coder" : "coder"}
 )
 
 graph.set_entry_point("planner")
 
-agent = graph.compile()
+# State is checkpointed after every node (including each coder wave), so a
+# failed or interrupted run can resume from its last completed node.
+CHECKPOINT_PATH = pathlib.Path(os.getenv("CHECKPOINT_PATH", pathlib.Path(__file__).parent / ".state" / "checkpoints.sqlite3"))
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """SqliteSaver that also works for ainvoke/astream by running its sync methods on worker threads.
+
+    One checkpointer (and one connection, which SqliteSaver guards with a
+    lock) then serves sync and async runs alike.
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+def make_checkpointer() -> SqliteSaver:
+    CHECKPOINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    return ThreadedSqliteSaver(sqlite3.connect(CHECKPOINT_PATH, check_same_thread=False))
+
+checkpointer = make_checkpointer()
+agent = graph.compile(checkpointer=checkpointer)
+
+def run_config(thread_id: str = None, recursion_limit: int = 100) -> dict:
+    """Builds the invoke/stream config; thread_id names the run's checkpoint thread and its trace."""
+    config = {"recursion_limit": recursion_limit, "configurable": {"thread_id": thread_id or str(uuid.uuid4())}}
+    if trace_callback is not None:
+        config["callbacks"] = [trace_callback]
+    return config
 
 if __name__ == "__main__":
     result = agent.invoke({"user_prompt": "Build a colourful modern todo app in html css and js"},
-                          {"recursion_limit": 100})
+                          run_config())
     print("Final State:", result)
\ No newline at end of file
@@ -0,0 +1,83 @@
+from typing import Optional
+
+from agent.scheduler import build_dependency_graph, normalize_path
+from agent.states import Plan, PreviousRun, TaskPlan
+
+
+def file_hashes(workspace) -> dict[str, str]:
+    """Content hashes of every file in the workspace, recorded when a run finishes."""
+    hashes = {}
+    for path in workspace.paths():
+        try:
+            hashes[path] = workspace.content_hash(path)
+        except UnicodeDecodeError:
+            continue
+    return hashes
+
+
+def previous_run(values: dict) -> Optional[PreviousRun]:
+    """Builds the PreviousRun of a finished run from its final graph state, or None if it has no plan."""
+    if not values.get("plan") or not values.get("task_plan"):
+        return None
+    return PreviousRun(
+        user_prompt=values.get("user_prompt", ""),
+        plan=values["plan"],
+        task_plan=values["task_plan"],
+        file_hashes=values.get("file_hashes") or {},
+    )
+
+
+def edited_files(workspace, hashes: dict[str, str]) -> set[str]:
+    """Files changed or deleted since the hashes were recorded, e.g. through the file API."""
+    edited = set()
+    for path, digest in hashes.items():
+        try:
+            if workspace.content_hash(path) != digest:
+                edited.add(path)
+        except UnicodeDecodeError:
+            continue
+    return edited
+
+
+def _file_specs(plan: Plan, task_plan: TaskPlan) -> dict[str, tuple]:
+    """Maps each file to what decides whether it must be regenerated: its purpose and dependencies."""
+    purposes = {normalize_path(file.path): file.purpose.strip() for file in plan.files}
+    depends_on: dict[str, set[str]] = {}
+    for step in task_plan.implementation_steps:
+        path = normalize_path(step.filepath)
+        depends_on.setdefault(path, set()).update(normalize_path(dep) for dep in step.depends_on or ())
+    return {path: (purposes.get(path), frozenset(deps)) for path, deps in depends_on.items()}
+
+
+def changed_files(previous: PreviousRun, plan: Plan, task_plan: TaskPlan, workspace) -> set[str]:
+    """Returns the files whose tasks have to run again.
+
+    A file is regenerated when it is new, missing from the workspace, or its
+    purpose or dependencies differ from the previous run, and so is every file
+    that depends on a regenerated or hand-edited file. Hand-edited files
+    themselves are kept as they are unless their own spec changed.
+    """
+    old = _file_specs(previous.plan, previous.task_plan)
+    new = _file_specs(plan, task_plan)
+    changed = {path for path, spec in new.items() if old.get(path) != spec or not workspace.exists(path)}
+    edited = edited_files(workspace, previous.file_hashes)
+
+    steps = task_plan.implementation_steps
+    paths = [normalize_path(step.filepath) for step in steps]
+    graph = build_dependency_graph(steps)
+    # Dependencies only point at earlier steps, but a file's tasks can depend on
+    # files whose tasks come later, so repeat until nothing new is marked
+    while True:
+        marked = {
+            paths[idx] for idx, deps in graph.items()
+            if paths[idx] not in changed and any(paths[dep] != paths[idx] and paths[dep] in changed | edited for dep in deps)
+        }
+        if not marked:
+            return changed
+        changed |= marked
+
+
+def completed_steps(task_plan: TaskPlan, changed: set[str]) -> list[int]:
+    """Indices of the tasks whose files are kept from the previous run."""
+    return [idx for idx, step in enumerate(task_plan.implementation_steps)
+            if normalize_path(step.filepath) not in changed]
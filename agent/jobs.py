@@ -0,0 +1,186 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from agent.metrics import job_queue_wait
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# "thread" runs each job on a worker thread; "async" runs coroutine jobs on one event loop
+JOB_RUNNER = os.getenv("JOB_RUNNER", "thread")
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "10"))
+
+# Cancellation flag of the job running in the current thread/context
+_cancel_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("cancel_event", default=None)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled."""
+
+
+def check_cancelled() -> None:
+    """Stops the current job at a safe point if it has been cancelled."""
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise JobCancelled("Job was cancelled")
+
+
+class Job:
+    def __init__(self, job_id: str, func: Callable, args: tuple):
+        self.id = job_id
+        self.func = func
+        self.args = args
+        self.status = "queued"
+        self.cancel_event = threading.Event()
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+
+class JobManager:
+    """Runs jobs on a fixed pool of worker threads behind a bounded FIFO queue.
+
+    ``submit`` refuses new work with QueueFullError once ``max_queue`` jobs are
+    waiting, so callers can answer 429 instead of spawning unbounded threads.
+    Queued jobs can be cancelled outright; running jobs are asked to stop and
+    do so the next time they call ``check_cancelled``.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending: deque[Job] = deque()
+        self.jobs: dict[str, Job] = {}
+        self.condition = threading.Condition()
+        self.workers: list[threading.Thread] = []
+        self.active = 0
+
+    def _ensure_workers(self) -> None:
+        while len(self.workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, daemon=True, name=f"job-worker-{len(self.workers)}")
+            worker.start()
+            self.workers.append(worker)
+
+    def _position(self, idx: int) -> int:
+        # Jobs that fit on an idle worker start right away (position 0); the
+        # rest are numbered from 1 in the order they will start.
+        return max(0, self.active + idx + 1 - self.max_workers)
+
+    def submit(self, job_id: str, func: Callable, *args) -> int:
+        """Queues ``func(*args)`` and returns its queue position (0 means it starts right away)."""
+        with self.condition:
+            if self._position(len(self.pending)) > self.max_queue:
+                raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+            job = Job(job_id, func, args)
+            self.jobs[job_id] = job
+            self.pending.append(job)
+            self._ensure_workers()
+            self.condition.notify()
+            return self._position(len(self.pending) - 1)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Returns the queue position of a waiting job, or None if it is not queued."""
+        with self.condition:
+            for idx, job in enumerate(self.pending):
+                if job.id == job_id:
+                    return self._position(idx)
+        return None
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels a queued or running job. Returns False if the job is unknown or finished."""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return False
+            job.cancel_event.set()
+            if job.status == "queued":
+                self.pending.remove(job)
+                job.status = "cancelled"
+                job.finished_at = time.time()
+                self.jobs.pop(job_id, None)
+            return True
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": len(self.pending),
+                "running": self.active,
+            }
+
+    def _work(self) -> None:
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                job = self.pending.popleft()
+                self.active += 1
+                job.status = "running"
+                job.started_at = time.time()
+            job_queue_wait.observe(job.started_at - job.submitted_at)
+
+            token = _cancel_event.set(job.cancel_event)
+            try:
+                job.func(*job.args)
+                job.status = "cancelled" if job.cancel_event.is_set() else "completed"
+            except Exception:
+                job.status = "error"
+            finally:
+                _cancel_event.reset(token)
+                job.finished_at = time.time()
+                with self.condition:
+                    self.active -= 1
+                    self.jobs.pop(job.id, None)
+
+
+class AsyncJobManager(JobManager):
+    """Runs coroutine jobs as tasks on one event loop thread instead of one thread per job.
+
+    Same queue, positions and cancellation as JobManager; ``max_workers`` is
+    the number of jobs running at once, which can be far higher than with
+    threads since a waiting job only costs a suspended task.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE):
+        super().__init__(max_workers, max_queue)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_workers(self) -> None:
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, daemon=True, name="job-loop").start()
+        self.loop.call_soon_threadsafe(self._dispatch)
+
+    def _dispatch(self) -> None:
+        """Starts queued jobs while there is room; runs on the loop."""
+        with self.condition:
+            while self.pending and self.active < self.max_workers:
+                job = self.pending.popleft()
+                self.active += 1
+                job.status = "running"
+                job.started_at = time.time()
+                self.loop.create_task(self._run(job))
+
+    async def _run(self, job: Job) -> None:
+        job_queue_wait.observe(job.started_at - job.submitted_at)
+        # Each task has its own context, so this only marks this job
+        _cancel_event.set(job.cancel_event)
+        try:
+            await job.func(*job.args)
+            job.status = "cancelled" if job.cancel_event.is_set() else "completed"
+        except Exception:
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+            with self.condition:
+                self.active -= 1
+                self.jobs.pop(job.id, None)
+            self._dispatch()
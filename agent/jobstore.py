@@ -0,0 +1,134 @@
+import contextlib
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+JOB_STORE_PATH = pathlib.Path(os.getenv("JOB_STORE_PATH", pathlib.Path(__file__).parent / ".state" / "jobs.sqlite3"))
+JOB_STORE_TTL_SECONDS = int(os.getenv("JOB_STORE_TTL_SECONDS", str(7 * 24 * 3600)))
+JOB_STORE_MAX_ENTRIES = int(os.getenv("JOB_STORE_MAX_ENTRIES", "1000"))
+# Jobs kept in memory in front of SQLite
+JOB_STORE_CACHE_SIZE = int(os.getenv("JOB_STORE_CACHE_SIZE", "256"))
+
+ACTIVE_STATUSES = ("queued", "processing")
+FIELDS = ("status", "message", "result", "error", "prompt", "no_cache", "base_request_id")
+
+
+class JobStore:
+    """Job status records with an in-memory LRU in front of SQLite.
+
+    Records of finished jobs expire after ``ttl`` seconds and only the newest
+    ``max_entries`` of them are kept; ``on_evict`` is called with the ids of
+    removed jobs so their checkpoints, event logs and so on can be dropped as
+    well.
+    """
+
+    def __init__(self, path: pathlib.Path = JOB_STORE_PATH, ttl: int = JOB_STORE_TTL_SECONDS,
+                 max_entries: int = JOB_STORE_MAX_ENTRIES, cache_size: int = JOB_STORE_CACHE_SIZE,
+                 on_evict: Optional[Callable[[list[str]], None]] = None):
+        self.path = pathlib.Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_size = cache_size
+        self.on_evict = on_evict
+        self.lock = threading.RLock()
+        self.cache: "OrderedDict[str, dict]" = OrderedDict()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " request_id TEXT PRIMARY KEY, data TEXT NOT NULL,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, request_id: str, record: dict) -> None:
+        self.cache[request_id] = record
+        self.cache.move_to_end(request_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[dict]:
+        """Returns a copy of the job's record, or None if it is unknown or expired."""
+        with self.lock:
+            record = self.cache.get(request_id)
+            if record is None:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT data, updated_at FROM jobs WHERE request_id = ?", (request_id,)).fetchone()
+                if row is None:
+                    return None
+                record = json.loads(row[0])
+                record["updated_at"] = row[1]
+            if time.time() - record["updated_at"] > self.ttl and record.get("status") not in ACTIVE_STATUSES:
+                return None
+            self._remember(request_id, record)
+            return dict(record)
+
+    def update(self, request_id: str, **fields) -> dict:
+        """Creates or updates a job record and returns a copy of it."""
+        now = time.time()
+        with self.lock:
+            record = self.get(request_id) or {
+                "status": "processing", "message": "", "result": None, "error": None,
+                "prompt": None, "no_cache": False, "created_at": now,
+            }
+            record.update({key: value for key, value in fields.items() if key in FIELDS})
+            record["updated_at"] = now
+            data = {key: record.get(key) for key in FIELDS + ("created_at",)}
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO jobs (request_id, data, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (request_id, json.dumps(data), record["created_at"], now),
+                )
+            self._remember(request_id, record)
+            return dict(record)
+
+    def delete(self, request_id: str) -> None:
+        with self.lock:
+            self.cache.pop(request_id, None)
+            with self._connect() as conn:
+                conn.execute("DELETE FROM jobs WHERE request_id = ?", (request_id,))
+
+    def evict(self) -> list[str]:
+        """Removes expired jobs and jobs beyond ``max_entries``; returns their ids.
+
+        Queued and running jobs are never removed, however old they are.
+        """
+        with self.lock:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT request_id FROM (SELECT request_id FROM jobs WHERE updated_at < ?"
+                    " UNION SELECT request_id FROM (SELECT request_id FROM jobs ORDER BY updated_at DESC LIMIT -1 OFFSET ?))"
+                    " WHERE request_id NOT IN (SELECT request_id FROM jobs WHERE json_extract(data, '$.status') IN (?, ?))",
+                    (time.time() - self.ttl, self.max_entries, *ACTIVE_STATUSES),
+                ).fetchall()
+                evicted = [row[0] for row in rows]
+                conn.executemany("DELETE FROM jobs WHERE request_id = ?", [(request_id,) for request_id in evicted])
+            for request_id in evicted:
+                self.cache.pop(request_id, None)
+        if evicted and self.on_evict:
+            self.on_evict(evicted)
+        return evicted
+
+    def mark_interrupted(self) -> list[str]:
+        """Marks jobs left queued/processing by a previous process as interrupted."""
+        with self.lock:
+            with self._connect() as conn:
+                rows = conn.execute("SELECT request_id, data FROM jobs").fetchall()
+            interrupted = [request_id for request_id, data in rows if json.loads(data).get("status") in ACTIVE_STATUSES]
+        for request_id in interrupted:
+            self.update(request_id, status="interrupted", message="Server restarted before the job finished")
+        return interrupted
@@ -0,0 +1,85 @@
+import json
+from typing import Iterable, Iterator
+
+
+class ArrayItemParser:
+    """Incrementally extracts the objects of one JSON array from streamed text.
+
+    Feed it chunks of a JSON document as they arrive; every object of the
+    array under ``key`` is returned as soon as its closing brace has been
+    seen, long before the document is complete. Text around the JSON (such
+    as markdown fences) is ignored.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.buffer = ""
+        self.pos = 0
+        self.state = "seek"
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = -1
+
+    def feed(self, text: str) -> list[dict]:
+        self.buffer += text
+        items = []
+        if self.state == "seek":
+            token = f'"{self.key}"'
+            marker = self.buffer.find(token, self.pos)
+            if marker < 0:
+                # The key may still be cut off at the end of the buffer
+                self.pos = max(0, len(self.buffer) - len(token))
+                return items
+            bracket = self.buffer.find("[", marker)
+            if bracket < 0:
+                self.pos = marker
+                return items
+            self.state = "array"
+            self.pos = bracket + 1
+
+        while self.state == "array" and self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0:
+                    # The array itself is closed
+                    self.state = "done"
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        items.append(json.loads(self.buffer[self.item_start:self.pos + 1]))
+            self.pos += 1
+        return items
+
+    @property
+    def done(self) -> bool:
+        return self.state == "done"
+
+
+def iter_array_items(chunks: Iterable[str], key: str) -> Iterator[dict]:
+    """Yields the objects of the array under ``key`` while ``chunks`` are still arriving.
+
+    Raises ValueError when the chunks end before the array is closed, e.g. a
+    truncated answer or one that is not JSON at all.
+    """
+    parser = ArrayItemParser(key)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
+    if parser.state == "seek":
+        raise ValueError(f"Streamed answer has no {key!r} array")
+    raise ValueError(f"Streamed answer ended before the {key!r} array was complete")
@@ -0,0 +1,117 @@
+import importlib
+import os
+import threading
+from typing import Callable
+
+from langchain_core.language_models import BaseChatModel
+
+from agent.metrics import LLMMetricsCallback
+from agent.ratelimit import get_rate_limiter
+
+# Model used by every role without a <ROLE>_MODEL setting, unless LLM_MODEL overrides it
+DEFAULT_MODEL = "google:gemini-2.5-flash"
+ROLES = ("planner", "architect", "coder")
+
+
+def _google(model: str, **kwargs) -> BaseChatModel:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model, google_api_key=os.getenv("GEMINI_API_KEY"), **kwargs)
+
+
+def _groq(model: str, **kwargs) -> BaseChatModel:
+    from langchain_groq import ChatGroq
+    return ChatGroq(model=model, **kwargs)
+
+
+# Provider name -> factory(model, **kwargs). Factories import their client
+# library on first use, so only the providers actually configured are loaded.
+_providers: dict[str, Callable[..., BaseChatModel]] = {
+    "google": _google,
+    "groq": _groq,
+}
+_clients: dict[tuple[str, str], BaseChatModel] = {}
+_routers: dict[tuple, object] = {}
+_lock = threading.Lock()
+
+
+def register_provider(name: str, factory: Callable[..., BaseChatModel]) -> None:
+    """Adds a provider; ``factory(model, **kwargs)`` must return a chat model."""
+    _providers[name] = factory
+
+
+def _load_provider(name: str) -> Callable[..., BaseChatModel]:
+    if name not in _providers and "." in name:
+        # "package.module:model" registers a provider from an importable module
+        # that calls register_provider when imported
+        importlib.import_module(name)
+    if name not in _providers:
+        raise ValueError(f"Unknown LLM provider {name!r}; known providers: {', '.join(sorted(_providers))}")
+    return _providers[name]
+
+
+def parse_model_spec(spec: str) -> tuple[str, str]:
+    """Splits "provider:model"; a bare model name uses the default provider."""
+    provider, sep, model = spec.strip().partition(":")
+    if not sep:
+        provider, model = (os.getenv("LLM_MODEL") or DEFAULT_MODEL).partition(":")[0], provider
+    if not model:
+        raise ValueError(f"Invalid model spec {spec!r}; expected provider:model")
+    return provider, model
+
+
+def model_spec(role: str) -> str:
+    """Returns the configured "provider:model" for a role (PLANNER_MODEL, CODER_MODEL, ...).
+
+    Read on every call, so settings loaded from .env after import still apply.
+    """
+    return os.getenv(f"{role.upper()}_MODEL") or os.getenv("LLM_MODEL") or DEFAULT_MODEL
+
+
+def get_chat_model(spec: str) -> BaseChatModel:
+    """Returns the shared client for "provider:model", creating it on first use.
+
+    Every client waits on the rate limiter of its provider and model and
+    reports its calls to the metrics.
+    """
+    key = parse_model_spec(spec)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            provider, model = key
+            limiter = get_rate_limiter(provider, model)
+            callbacks = [limiter.callback, LLMMetricsCallback(provider, model)]
+            client = _load_provider(provider)(model, rate_limiter=limiter, callbacks=callbacks)
+            _clients[key] = client
+        return client
+
+
+def get_llm(role: str):
+    """Returns the chat model configured for an agent role.
+
+    A comma-separated list of models (e.g. CODER_MODEL=groq:openai/gpt-oss-120b,google:gemini-2.5-flash)
+    gives a ModelRouter that picks, hedges and fails over between them.
+    """
+    specs = [spec.strip() for spec in model_spec(role).split(",") if spec.strip()]
+    if len(specs) == 1:
+        return get_chat_model(specs[0])
+    key = (role, tuple(specs))
+    with _lock:
+        router = _routers.get(key)
+    if router is None:
+        from agent.routing import ModelRouter
+        limiters = [get_rate_limiter(*parse_model_spec(spec)) for spec in specs]
+        router = ModelRouter(specs, [get_chat_model(spec) for spec in specs], limiters, role)
+        with _lock:
+            router = _routers.setdefault(key, router)
+    return router
+
+
+def message_text(content) -> str:
+    """Returns the text of a message or chunk content, which may be a list of parts."""
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content or [])
+
+
+def model_name(model) -> str:
+    return getattr(model, "model", None) or getattr(model, "model_name", "") or type(model).__name__
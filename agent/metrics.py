@@ -0,0 +1,289 @@
+import contextlib
+import math
+import threading
+import time
+from typing import Any, Callable, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableLambda
+
+# Buckets in seconds, from fast tool calls up to multi-minute coder steps
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A named metric with optional labels, rendered in the Prometheus text format."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values: dict[tuple, Any] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                    for key, value in sorted(self.values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down; ``set_function`` makes it computed at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+    def samples(self) -> list[str]:
+        if self.function is not None:
+            return [f"{self.name} {_format_value(self.function())}"]
+        return super().samples()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key) or ([0] * len(self.buckets), 0.0)
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[idx] += 1
+                    break
+            self.values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes how long the block took, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+_registry: list[Metric] = []
+
+
+def render() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in list(_registry)) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+node_duration = Histogram("generator_node_duration_seconds", "Time spent in each graph node run.", ("node",))
+node_errors = Counter("generator_node_errors_total", "Graph node runs that raised.", ("node",))
+llm_duration = Histogram("generator_llm_request_duration_seconds", "Chat model call latency.", ("provider", "model"))
+llm_requests = Counter("generator_llm_requests_total", "Chat model calls by outcome.", ("provider", "model", "outcome"))
+llm_tokens = Histogram("generator_llm_tokens", "Tokens per chat model call.", ("provider", "model", "direction"),
+                       buckets=TOKEN_BUCKETS)
+llm_retries = Counter("generator_llm_retries_total", "Calls retried after a quota error.")
+rate_limit_wait = Histogram("generator_rate_limit_wait_seconds", "Time a call waited for the rate limiter.",
+                            ("provider", "model"))
+tool_duration = Histogram("generator_tool_duration_seconds", "Agent tool call latency.", ("tool",))
+tool_calls = Counter("generator_tool_calls_total", "Agent tool calls by outcome.", ("tool", "outcome"))
+router_calls = Counter("generator_router_calls_total", "Routed calls by the model that answered.", ("role", "model"))
+router_hedges = Counter("generator_router_hedges_total", "Hedged requests sent to a second model.", ("role",))
+router_failovers = Counter("generator_router_failovers_total", "Routed calls moved on after a quota error.",
+                           ("role", "model"))
+job_queue_wait = Histogram("generator_job_queue_wait_seconds", "Time jobs spent queued before a worker picked them up.")
+job_duration = Histogram("generator_job_duration_seconds", "Generation job run time by final status.", ("status",))
+jobs_queued = Gauge("generator_jobs_queued", "Jobs waiting for a worker.")
+jobs_running = Gauge("generator_jobs_running", "Jobs currently running.")
+
+
+def timed_node(name: str, func: Callable, afunc: Optional[Callable] = None):
+    """Wraps a graph node so its run time and failures are recorded.
+
+    With ``afunc`` the node also gets an async implementation, which the
+    graph uses when it runs through ``ainvoke``/``astream``.
+    """
+    def node(state):
+        with node_duration.time(node=name):
+            try:
+                return func(state)
+            except Exception:
+                node_errors.inc(node=name)
+                raise
+    node.__name__ = getattr(func, "__name__", name)
+    node.__doc__ = func.__doc__
+    if afunc is None:
+        return node
+
+    async def anode(state):
+        with node_duration.time(node=name):
+            try:
+                return await afunc(state)
+            except Exception:
+                node_errors.inc(node=name)
+                raise
+    return RunnableLambda(node, afunc=anode, name=name)
+
+
+def _token_usage(response: LLMResult) -> tuple[int, int]:
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                input_tokens += metadata.get("input_tokens", 0)
+                output_tokens += metadata.get("output_tokens", 0)
+    if not (input_tokens or output_tokens):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        input_tokens = usage.get("prompt_tokens", 0)
+        output_tokens = usage.get("completion_tokens", 0)
+    return input_tokens, output_tokens
+
+
+class _Timings:
+    """Start times of in-flight runs, keyed by run id."""
+
+    def __init__(self):
+        self.started: dict[UUID, float] = {}
+        self.lock = threading.Lock()
+
+    def start(self, run_id: UUID) -> None:
+        with self.lock:
+            self.started[run_id] = time.perf_counter()
+
+    def stop(self, run_id: UUID) -> Optional[float]:
+        with self.lock:
+            started = self.started.pop(run_id, None)
+        return None if started is None else time.perf_counter() - started
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Records latency, outcome and token counts of one provider/model's calls."""
+
+    def __init__(self, provider: str, model: str):
+        self.labels = {"provider": provider, "model": model}
+        self.timings = _Timings()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self.timings.start(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self.timings.start(run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        elapsed = self.timings.stop(run_id)
+        if elapsed is not None:
+            llm_duration.observe(elapsed, **self.labels)
+        llm_requests.inc(outcome="ok", **self.labels)
+        input_tokens, output_tokens = _token_usage(response)
+        llm_tokens.observe(input_tokens, direction="input", **self.labels)
+        llm_tokens.observe(output_tokens, direction="output", **self.labels)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        from agent.ratelimit import is_quota_error
+        elapsed = self.timings.stop(run_id)
+        if elapsed is not None:
+            llm_duration.observe(elapsed, **self.labels)
+        llm_requests.inc(outcome="quota" if is_quota_error(error) else "error", **self.labels)
+
+
+class ToolMetricsCallback(BaseCallbackHandler):
+    """Records call counts and latency of the agent tools it is attached to."""
+
+    def __init__(self):
+        self.timings = _Timings()
+        self.names: dict[UUID, str] = {}
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs: Any) -> None:
+        self.names[run_id] = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        self.timings.start(run_id)
+
+    def _finish(self, run_id: UUID, outcome: str) -> None:
+        name = self.names.pop(run_id, "unknown")
+        elapsed = self.timings.stop(run_id)
+        if elapsed is not None:
+            tool_duration.observe(elapsed, tool=name)
+        tool_calls.inc(tool=name, outcome=outcome)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "error")
+
+
+tool_callback = ToolMetricsCallback()
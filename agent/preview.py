@@ -0,0 +1,211 @@
+import hashlib
+import mimetypes
+import os
+import pathlib
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from agent.bundle import compress, etag_matches
+from agent.workspace import Workspace
+
+# Bytes of file content (all encodings together) kept in memory for previews
+PREVIEW_CACHE_BYTES = int(os.getenv("PREVIEW_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Smaller bodies are not worth compressing
+MIN_COMPRESS_SIZE = 512
+COMPRESSIBLE_TYPES = ("application/javascript", "application/json", "application/xml", "image/svg+xml")
+
+# Injected into HTML pages of a running job; reloads the page shortly after
+# the coder writes a file and stops listening once the job has finished.
+LIVE_RELOAD_SCRIPT = """<script>
+(function () {
+  var source = new EventSource("%s?last_event_id=latest"), timer = null;
+  function reload() { clearTimeout(timer); timer = setTimeout(function () { location.reload(); }, 300); }
+  source.addEventListener("file_written", reload);
+  source.addEventListener("file_deleted", reload);
+  source.addEventListener("status", function (e) {
+    var status = JSON.parse(e.data).status;
+    if (["completed", "error", "cancelled", "interrupted"].indexOf(status) >= 0) { source.close(); }
+  });
+  source.onerror = function () { source.close(); };
+})();
+</script>"""
+
+
+def is_compressible(mimetype: str) -> bool:
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES
+
+
+def inject_live_reload(body: bytes, events_url: str) -> bytes:
+    script = (LIVE_RELOAD_SCRIPT % events_url).encode("utf-8")
+    idx = body.lower().rfind(b"</body>")
+    return body[:idx] + script + body[idx:] if idx >= 0 else body + script
+
+
+class PreviewFile:
+    """One version of a file, with its compressed variants made on first use."""
+
+    def __init__(self, body: bytes, mimetype: str, digest: str, last_modified: float):
+        self.mimetype = mimetype
+        self.etag = f'"{digest[:32]}"'
+        self.last_modified = int(last_modified)
+        self.variants: dict[Optional[str], bytes] = {None: body}
+        self.lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return sum(len(body) for body in self.variants.values())
+
+    def encoding_for(self, accepted: Optional[str]) -> Optional[str]:
+        body = self.variants[None]
+        if accepted and is_compressible(self.mimetype) and len(body) >= MIN_COMPRESS_SIZE:
+            return accepted
+        return None
+
+    def body(self, encoding: Optional[str]) -> bytes:
+        with self.lock:
+            if encoding not in self.variants:
+                self.variants[encoding] = compress(self.variants[None], encoding)
+            return self.variants[encoding]
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def not_modified(self, encoding: Optional[str], if_none_match: Optional[str],
+                     if_modified_since: Optional[str]) -> bool:
+        """Evaluates the conditional request headers; If-None-Match wins when both are sent."""
+        if if_none_match:
+            return etag_matches(if_none_match, self.etag_for(encoding))
+        if if_modified_since:
+            try:
+                return self.last_modified <= int(parsedate_to_datetime(if_modified_since).timestamp())
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def headers(self, encoding: Optional[str]) -> dict:
+        headers = {
+            "ETag": self.etag_for(encoding),
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            # Generated files change during a run, so always revalidate (cheap with the ETag)
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return headers
+
+
+class PreviewCache:
+    """LRU of preview files keyed by path and content version, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = PREVIEW_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[tuple, PreviewFile]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[PreviewFile]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, entry: PreviewFile) -> PreviewFile:
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self._evict()
+            return entry
+
+    def _evict(self) -> None:
+        total = sum(entry.size for entry in self.entries.values())
+        while total > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            total -= entry.size
+
+    def trim(self) -> None:
+        """Re-applies the byte limit after compressed variants were added."""
+        with self.lock:
+            self._evict()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": sum(entry.size for entry in self.entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+preview_cache = PreviewCache()
+
+
+def _mimetype(rel: str) -> str:
+    return mimetypes.guess_type(rel)[0] or "application/octet-stream"
+
+
+def _from_workspace(workspace: Workspace, rel: str, live_reload: Optional[str]) -> Optional[PreviewFile]:
+    text = workspace.read(rel)
+    if text is None:
+        return None
+    digest = workspace.content_hash(rel)
+    key = (str(workspace.root), rel, digest, live_reload)
+    entry = preview_cache.get(key)
+    if entry is None:
+        body = text.encode("utf-8")
+        mimetype = _mimetype(rel)
+        if live_reload and mimetype == "text/html":
+            body = inject_live_reload(body, live_reload)
+            # The page with the script is a different representation than without it
+            digest = hashlib.sha256(body).hexdigest()
+        entry = preview_cache.put(key, PreviewFile(body, mimetype, digest, time.time()))
+    return entry
+
+
+def _from_disk(root: pathlib.Path, rel: str) -> Optional[PreviewFile]:
+    path = root / rel
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    if not path.is_file():
+        return None
+    # Symlinks could point outside the project
+    real_root = root.resolve()
+    if real_root not in path.resolve().parents:
+        return None
+    key = (str(root), rel, stat.st_mtime_ns, stat.st_size)
+    entry = preview_cache.get(key)
+    if entry is None:
+        body = path.read_bytes()
+        digest = hashlib.sha256(body).hexdigest()
+        entry = preview_cache.put(key, PreviewFile(body, _mimetype(rel), digest, stat.st_mtime))
+    return entry
+
+
+def load_preview_file(root: pathlib.Path, rel: str, workspace: Optional[Workspace] = None,
+                      live_reload: Optional[str] = None) -> Optional[PreviewFile]:
+    """Returns a project file for preview, or None if it does not exist.
+
+    With a workspace, files come from memory (including changes not yet
+    flushed) and are keyed by content hash; other files are keyed by mtime
+    and size, so an unchanged file costs one stat. ``live_reload`` is the
+    event stream URL whose reload script is injected into HTML pages.
+    """
+    if workspace is not None:
+        try:
+            return _from_workspace(workspace, rel, live_reload)
+        except UnicodeDecodeError:
+            # Binary files (e.g. images created by a command) are served from disk
+            pass
+    return _from_disk(pathlib.Path(root), rel)
@@ -1,3 +1,7 @@
+# Bump whenever a prompt template changes so cached LLM responses are not reused
+PROMPT_VERSION = "2"
+
+
 def planner_prompt(user_prompt: str) -> str:
     PLANNER_PROMPT = f"""
 You are the PLANNER agent. Convert the user prompt into a COMPLETE engineering project plan.
@@ -19,6 +23,8 @@ RULES:
     * Name the variables, functions, classes, and components to be defined.
     * Mention how this task depends on or will be used by previous tasks.
     * Include integration details: imports, expected function signatures, data flow.
+- In each task's depends_on, list the paths of the files that must be implemented before it.
+  Leave it empty when the task does not need any other file, so it can be built in parallel.
 - Order tasks so that dependencies are implemented first.
 - Each step must be SELF-CONTAINED but also carry FORWARD the relevant context from earlier tasks.
 
@@ -28,16 +34,37 @@ Project Plan:
     return ARCHITECT_PROMPT
 
 
+def architect_json_format() -> str:
+    """Output format for the streamed architect, whose tasks are parsed while they arrive."""
+    return """
+Respond with ONLY a JSON object and no other text, in exactly this form:
+{"implementation_steps": [{"filepath": "...", "task_description": "...", "depends_on": ["..."]}]}
+Emit all tasks of a file one after another before moving on to the next file.
+    """
+
+
 def coder_system_prompt() -> str:
     CODER_SYSTEM_PROMPT = """
 You are the CODER agent.
-You are implementing a specific engineering task.
-You have access to tools to read and write files.
+You are implementing one or more engineering tasks for a single file.
+You have access to tools to read, write and edit files.
 
 Always:
-- Review all existing files to maintain compatibility.
-- Implement the FULL file content, integrating with other modules.
+- Use the project outline and the dependency contents you are given to stay compatible
+  with the other files; call read_file only for a file whose full content you need.
+- Implement every task completely, integrating with other modules.
+- When the file already has content, change it with edit_file using small, exact
+  search/replace snippets instead of writing the whole file again.
+- Use write_file only for new or empty files, or when most of the file changes.
 - Maintain consistent naming of variables, functions, and imports.
 - When a module is imported from another file, ensure it exists and is implemented as described.
     """
-    return CODER_SYSTEM_PROMPT
\ No newline at end of file
+    return CODER_SYSTEM_PROMPT
+
+def repair_task(filepath: str, problems: list[str]) -> str:
+    """Task description that sends a file that failed validation back to the coder."""
+    listed = "\n".join(f"- {problem}" for problem in problems)
+    return f"""Fix the problems found when checking {filepath}:
+{listed}
+Change only what is needed to fix them and keep the rest of the file as it is.
+If a referenced file does not exist, point the reference at an existing file or create the missing file."""
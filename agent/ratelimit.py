@@ -0,0 +1,367 @@
+import asyncio
+import contextlib
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from agent.metrics import llm_retries, rate_limit_wait
+
+DEFAULT_RPM = 10
+DEFAULT_TPM = 250_000
+MAX_BACKOFF = 60.0
+QUOTA_RETRIES = 3
+# Tokens reserved for a call's answer on top of its prompt; corrected once the call reports its usage
+EXPECTED_OUTPUT_TOKENS = 1024
+
+
+def _env_number(names: list[str], default: float) -> float:
+    for name in names:
+        value = os.getenv(name)
+        if value:
+            return float(value)
+    return default
+
+
+def is_quota_error(exc: BaseException) -> bool:
+    """Returns True for a 429 / quota exhausted error, or an error caused by one.
+
+    Decided by HTTP status code or exception type only; messages mention
+    "429" or "quota" for all kinds of other reasons.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, "response", None)
+        codes = (getattr(exc, "status_code", None), getattr(exc, "code", None), getattr(response, "status_code", None))
+        if 429 in codes:
+            return True
+        if type(exc).__name__ in ("ResourceExhausted", "RateLimitError", "TooManyRequests"):
+            return True
+        # Provider integrations often wrap the client's error in their own
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def estimate_tokens(messages: list) -> int:
+    """Rough token count of a call: its prompt at ~4 characters a token plus room for the answer."""
+    chars = sum(len(str(getattr(message, "content", message))) for message in messages)
+    return chars // 4 + EXPECTED_OUTPUT_TOKENS
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Reads a Retry-After hint from a provider error, if it carries one."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """A thread-safe token bucket that hands out reservations.
+
+    ``reserve`` debits the bucket immediately (it may go negative) and returns
+    how long the caller has to wait before its reservation is covered. Callers
+    sleep outside the lock, so the bucket works from threads and event loops.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float, rate: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def reserve(self, amount: float, rate_factor: float = 1.0) -> float:
+        rate = self.rate * rate_factor
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now, rate)
+            self.level -= amount
+            return max(0.0, -self.level / rate)
+
+    def debit(self, amount: float) -> None:
+        """Takes ``amount`` tokens out of the bucket; a negative amount gives tokens back."""
+        with self.lock:
+            self._refill(time.monotonic(), self.rate)
+            self.level = min(self.capacity, self.level - amount)
+
+    def wait_time(self) -> float:
+        """How long until the bucket is back to a non-negative level."""
+        with self.lock:
+            self._refill(time.monotonic(), self.rate)
+            return max(0.0, -self.level / self.rate)
+
+
+class SharedTokenBucket:
+    """A token bucket kept in SQLite, so several processes draw from one budget.
+
+    Same interface as TokenBucket. Each operation is one short write
+    transaction, and the wall clock is used since monotonic clocks are not
+    comparable between processes.
+    """
+
+    def __init__(self, path: pathlib.Path, name: str, rate_per_second: float, capacity: float):
+        self.path = pathlib.Path(path)
+        self.name = name
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", (name, capacity, time.time()))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            # Take the write lock up front so read-modify-write is atomic across processes
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _update(self, amount: float, rate: float) -> float:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            level, updated = row if row else (self.capacity, time.time())
+            now = time.time()
+            level = min(self.capacity, level + max(0.0, now - updated) * rate - amount)
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (self.name, level, now))
+        return max(0.0, -level / rate)
+
+    def reserve(self, amount: float, rate_factor: float = 1.0) -> float:
+        return self._update(amount, self.rate * rate_factor)
+
+    def debit(self, amount: float) -> None:
+        self._update(amount, self.rate)
+
+    def wait_time(self) -> float:
+        return self._update(0, self.rate)
+
+
+class RateLimiter(BaseRateLimiter):
+    """Requests-per-minute and tokens-per-minute budget for one provider/model.
+
+    Plugged into a chat model through its ``rate_limiter`` field, so it applies
+    to every model call, including the ones made inside the ReAct loop. The
+    companion ``callback`` reserves a call's estimated tokens when it starts,
+    before ``acquire`` runs, so concurrent calls cannot all pass on the same
+    budget; when the call ends the reservation is corrected to the tokens it
+    actually used. A quota error backs the limiter off.
+
+    With ``shared_path`` the budgets live in a SQLite file that every process
+    using the same path draws from, e.g. the workers of a batch run.
+    """
+
+    def __init__(self, provider: str, model: str, rpm: float, tpm: float, burst: Optional[float] = None,
+                 shared_path: Optional[pathlib.Path] = None):
+        self.provider = provider
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self.shared = shared_path is not None
+        if shared_path is not None:
+            self.requests = SharedTokenBucket(shared_path, f"{provider}/{model}/requests", rpm / 60.0, burst or max(1.0, rpm / 4))
+            self.tokens = SharedTokenBucket(shared_path, f"{provider}/{model}/tokens", tpm / 60.0, tpm)
+        else:
+            self.requests = TokenBucket(rpm / 60.0, burst or max(1.0, rpm / 4))
+            self.tokens = TokenBucket(tpm / 60.0, tpm)
+        self.lock = threading.Lock()
+        self.rate_factor = 1.0
+        self.blocked_until = 0.0
+        self.consecutive_errors = 0
+        self.total_wait = 0.0
+        self.last_wait = 0.0
+        self.request_count = 0
+        self.throttled_count = 0
+        self.token_count = 0
+        # Tokens reserved per model call (LangChain run id) until it reports its usage
+        self.reserved: dict[Any, int] = {}
+        self.callback = RateLimitCallback(self)
+
+    def _reserve(self) -> float:
+        with self.lock:
+            factor = self.rate_factor
+            blocked = max(0.0, self.blocked_until - time.monotonic())
+        delay = max(blocked, self.requests.reserve(1, factor), self.tokens.wait_time())
+        with self.lock:
+            self.request_count += 1
+            self.total_wait += delay
+            self.last_wait = delay
+        rate_limit_wait.observe(delay, provider=self.provider, model=self.model)
+        return delay
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return True
+
+    def reserve_tokens(self, run_id: Any, amount: int) -> None:
+        """Debits a call's estimated tokens before it acquires, so ``acquire`` waits until they are covered."""
+        self.tokens.debit(amount)
+        with self.lock:
+            self.reserved[run_id] = amount
+
+    def release_tokens(self, run_id: Any) -> None:
+        """Gives back the reservation of a call that failed."""
+        with self.lock:
+            amount = self.reserved.pop(run_id, 0)
+        if amount:
+            self.tokens.debit(-amount)
+
+    def record_usage(self, total_tokens: int, run_id: Any = None) -> None:
+        with self.lock:
+            reserved = self.reserved.pop(run_id, 0)
+        # A call that reports no usage keeps its estimate
+        if total_tokens and total_tokens != reserved:
+            self.tokens.debit(total_tokens - reserved)
+        with self.lock:
+            self.token_count += total_tokens
+            self.consecutive_errors = 0
+            # Recover gradually after a backoff instead of jumping back to full speed
+            self.rate_factor = min(1.0, self.rate_factor + 0.1)
+
+    def backoff(self, retry_after: Optional[float] = None) -> float:
+        """Halves the request rate and pauses new requests after a quota error."""
+        with self.lock:
+            self.throttled_count += 1
+            self.consecutive_errors += 1
+            self.rate_factor = max(0.1, self.rate_factor / 2)
+            pause = retry_after or min(MAX_BACKOFF, 2.0 ** self.consecutive_errors)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+        if self.shared:
+            # Other processes cannot see blocked_until; owing the pause's worth
+            # of requests makes them wait as well
+            self.requests.debit(pause * self.requests.rate)
+        return pause
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "provider": self.provider,
+                "model": self.model,
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "rate_factor": round(self.rate_factor, 3),
+                "requests": self.request_count,
+                "tokens": self.token_count,
+                "throttled": self.throttled_count,
+                "total_wait_seconds": round(self.total_wait, 3),
+                "last_wait_seconds": round(self.last_wait, 3),
+            }
+
+
+class RateLimitCallback(BaseCallbackHandler):
+    """Feeds token usage and quota errors from model calls back into a RateLimiter."""
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+
+    def on_chat_model_start(self, serialized: dict, messages: list[list], *, run_id: Any, **kwargs: Any) -> None:
+        self.limiter.reserve_tokens(run_id, sum(estimate_tokens(batch) for batch in messages))
+
+    def on_llm_start(self, serialized: dict, prompts: list[str], *, run_id: Any, **kwargs: Any) -> None:
+        self.limiter.reserve_tokens(run_id, estimate_tokens(prompts))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: Any = None, **kwargs: Any) -> None:
+        total = 0
+        usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage_metadata")
+        if isinstance(usage, dict):
+            total = usage.get("total_tokens", 0)
+        if not total:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                    if metadata:
+                        total += metadata.get("total_tokens", 0)
+        self.limiter.record_usage(total, run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: Any = None, **kwargs: Any) -> None:
+        self.limiter.release_tokens(run_id)
+        if is_quota_error(error):
+            pause = self.limiter.backoff(_retry_after(error))
+            print(f"Rate limited by {self.limiter.provider}/{self.limiter.model}, backing off {pause:.1f}s")
+
+
+_limiters: dict[tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str) -> RateLimiter:
+    """Returns the shared limiter for a provider/model, configured from the environment.
+
+    Budgets are read from RATE_LIMIT_<PROVIDER>_RPM / _TPM / _BURST, falling
+    back to RATE_LIMIT_RPM / RATE_LIMIT_TPM / RATE_LIMIT_BURST. When
+    RATE_LIMIT_SHARED_PATH names a SQLite file, the budgets are shared with
+    every other process using that file.
+    """
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            prefix = f"RATE_LIMIT_{provider.upper()}"
+            rpm = _env_number([f"{prefix}_RPM", "RATE_LIMIT_RPM"], DEFAULT_RPM)
+            tpm = _env_number([f"{prefix}_TPM", "RATE_LIMIT_TPM"], DEFAULT_TPM)
+            burst = _env_number([f"{prefix}_BURST", "RATE_LIMIT_BURST"], 0) or None
+            shared_path = os.getenv("RATE_LIMIT_SHARED_PATH") or None
+            limiter = RateLimiter(provider, model, rpm, tpm, burst, shared_path)
+            _limiters[key] = limiter
+        return limiter
+
+
+def rate_limit_stats() -> list[dict]:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
+
+
+def invoke_with_backoff(func, *args, **kwargs):
+    """Calls ``func``, retrying when it fails with a quota error.
+
+    No sleep is needed between attempts: the limiter attached to the model has
+    already been backed off by the failed call, so the retry waits in acquire.
+    """
+    for attempt in range(QUOTA_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == QUOTA_RETRIES or not is_quota_error(e):
+                raise
+            llm_retries.inc()
+
+
+async def ainvoke_with_backoff(func, *args, **kwargs):
+    """Async version of ``invoke_with_backoff`` for coroutine functions such as ``ainvoke``."""
+    for attempt in range(QUOTA_RETRIES + 1):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if attempt == QUOTA_RETRIES or not is_quota_error(e):
+                raise
+            llm_retries.inc()
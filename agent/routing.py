@@ -0,0 +1,320 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from agent.metrics import router_calls, router_failovers, router_hedges
+from agent.ratelimit import is_quota_error
+
+# A hedged request goes to the next model once the primary has taken longer
+# than this percentile of its recent (prompt-size adjusted) latencies ...
+ROUTER_HEDGE_PERCENTILE = float(os.getenv("ROUTER_HEDGE_PERCENTILE", "90"))
+# ... but never sooner than this many seconds; 0 disables hedging
+ROUTER_HEDGE_MIN_SECONDS = float(os.getenv("ROUTER_HEDGE_MIN_SECONDS", "5"))
+# Calls remembered per model for the latency and error statistics
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "50"))
+# Samples a model needs before its statistics are trusted for ranking
+MIN_SAMPLES = 3
+
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("ROUTER_MAX_THREADS", "16")), thread_name_prefix="router")
+
+
+def estimate_tokens(model_input: Any) -> int:
+    """Rough prompt size in tokens (about four characters each)."""
+    if isinstance(model_input, (list, tuple)):
+        return sum(estimate_tokens(item) for item in model_input)
+    if isinstance(model_input, dict):
+        return estimate_tokens(model_input.get("content", ""))
+    content = getattr(model_input, "content", None)
+    if content is not None:
+        return estimate_tokens(content)
+    if hasattr(model_input, "to_messages"):
+        return estimate_tokens(model_input.to_messages())
+    return len(str(model_input)) // 4
+
+
+def _size_factor(prompt_tokens: int) -> float:
+    return 1.0 + prompt_tokens / 1000.0
+
+
+class ModelStats:
+    """Recent latency and outcome of one model, shared by every router that uses it.
+
+    Latencies are stored per (1 + prompt_tokens / 1000), so calls with small
+    and large prompts can be compared and scaled to the prompt at hand.
+    """
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self.lock = threading.Lock()
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+
+    def record(self, seconds: float, prompt_tokens: int, ok: bool) -> None:
+        with self.lock:
+            if ok:
+                self.latencies.append(seconds / _size_factor(prompt_tokens))
+            self.outcomes.append(ok)
+
+    @property
+    def samples(self) -> int:
+        with self.lock:
+            return len(self.latencies)
+
+    def percentile(self, pct: float, prompt_tokens: int) -> Optional[float]:
+        with self.lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[idx] * _size_factor(prompt_tokens)
+
+    def error_rate(self) -> float:
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def snapshot(self) -> dict:
+        p50, p90 = self.percentile(50, 0), self.percentile(90, 0)
+        return {
+            "samples": self.samples,
+            "p50_seconds_per_1k": round(p50, 3) if p50 is not None else None,
+            "p90_seconds_per_1k": round(p90, 3) if p90 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+        }
+
+
+_stats: dict[str, ModelStats] = {}
+_stats_lock = threading.Lock()
+
+
+def stats_for(spec: str) -> ModelStats:
+    with _stats_lock:
+        stats = _stats.get(spec)
+        if stats is None:
+            stats = _stats[spec] = ModelStats()
+        return stats
+
+
+def router_stats() -> dict:
+    with _stats_lock:
+        specs = dict(_stats)
+    return {spec: stats.snapshot() for spec, stats in specs.items()}
+
+
+class ModelRouter(Runnable):
+    """Sends each call to the best of several models, hedging slow calls and failing over on quota errors.
+
+    Models are ranked by their expected latency for the prompt's size,
+    penalized by their recent error rate; models whose rate limiter is
+    backing off go last, and until a fallback has enough samples the
+    configured order decides. When the chosen model takes longer than
+    ROUTER_HEDGE_PERCENTILE of its usual latency, the same call is also sent
+    to the runner-up and whichever answers first wins. Quota errors move
+    the call on to the next model straight away.
+
+    ``bind_tools`` and ``with_structured_output`` are applied to every model,
+    so the router can stand in for a chat model in the agents.
+    """
+
+    def __init__(self, specs: list[str], runnables: list[Runnable], limiters: list = None, role: str = ""):
+        self.specs = specs
+        self.runnables = runnables
+        self.limiters = limiters or [None] * len(specs)
+        self.role = role
+        self.model = "+".join(specs)
+
+    def _derive(self, runnables: list[Runnable]) -> "ModelRouter":
+        return ModelRouter(self.specs, runnables, self.limiters, self.role)
+
+    def bind_tools(self, tools, **kwargs) -> "ModelRouter":
+        return self._derive([runnable.bind_tools(tools, **kwargs) for runnable in self.runnables])
+
+    def with_structured_output(self, schema, **kwargs) -> "ModelRouter":
+        return self._derive([runnable.with_structured_output(schema, **kwargs) for runnable in self.runnables])
+
+    def _blocked(self, idx: int) -> bool:
+        limiter = self.limiters[idx]
+        return limiter is not None and limiter.blocked_until > time.monotonic()
+
+    def rank(self, prompt_tokens: int) -> list[int]:
+        """Returns model indices, best first."""
+        def score(idx: int):
+            stats = stats_for(self.specs[idx])
+            expected = stats.percentile(50, prompt_tokens)
+            if expected is None or (idx > 0 and stats.samples < MIN_SAMPLES):
+                expected = 0.0 if idx == 0 else float("inf")
+            return (self._blocked(idx), expected * (1 + 2 * stats.error_rate()), idx)
+        return sorted(range(len(self.specs)), key=score)
+
+    def _call(self, idx: int, model_input: Any, config: Optional[RunnableConfig], prompt_tokens: int, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = self.runnables[idx].invoke(model_input, config, **kwargs)
+        except Exception:
+            stats_for(self.specs[idx]).record(time.perf_counter() - start, prompt_tokens, False)
+            raise
+        stats_for(self.specs[idx]).record(time.perf_counter() - start, prompt_tokens, True)
+        return result
+
+    async def _acall(self, idx: int, model_input: Any, config: Optional[RunnableConfig], prompt_tokens: int, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = await self.runnables[idx].ainvoke(model_input, config, **kwargs)
+        except Exception:
+            stats_for(self.specs[idx]).record(time.perf_counter() - start, prompt_tokens, False)
+            raise
+        stats_for(self.specs[idx]).record(time.perf_counter() - start, prompt_tokens, True)
+        return result
+
+    def _submit(self, idx: int, model_input: Any, config, prompt_tokens: int, **kwargs):
+        context = contextvars.copy_context()
+        return _pool.submit(context.run, self._call, idx, model_input, config, prompt_tokens, **kwargs)
+
+    def _hedge_delay(self, idx: int, prompt_tokens: int) -> Optional[float]:
+        if ROUTER_HEDGE_MIN_SECONDS <= 0:
+            return None
+        stats = stats_for(self.specs[idx])
+        if stats.samples < MIN_SAMPLES:
+            return None
+        return max(ROUTER_HEDGE_MIN_SECONDS, stats.percentile(ROUTER_HEDGE_PERCENTILE, prompt_tokens))
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        prompt_tokens = estimate_tokens(input)
+        order = self.rank(prompt_tokens)
+        if len(order) == 1:
+            return self._call(order[0], input, config, prompt_tokens, **kwargs)
+
+        pending = {}  # future -> model index
+        remaining = list(order)
+        last_error: Optional[BaseException] = None
+
+        def start_next() -> bool:
+            if not remaining:
+                return False
+            idx = remaining.pop(0)
+            pending[self._submit(idx, input, config, prompt_tokens, **kwargs)] = idx
+            return True
+
+        start_next()
+        while pending:
+            primary = next(iter(pending.values()))
+            timeout = self._hedge_delay(primary, prompt_tokens) if len(pending) == 1 and remaining else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # The model is slower than usual: race the same call on the next one
+                router_hedges.inc(role=self.role)
+                start_next()
+                continue
+            for future in done:
+                idx = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    # A hedged loser keeps running in the background; its result is dropped
+                    router_calls.inc(role=self.role, model=self.specs[idx])
+                    return future.result()
+                last_error = error
+                if is_quota_error(error):
+                    router_failovers.inc(role=self.role, model=self.specs[idx])
+                    print(f"{self.specs[idx]} is out of quota, failing over")
+            if not pending and not start_next():
+                break
+        raise last_error
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        """Async version of ``invoke``; hedged calls are tasks on the caller's event loop, not threads."""
+        prompt_tokens = estimate_tokens(input)
+        order = self.rank(prompt_tokens)
+        if len(order) == 1:
+            return await self._acall(order[0], input, config, prompt_tokens, **kwargs)
+
+        pending = {}  # task -> model index
+        remaining = list(order)
+        last_error: Optional[BaseException] = None
+
+        def start_next() -> bool:
+            if not remaining:
+                return False
+            idx = remaining.pop(0)
+            pending[asyncio.ensure_future(self._acall(idx, input, config, prompt_tokens, **kwargs))] = idx
+            return True
+
+        start_next()
+        try:
+            while pending:
+                primary = next(iter(pending.values()))
+                timeout = self._hedge_delay(primary, prompt_tokens) if len(pending) == 1 and remaining else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    router_hedges.inc(role=self.role)
+                    start_next()
+                    continue
+                for task in done:
+                    idx = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        router_calls.inc(role=self.role, model=self.specs[idx])
+                        return task.result()
+                    last_error = error
+                    if is_quota_error(error):
+                        router_failovers.inc(role=self.role, model=self.specs[idx])
+                        print(f"{self.specs[idx]} is out of quota, failing over")
+                if not pending and not start_next():
+                    break
+        finally:
+            # Unlike threads, a hedged loser can be stopped
+            for task in pending:
+                task.cancel()
+        raise last_error
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        """Streams from the best model; fails over only before the first chunk has been sent."""
+        prompt_tokens = estimate_tokens(input)
+        last_error: Optional[BaseException] = None
+        for idx in self.rank(prompt_tokens):
+            start = time.perf_counter()
+            started = False
+            try:
+                for chunk in self.runnables[idx].stream(input, config, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                stats_for(self.specs[idx]).record(time.perf_counter() - start, prompt_tokens, False)
+                if started or not is_quota_error(e):
+                    raise
+                router_failovers.inc(role=self.role, model=self.specs[idx])
+                last_error = e
+                continue
+            stats_for(self.specs[idx]).record(time.perf_counter() - start, prompt_tokens, True)
+            router_calls.inc(role=self.role, model=self.specs[idx])
+            return
+        raise last_error
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        """Async version of ``stream``."""
+        prompt_tokens = estimate_tokens(input)
+        last_error: Optional[BaseException] = None
+        for idx in self.rank(prompt_tokens):
+            start = time.perf_counter()
+            started = False
+            try:
+                async for chunk in self.runnables[idx].astream(input, config, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                stats_for(self.specs[idx]).record(time.perf_counter() - start, prompt_tokens, False)
+                if started or not is_quota_error(e):
+                    raise
+                router_failovers.inc(role=self.role, model=self.specs[idx])
+                last_error = e
+                continue
+            stats_for(self.specs[idx]).record(time.perf_counter() - start, prompt_tokens, True)
+            router_calls.inc(role=self.role, model=self.specs[idx])
+            return
+        raise last_error
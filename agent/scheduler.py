@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import os
+import posixpath
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+# Maximum number of coder tasks that may run at the same time
+CODER_MAX_WORKERS = int(os.getenv("CODER_MAX_WORKERS", "4"))
+# "per_file" hands all ready tasks of a file to one coder call; "per_task" runs one call per task
+CODER_MODE = os.getenv("CODER_MODE", "per_file")
+
+
+def normalize_path(path: str) -> str:
+    """Normalizes a project-relative path so it can be compared with others."""
+    return posixpath.normpath(path.replace("\\", "/").strip())
+
+
+def _mentions(description: str, token: str) -> bool:
+    """Whether ``token`` occurs in the description as a whole path, not inside a longer one."""
+    # "a.js" must not match inside "data.js" or "a.json"; a sentence's full stop may follow
+    return re.search(rf"(?<![\w./-]){re.escape(token)}(?![\w/-]|\.\w)", description) is not None
+
+
+def _mentioned_paths(description: str, known_paths: set[str]) -> set[str]:
+    """Returns the known file paths that a task description refers to, by full path or file name."""
+    mentioned = set()
+    for path in known_paths:
+        if _mentions(description, path) or _mentions(description, posixpath.basename(path)):
+            mentioned.add(path)
+    return mentioned
+
+
+def build_dependency_graph(steps) -> dict[int, set[int]]:
+    """Maps each step index to the indices of the earlier steps it must wait for.
+
+    A step depends on the previous step that touches the same file, and on the
+    last earlier step of every file it depends on. Dependencies are taken from
+    the task's ``depends_on`` list (empty meaning none), or, when the task has
+    none at all, inferred from the file paths its description mentions. Only
+    earlier steps are considered, so the graph is always acyclic.
+    """
+    known_paths = {normalize_path(step.filepath) for step in steps}
+    last_step_for_file: dict[str, int] = {}
+    graph: dict[int, set[int]] = {}
+
+    for idx, step in enumerate(steps):
+        path = normalize_path(step.filepath)
+        if step.depends_on is not None:
+            dep_paths = {normalize_path(p) for p in step.depends_on}
+        else:
+            dep_paths = _mentioned_paths(step.task_description, known_paths - {path})
+
+        wanted = set()
+        if path in last_step_for_file:
+            wanted.add(last_step_for_file[path])
+        for dep_path in dep_paths:
+            if dep_path in last_step_for_file:
+                wanted.add(last_step_for_file[dep_path])
+
+        graph[idx] = wanted
+        last_step_for_file[path] = idx
+
+    return graph
+
+
+def ready_steps(steps, graph: dict[int, set[int]], completed: set[int]) -> list[int]:
+    """Returns the pending steps whose dependencies are all completed.
+
+    At most one step per file is returned so that two tasks never write the
+    same file concurrently.
+    """
+    ready = []
+    claimed_files = set()
+    for idx in range(len(steps)):
+        if idx in completed or not graph[idx] <= completed:
+            continue
+        path = normalize_path(steps[idx].filepath)
+        if path in claimed_files:
+            continue
+        claimed_files.add(path)
+        ready.append(idx)
+    return ready
+
+
+def ready_batches(steps, graph: dict[int, set[int]], completed: set[int],
+                  mode: str = CODER_MODE) -> list[list[int]]:
+    """Groups the ready steps into batches that are each handled by one coder call.
+
+    In "per_file" mode a ready step is joined by the later steps of the same
+    file, in order, for as long as their dependencies are met by the completed
+    steps and the batch itself. A file's tasks then cost one prompt with its
+    content instead of one per task.
+    """
+    batches = []
+    for idx in ready_steps(steps, graph, completed):
+        batch = [idx]
+        if mode == "per_file":
+            path = normalize_path(steps[idx].filepath)
+            done = completed | {idx}
+            for later in range(idx + 1, len(steps)):
+                if later in completed or normalize_path(steps[later].filepath) != path:
+                    continue
+                if not graph[later] <= done:
+                    break
+                batch.append(later)
+                done.add(later)
+        batches.append(batch)
+    return batches
+
+
+def run_parallel(func, items, max_workers: int = CODER_MAX_WORKERS) -> list:
+    """Runs ``func`` over ``items`` on a bounded thread pool and returns the results in order.
+
+    Each call runs in a copy of the caller's context so context variables set
+    by the caller stay visible to the workers. The first exception is re-raised
+    once every call has finished.
+    """
+    if len(items) <= 1 or max_workers <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
+
+
+async def arun_parallel(func, items, max_workers: int = CODER_MAX_WORKERS) -> list:
+    """Async version of ``run_parallel``: awaits ``func(item)`` for every item, at most ``max_workers`` at a time.
+
+    As with ``run_parallel``, the first exception is re-raised once every call has finished.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    results = await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return list(results)
+
+
+def run_pipelined(task_source: Iterable, run_batch: Callable[[list[int], list], None],
+                  max_workers: int = CODER_MAX_WORKERS, mode: str = CODER_MODE) -> tuple[list, set[int]]:
+    """Runs coder batches while the tasks are still arriving from ``task_source``.
+
+    ``task_source`` is consumed on its own thread. Every time a task arrives or
+    a batch finishes, the batches that became ready are started, so the first
+    files are written while later tasks are still being planned. Dependencies
+    only ever point at earlier steps, so they are known as soon as a step
+    arrives. In "per_file" mode the file the source is currently emitting
+    tasks for is held back until it moves on, so its tasks still share one
+    coder call.
+
+    Returns all tasks received and the indices completed. The first error,
+    from the source or a batch, is re-raised once running batches finish.
+    """
+    events: queue.Queue = queue.Queue()
+
+    def produce():
+        try:
+            for task in task_source:
+                events.put(("task", task))
+            events.put(("end", None))
+        except BaseException as e:
+            events.put(("error", e))
+
+    steps: list = []
+    completed: set[int] = set()
+    running: set[int] = set()
+    producing = True
+    error: Optional[BaseException] = None
+
+    def finished(batch: list[int], future) -> None:
+        events.put(("done", (batch, future)))
+
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True).start()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while (producing and error is None) or running:
+            kind, payload = events.get()
+            if kind == "task":
+                steps.append(payload)
+            elif kind == "end":
+                producing = False
+            elif kind == "error":
+                producing = False
+                error = error or payload
+            else:
+                batch, future = payload
+                running.difference_update(batch)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                else:
+                    completed.update(batch)
+            if error is not None:
+                continue
+
+            open_file = normalize_path(steps[-1].filepath) if producing and steps and mode == "per_file" else None
+            graph = build_dependency_graph(steps)
+            for batch in ready_batches(steps, graph, completed, mode):
+                if batch[0] in running or normalize_path(steps[batch[0]].filepath) == open_file:
+                    continue
+                running.update(batch)
+                future = pool.submit(contextvars.copy_context().run, run_batch, batch, [steps[idx] for idx in batch])
+                future.add_done_callback(lambda f, batch=batch: finished(batch, f))
+
+    if error is not None:
+        raise error
+    return steps, completed
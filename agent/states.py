@@ -1,5 +1,6 @@
 from pydantic import BaseModel,Field,ConfigDict
 from typing import Optional
+from typing_extensions import TypedDict
 
 class File(BaseModel):
     path: str= Field(description="The path to the file to be created or modifeid ")
@@ -15,6 +16,7 @@ class Plan(BaseModel):
 class ImplementationTask(BaseModel):
     filepath: str= Field(description="The path to the file to be created or modifeid ")
     task_description:str= Field(description="A detailed descripton of the task to be performed on  files according to the user")
+    depends_on: Optional[list[str]]= Field(None,description="Paths of the other files this task needs to be implemented first, e.g. 'index.html' for a script that uses its element ids; an empty list if it needs none")
 
 class TaskPlan(BaseModel):
     implementation_steps: list[ImplementationTask]= Field(description="A list of steps to be taken into consideration for the task ")
@@ -22,5 +24,26 @@ class TaskPlan(BaseModel):
 
 class CoderState(BaseModel):
     task_plan: TaskPlan= Field(description="The task plan for execution ")
-    current_step_idx: int= Field(0,description="The index of the current step in the implementation steps")
-    current_file_content : Optional[str]= Field(None,description="The content of the current file")
\ No newline at end of file
+    current_step_idx: int= Field(0,description="The number of implementation steps completed so far")
+    completed_steps: list[int]= Field(default_factory=list,description="Indices of the implementation steps that have been completed")
+    current_file_content : Optional[str]= Field(None,description="The content of the current file")
+
+class PreviousRun(BaseModel):
+    """What an incremental run needs from the run it builds on."""
+    user_prompt: str= Field(description="The prompt of the previous run")
+    plan: Plan= Field(description="The plan of the previous run")
+    task_plan: TaskPlan= Field(description="The task plan of the previous run")
+    file_hashes: dict[str, str]= Field(default_factory=dict,description="sha256 of every project file when the previous run finished")
+
+class AgentState(TypedDict, total=False):
+    """Graph state; each node returns only the keys it changes and LangGraph merges them."""
+    user_prompt: str
+    no_cache: bool
+    plan: Plan
+    task_plan: TaskPlan
+    coder_state: CoderState
+    status: str
+    validation: dict[str, list[str]]
+    repair_rounds: int
+    previous: PreviousRun
+    file_hashes: dict[str, str]
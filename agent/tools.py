@@ -1,16 +1,57 @@
+import contextlib
+import contextvars
+import os
 import pathlib
-import subprocess
+import re
 from typing import Tuple
 
 from langchain_core.tools import tool
+from pydantic import BaseModel, Field
+
+from agent.events import emit
+from agent.executor import get_executor
+from agent.metrics import tool_callback
+from agent.workspace import Workspace, open_workspace
 
 # Use absolute path relative to this file's location
 PROJECT_ROOT = pathlib.Path(__file__).parent / "generated_project"
+# Each generation job gets its own project root below this directory
+WORKSPACES_ROOT = pathlib.Path(os.getenv("WORKSPACES_ROOT", pathlib.Path(__file__).parent / "workspaces"))
+
+# The project root the tools operate on for the current job
+_project_root: contextvars.ContextVar[pathlib.Path] = contextvars.ContextVar("project_root", default=PROJECT_ROOT)
+
+
+def workspace_for(request_id: str) -> pathlib.Path:
+    """Returns the isolated project root for a generation job."""
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", request_id or ""):
+        raise ValueError(f"Invalid request id: {request_id!r}")
+    return WORKSPACES_ROOT / request_id
+
+
+def get_project_root() -> pathlib.Path:
+    return _project_root.get()
+
+
+@contextlib.contextmanager
+def use_project_root(root: pathlib.Path):
+    """Points the tools at ``root`` for the duration of the block (per thread/context)."""
+    token = _project_root.set(pathlib.Path(root))
+    try:
+        yield pathlib.Path(root)
+    finally:
+        _project_root.reset(token)
+
+
+def current_workspace() -> Workspace:
+    """Returns the in-memory workspace of the current project root."""
+    return open_workspace(get_project_root())
 
 
 def safe_path_for_project(path: str) -> pathlib.Path:
-    p = (PROJECT_ROOT / path).resolve()
-    if PROJECT_ROOT.resolve() not in p.parents and PROJECT_ROOT.resolve() != p.parent and PROJECT_ROOT.resolve() != p:
+    root = get_project_root().resolve()
+    p = (root / path).resolve()
+    if root not in p.parents and root != p.parent and root != p:
         raise ValueError("Attempt to write outside project root")
     return p
 
@@ -18,46 +59,132 @@ def safe_path_for_project(path: str) -> pathlib.Path:
 @tool
 def write_file(path: str, content: str) -> str:
     """Writes content to a file at the specified path within the project root."""
-    p = safe_path_for_project(path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    with open(p, "w", encoding="utf-8") as f:
-        f.write(content)
-    return f"WROTE:{p}"
+    workspace = current_workspace()
+    rel = workspace.write(path, content)
+    emit("file_written", path=rel, size=len(content))
+    return f"WROTE:{workspace.disk_path(rel)}"
+
+
+class TextEdit(BaseModel):
+    search: str = Field(description="Exact text currently in the file, including whitespace; must occur exactly once")
+    replace: str = Field(description="Text that replaces it")
+
+
+def apply_edits(content: str, edits: list[TextEdit]) -> str:
+    """Applies search/replace edits in order; raises ValueError if a search text is missing or ambiguous."""
+    for number, edit in enumerate(edits, start=1):
+        if not edit.search:
+            raise ValueError(f"edit {number}: search text is empty")
+        count = content.count(edit.search)
+        if count != 1:
+            found = "not found" if count == 0 else f"found {count} times"
+            raise ValueError(f"edit {number}: search text {found}; include more surrounding lines")
+        content = content.replace(edit.search, edit.replace, 1)
+    return content
+
+
+@tool
+def edit_file(path: str, edits: list[TextEdit]) -> str:
+    """Changes part of an existing file by replacing exact text snippets; cheaper than rewriting the whole file.
+
+    All edits are applied together, or none if any of them does not match.
+    """
+    workspace = current_workspace()
+    content = workspace.read(path)
+    if content is None:
+        return f"ERROR: {path} does not exist; use write_file to create it"
+    edits = [edit if isinstance(edit, TextEdit) else TextEdit(**edit) for edit in edits]
+    try:
+        updated = apply_edits(content, edits)
+    except ValueError as e:
+        return f"ERROR: {e}. No changes were made."
+    rel = workspace.write(path, updated)
+    emit("file_written", path=rel, size=len(updated))
+    return f"EDITED:{workspace.disk_path(rel)} ({len(edits)} edits)"
 
 
 @tool
 def read_file(path: str) -> str:
     """Reads content from a file at the specified path within the project root."""
-    p = safe_path_for_project(path)
-    if not p.exists():
-        return ""
-    with open(p, "r", encoding="utf-8") as f:
-        return f.read()
+    content = current_workspace().read(path)
+    return content if content is not None else ""
 
 
 @tool
 def get_current_directory() -> str:
     """Returns the current working directory."""
-    return str(PROJECT_ROOT)
+    return str(get_project_root())
 
 
 @tool
 def list_files(directory: str = ".") -> str:
     """Lists all files in the specified directory within the project root."""
-    p = safe_path_for_project(directory)
-    if not p.is_dir():
-        return f"ERROR: {p} is not a directory"
-    files = [str(f.relative_to(PROJECT_ROOT)) for f in p.glob("**/*") if f.is_file()]
+    workspace = current_workspace()
+    if not workspace.is_dir(directory):
+        return f"ERROR: {workspace.disk_path(directory)} is not a directory"
+    files = workspace.paths(directory)
     return "\n".join(files) if files else "No files found."
 
+def remove_unsafe_files(root: pathlib.Path) -> list[str]:
+    """Deletes what a command may have left that the host-side tools must not follow.
+
+    That is symlinks resolving outside the project (inside the sandbox an
+    absolute link such as /etc/hostname looks harmless, on the host it is
+    not) and anything that is neither a regular file nor a directory, such
+    as FIFOs, sockets and device nodes. Returns the removed paths.
+    """
+    real_root = os.path.realpath(root)
+    removed = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Symlinked directories show up in dirnames but are not descended into
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                unsafe = os.path.commonpath([real_root, os.path.realpath(path)]) != real_root
+            else:
+                unsafe = not (os.path.isdir(path) or os.path.isfile(path))
+            if unsafe:
+                with contextlib.suppress(OSError):
+                    os.unlink(path)
+                    removed.append(os.path.relpath(path, root))
+    return removed
+
+
 @tool
 def run_cmd(cmd: str, cwd: str = None, timeout: int = 30) -> Tuple[int, str, str]:
-    """Runs a shell command in the specified directory and returns the result."""
-    cwd_dir = safe_path_for_project(cwd) if cwd else PROJECT_ROOT
-    res = subprocess.run(cmd, shell=True, cwd=str(cwd_dir), capture_output=True, text=True, timeout=timeout)
-    return res.returncode, res.stdout, res.stderr
+    """Runs a shell command (e.g. a build or lint step) in the project and returns (exit code, stdout, stderr).
+
+    The command sees the project at /workspace and only the read-only system
+    directories besides it (see EXECUTOR_ISOLATION), gets CPU, memory and
+    time limits and is killed when it runs longer than ``timeout`` seconds.
+    """
+    root = get_project_root()
+    root.mkdir(parents=True, exist_ok=True)
+    cwd_dir = safe_path_for_project(cwd) if cwd else root
+    # The command sees the disk, so write pending changes first and pick up
+    # whatever it created or removed afterwards.
+    workspace = current_workspace()
+    workspace.flush()
+    try:
+        res = get_executor().run(str(root), cmd, str(cwd_dir), timeout,
+                                 on_output=lambda stream, text: emit("command_output", stream=stream, text=text))
+    finally:
+        remove_unsafe_files(root)
+        workspace.scan()
+    stderr = res.stderr
+    if res.timed_out:
+        stderr += f"\n[killed after {timeout}s]"
+    if res.truncated:
+        stderr += "\n[output truncated]"
+    return res.returncode, res.stdout, stderr
+
+
+# Count and time every tool call, whichever agent makes it
+for _tool in (write_file, edit_file, read_file, get_current_directory, list_files, run_cmd):
+    _tool.callbacks = [tool_callback]
 
 
 def init_project_root():
-    PROJECT_ROOT.mkdir(parents=True, exist_ok=True)
-    return str(PROJECT_ROOT)
\ No newline at end of file
+    root = get_project_root()
+    root.mkdir(parents=True, exist_ok=True)
+    return str(root)
\ No newline at end of file
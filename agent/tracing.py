@@ -0,0 +1,346 @@
+import atexit
+import hashlib
+import json
+import os
+import pathlib
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from agent.metrics import Counter, _token_usage
+
+# off, basic (graph runs, nodes, model and tool calls with timings and sizes) or
+# full (basic plus prompts, responses, tool arguments and results)
+TRACE_LEVEL = os.getenv("TRACE_LEVEL", "basic").lower()
+# Share of runs traced, decided per run id so a run is traced completely or not at all
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_PATH = pathlib.Path(os.getenv("TRACE_PATH", pathlib.Path(__file__).parent / ".state" / "traces"))
+# A run's trace file is rotated at this size, keeping TRACE_BACKUPS older files
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "2"))
+# Records waiting for the writer; when it falls behind, new records are dropped
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+# Prompt, response and tool texts are cut to this many characters
+TRACE_MAX_FIELD_CHARS = int(os.getenv("TRACE_MAX_FIELD_CHARS", "20000"))
+# Trace files kept open by the writer
+MAX_OPEN_TRACES = 64
+
+LEVELS = ("off", "basic", "full")
+if TRACE_LEVEL not in LEVELS:
+    raise ValueError(f"TRACE_LEVEL must be one of {', '.join(LEVELS)}, got {TRACE_LEVEL!r}")
+
+trace_dropped = Counter("generator_trace_records_dropped_total", "Trace records dropped because the writer fell behind.")
+
+
+def trace_file(trace_id: str, root: pathlib.Path = TRACE_PATH) -> pathlib.Path:
+    return pathlib.Path(root) / (re.sub(r"[^A-Za-z0-9_-]", "_", trace_id) + ".jsonl")
+
+
+class TraceWriter:
+    """Appends trace records to per-run JSONL files from a background thread.
+
+    ``write`` only puts the record on a bounded queue, so the threads running
+    the graph never format JSON or touch the disk. Files are rotated once
+    they grow past ``max_bytes``.
+    """
+
+    def __init__(self, root: pathlib.Path = TRACE_PATH, max_bytes: int = TRACE_MAX_BYTES,
+                 backups: int = TRACE_BACKUPS, queue_size: int = TRACE_QUEUE_SIZE):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue: "queue.Queue[Optional[tuple[str, dict]]]" = queue.Queue(queue_size)
+        self.files: "OrderedDict[str, Any]" = OrderedDict()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def write(self, trace_id: str, record: dict) -> None:
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.root.mkdir(parents=True, exist_ok=True)
+                    self.thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self.thread.start()
+                    atexit.register(self.close)
+        try:
+            self.queue.put_nowait((trace_id, record))
+        except queue.Full:
+            trace_dropped.inc()
+
+    def _file(self, trace_id: str):
+        f = self.files.get(trace_id)
+        if f is not None:
+            self.files.move_to_end(trace_id)
+            if f.tell() < self.max_bytes:
+                return f
+            f.close()
+            del self.files[trace_id]
+            self._rotate(trace_file(trace_id, self.root))
+        f = self.files[trace_id] = open(trace_file(trace_id, self.root), "a", encoding="utf-8")
+        while len(self.files) > MAX_OPEN_TRACES:
+            self.files.popitem(last=False)[1].close()
+        return f
+
+    def _rotate(self, path: pathlib.Path) -> None:
+        if not self.backups:
+            path.unlink(missing_ok=True)
+            return
+        # trace.jsonl -> trace.jsonl.1 -> trace.jsonl.2 ..., overwriting the oldest
+        for index in range(self.backups, 0, -1):
+            newer = path.with_name(f"{path.name}.{index - 1}") if index > 1 else path
+            if newer.exists():
+                os.replace(newer, path.with_name(f"{path.name}.{index}"))
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                trace_id, record = item
+                self._file(trace_id).write(json.dumps(record, default=str) + "\n")
+            except Exception as e:
+                print(f"Could not write trace record: {e}")
+            if self.queue.empty():
+                for f in self.files.values():
+                    f.flush()
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+    def close(self, timeout: float = 5) -> None:
+        """Writes out the queued records and stops the writer thread."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join(timeout)
+
+
+def sampled(trace_id: str, rate: float = TRACE_SAMPLE_RATE) -> bool:
+    if rate >= 1:
+        return True
+    digest = hashlib.sha256(trace_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 < rate
+
+
+def _clip(text: Any) -> str:
+    text = text if isinstance(text, str) else str(text)
+    if len(text) > TRACE_MAX_FIELD_CHARS:
+        return text[:TRACE_MAX_FIELD_CHARS] + f"... [{len(text) - TRACE_MAX_FIELD_CHARS} more chars]"
+    return text
+
+
+def _plain(value: Any) -> Any:
+    """A JSON-friendly copy of a node's input or output."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return _clip(value) if isinstance(value, str) else value
+    return _clip(value)
+
+
+def _message(message) -> dict:
+    from agent.llm import message_text
+    entry = {"role": message.type, "content": _clip(message_text(message.content))}
+    if getattr(message, "tool_calls", None):
+        entry["tool_calls"] = [{"name": call["name"], "args": _plain(call["args"])} for call in message.tool_calls]
+    return entry
+
+
+class TraceCallback(BaseCallbackHandler):
+    """Turns the callbacks of a graph run into trace records of the run's checkpoint thread.
+
+    Records the run itself, the top-level graph nodes, every chat model call
+    and every tool call, each with its duration. ``full`` adds their
+    contents.
+    """
+
+    # The handler only builds small dicts and queues them; running it inline
+    # saves async runs a thread hop per callback
+    run_inline = True
+
+    def __init__(self, writer: TraceWriter, level: str = TRACE_LEVEL, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.writer = writer
+        self.full = level == "full"
+        self.sample_rate = sample_rate
+        # run id -> (trace id, kind, name, node, start time) of runs being traced
+        self.runs: dict[UUID, tuple[str, str, str, Optional[str], float]] = {}
+        self.lock = threading.Lock()
+
+    def _start(self, kind: str, name: str, run_id: UUID, parent_run_id: Optional[UUID],
+               metadata: Optional[dict], **fields) -> None:
+        metadata = metadata or {}
+        trace_id = metadata.get("thread_id")
+        if not trace_id or not sampled(str(trace_id), self.sample_rate):
+            return
+        node = metadata.get("langgraph_node")
+        now = time.time()
+        with self.lock:
+            self.runs[run_id] = (str(trace_id), kind, name, node, now)
+        self.writer.write(str(trace_id), {
+            "ts": now, "event": f"{kind}_start", "name": name, "node": node, "run_id": str(run_id),
+            "parent_run_id": str(parent_run_id) if parent_run_id else None, **fields,
+        })
+
+    def _end(self, run_id: UUID, outcome: str, **fields) -> None:
+        with self.lock:
+            run = self.runs.pop(run_id, None)
+        if run is None:
+            return
+        trace_id, kind, name, node, started = run
+        now = time.time()
+        self.writer.write(trace_id, {
+            "ts": now, "event": f"{kind}_end", "name": name, "node": node, "run_id": str(run_id),
+            "outcome": outcome, "seconds": round(now - started, 4), **fields,
+        })
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       tags: Optional[list[str]] = None, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or ""
+        if parent_run_id is None:
+            self._start("run", name, run_id, None, metadata)
+        elif (metadata or {}).get("langgraph_node") == name and not (metadata or {}).get("checkpoint_ns") \
+                and any(tag.startswith("graph:step:") for tag in tags or ()):
+            # A node of the outer graph, not of the coder's ReAct subgraphs
+            self._start("node", name, run_id, parent_run_id, metadata,
+                        **({"input": _plain(inputs)} if self.full else {}))
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "ok", **({"output": _plain(outputs)} if self.full else {}))
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "error", error=_clip(f"{type(error).__name__}: {error}"))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                            metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        name = metadata.get("ls_model_name") or kwargs.get("name") or (serialized or {}).get("name") or "chat_model"
+        fields = {"provider": metadata.get("ls_provider")}
+        if self.full:
+            fields["messages"] = [_message(message) for batch in messages for message in batch]
+        else:
+            fields["messages"] = sum(len(batch) for batch in messages)
+        self._start("llm", name, run_id, parent_run_id, metadata, **fields)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        input_tokens, output_tokens = _token_usage(response)
+        fields = {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        if self.full:
+            fields["response"] = [_message(generation.message) if hasattr(generation, "message")
+                                  else {"content": _clip(generation.text)}
+                                  for generations in response.generations for generation in generations]
+        self._end(run_id, "ok", **fields)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "error", error=_clip(f"{type(error).__name__}: {error}"))
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                      metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._start("tool", name, run_id, parent_run_id, metadata,
+                    **({"input": _plain(kwargs.get("inputs") or input_str)} if self.full else {}))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        content = getattr(output, "content", output)
+        fields = {"output": _clip(content)} if self.full else {"output_chars": len(str(content))}
+        self._end(run_id, "ok", **fields)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "error", error=_clip(f"{type(error).__name__}: {error}"))
+
+
+trace_writer = TraceWriter()
+trace_callback = TraceCallback(trace_writer) if TRACE_LEVEL != "off" else None
+
+
+# ------------------- VIEWER ------------------- #
+
+def list_traces(root: pathlib.Path = TRACE_PATH) -> list[dict]:
+    """Trace files under ``root``, newest first."""
+    root = pathlib.Path(root)
+    if not root.is_dir():
+        return []
+    traces = [{"trace_id": path.stem, "bytes": path.stat().st_size, "modified": path.stat().st_mtime}
+              for path in root.glob("*.jsonl")]
+    return sorted(traces, key=lambda trace: trace["modified"], reverse=True)
+
+
+def read_trace(trace_id: str, root: pathlib.Path = TRACE_PATH) -> Iterator[dict]:
+    """Yields a run's records, oldest first, including the rotated files."""
+    path = pathlib.Path(trace_id) if trace_id.endswith(".jsonl") else trace_file(trace_id, root)
+    rotated = sorted(path.parent.glob(path.name + ".*"), key=lambda p: int(p.suffix[1:]), reverse=True)
+    for part in rotated + [path]:
+        with open(part, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line of a trace that is still being written
+                    continue
+
+
+def delete_trace(trace_id: str, root: pathlib.Path = TRACE_PATH) -> None:
+    """Removes a run's trace file and its rotated predecessors."""
+    path = trace_file(trace_id, root)
+    for part in [path, *path.parent.glob(path.name + ".*")]:
+        if part == path or part.suffix[1:].isdigit():
+            part.unlink(missing_ok=True)
+
+
+def format_record(record: dict, started: float) -> str:
+    kind, _, phase = record["event"].rpartition("_")
+    where = f"[{record['node']}] " if record.get("node") and record["node"] != record.get("name") else ""
+    line = f"{record['ts'] - started:9.3f}s {'>' if phase == 'start' else '<'} {kind:<4} {where}{record.get('name')}"
+    if phase == "end":
+        line += f" {record.get('outcome')} in {record.get('seconds', 0):.3f}s"
+        if kind == "llm":
+            line += f" ({record.get('input_tokens', 0)} in / {record.get('output_tokens', 0)} out tokens)"
+        if record.get("error"):
+            line += f": {record['error']}"
+    return line
+
+
+def summarize(records: list[dict]) -> dict:
+    """Time, calls and tokens per node, model and tool of a trace."""
+    summary: dict[str, dict] = {}
+    for record in records:
+        kind, _, phase = record["event"].rpartition("_")
+        if phase != "end" or kind == "run":
+            continue
+        entry = summary.setdefault(f"{kind} {record.get('name')}", {"calls": 0, "errors": 0, "seconds": 0.0,
+                                                                    "input_tokens": 0, "output_tokens": 0})
+        entry["calls"] += 1
+        entry["errors"] += record.get("outcome") != "ok"
+        entry["seconds"] = round(entry["seconds"] + record.get("seconds", 0), 4)
+        entry["input_tokens"] += record.get("input_tokens", 0)
+        entry["output_tokens"] += record.get("output_tokens", 0)
+    return summary
+
+
+def show_trace(trace_id: str, kinds: Optional[set[str]] = None, summary: bool = False, as_json: bool = False,
+               root: pathlib.Path = TRACE_PATH) -> None:
+    """Prints a trace as a timeline, as raw records or as a summary."""
+    records = list(read_trace(trace_id, root))
+    if kinds:
+        records = [record for record in records if record["event"].rpartition("_")[0] in kinds]
+    if summary:
+        print(f"{'':<40} {'calls':>6} {'errors':>6} {'seconds':>9} {'tokens in':>10} {'tokens out':>10}")
+        for name, entry in sorted(summarize(records).items(), key=lambda item: -item[1]["seconds"]):
+            print(f"{name[:40]:<40} {entry['calls']:>6} {entry['errors']:>6} {entry['seconds']:>9.3f} "
+                  f"{entry['input_tokens']:>10} {entry['output_tokens']:>10}")
+        return
+    started = records[0]["ts"] if records else 0
+    for record in records:
+        print(json.dumps(record) if as_json else format_record(record, started))
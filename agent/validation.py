@@ -0,0 +1,443 @@
+import json
+import multiprocessing
+import os
+import posixpath
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Optional
+
+# Worker processes for the checks; 0 runs them in the calling thread
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Repair rounds the coder gets for files that fail validation before the run ends anyway
+VALIDATION_MAX_REPAIRS = int(os.getenv("VALIDATION_MAX_REPAIRS", "2"))
+# Use `node --check` for JavaScript when node is installed (falls back to the built-in checker)
+VALIDATION_USE_NODE = os.getenv("VALIDATION_USE_NODE", "true").lower() in ("1", "true", "yes")
+NODE_TIMEOUT = 10
+# Diagnostics reported per file; more only make the repair prompt longer
+MAX_DIAGNOSTICS = 20
+
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+                 "source", "track", "wbr"}
+# Elements whose end tag may be left out
+OPTIONAL_END = {"html", "head", "body", "p", "li", "dt", "dd", "option", "optgroup", "tr", "td", "th",
+                "thead", "tbody", "tfoot", "colgroup", "caption", "rb", "rt", "rp"}
+REFERENCE_ATTRS = {"script": "src", "img": "src", "source": "src", "iframe": "src", "audio": "src",
+                   "video": "src", "link": "href", "a": "href"}
+# After these tokens a "/" starts a regular expression rather than a division
+REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^") | {"return", "typeof", "case", "do", "else", "in", "of",
+                                                  "new", "delete", "void", "throw", "yield", "await"}
+JS_IMPORT = re.compile(
+    r"""(?:\bimport\s+(?:[\w*{}\s,$]+?\s+from\s+)?|\bexport\s+[\w*{}\s,$]+?\s+from\s+|\bimport\s*\(\s*|\brequire\s*\(\s*)(["'])([^"'\n]+)\1"""
+)
+CSS_REFERENCE = re.compile(r"""@import\s+(?:url\()?\s*["']?([^"')\s;]+)|url\(\s*["']?([^"')\s]+)""")
+JS_EXTENSIONS = ("", ".js", ".mjs", ".cjs", ".jsx", ".ts", "/index.js")
+# Pages a browser opens first; only these must start with <!DOCTYPE html>, since
+# fragments and templates loaded into them legitimately do not
+ENTRY_PAGES = ("index.html", "index.htm")
+
+
+def is_local_reference(ref: str) -> bool:
+    ref = ref.strip()
+    return bool(ref) and not ref.startswith(("#", "//", "data:", "mailto:", "tel:", "javascript:", "{{", "${")) \
+        and not re.match(r"^[a-zA-Z][a-zA-Z0-9+.-]*:", ref)
+
+
+def resolve_reference(source: str, ref: str) -> Optional[str]:
+    """Returns the project path ``ref`` points at from file ``source``, or None if it leaves the project."""
+    ref = re.split(r"[?#]", ref.strip(), maxsplit=1)[0]
+    if ref.startswith("/"):
+        path = posixpath.normpath(ref.lstrip("/"))
+    else:
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(source), ref))
+    if path == ".." or path.startswith("../"):
+        return None
+    return path
+
+
+def _missing(source: str, ref: str, known: frozenset, extensions: tuple = ("",)) -> Optional[str]:
+    target = resolve_reference(source, ref)
+    if target is None:
+        return f"'{ref}' points outside the project"
+    if target.endswith("/") or target in ("", "."):
+        return None
+    if any(target + ext in known for ext in extensions):
+        return None
+    return f"'{ref}' does not exist (resolved to {target})"
+
+
+class _HTMLChecker(HTMLParser):
+    def __init__(self, path: str, known: frozenset):
+        super().__init__(convert_charrefs=True)
+        self.path = path
+        self.known = known
+        self.stack: list[tuple[str, int]] = []
+        self.problems: list[str] = []
+        self.scripts: list[tuple[int, str, bool]] = []
+        self.in_script: Optional[tuple[int, bool]] = None
+
+    def handle_starttag(self, tag, attrs):
+        line = self.getpos()[0]
+        attrs = dict(attrs)
+        attr = REFERENCE_ATTRS.get(tag)
+        ref = attrs.get(attr) if attr else None
+        if ref and is_local_reference(ref) and not (tag == "a" and not ref.split("?")[0].endswith((".html", ".htm"))):
+            problem = _missing(self.path, ref, self.known)
+            if problem:
+                self.problems.append(f"line {line}: <{tag} {attr}> {problem}")
+        if tag == "script" and not ref:
+            self.in_script = (line, attrs.get("type") == "module")
+        if tag not in VOID_ELEMENTS:
+            self.stack.append((tag, line))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS and self.stack and self.stack[-1][0] == tag:
+            self.stack.pop()
+
+    def handle_data(self, data):
+        if self.in_script is not None and data.strip():
+            line, module = self.in_script
+            self.scripts.append((line, data, module))
+
+    def handle_endtag(self, tag):
+        line = self.getpos()[0]
+        if tag == "script":
+            self.in_script = None
+        if tag in VOID_ELEMENTS:
+            return
+        if not any(open_tag == tag for open_tag, _ in self.stack):
+            self.problems.append(f"line {line}: closing </{tag}> has no matching opening tag")
+            return
+        while self.stack:
+            open_tag, open_line = self.stack.pop()
+            if open_tag == tag:
+                break
+            if open_tag not in OPTIONAL_END:
+                self.problems.append(f"line {open_line}: <{open_tag}> is not closed before </{tag}> on line {line}")
+
+    def finish(self) -> list[str]:
+        self.close()
+        for tag, line in self.stack:
+            if tag not in OPTIONAL_END:
+                self.problems.append(f"line {line}: <{tag}> is never closed")
+        return self.problems
+
+
+def check_html(path: str, text: str, known: frozenset) -> list[str]:
+    """Tag structure, local references (scripts, styles, images, pages) and inline scripts."""
+    checker = _HTMLChecker(path, known)
+    checker.feed(text)
+    problems = checker.finish()
+    if path in ENTRY_PAGES and "<!doctype" not in text[:1000].lower():
+        problems.append("missing <!DOCTYPE html>")
+    for line, script, _ in checker.scripts:
+        problems.extend(f"inline <script>, {problem}" for problem in check_js_syntax(script, line))
+    return problems
+
+
+def _strip_css(text: str) -> tuple[str, list[str]]:
+    """Blanks out comments and strings (keeping newlines) so braces can be counted."""
+    out, problems, idx = [], [], 0
+    while idx < len(text):
+        char = text[idx]
+        if text.startswith("/*", idx):
+            end = text.find("*/", idx + 2)
+            if end < 0:
+                problems.append(f"line {text.count(chr(10), 0, idx) + 1}: comment is never closed")
+                end = len(text)
+            out.append(re.sub(r"[^\n]", " ", text[idx:end + 2]))
+            idx = end + 2
+        elif char in "\"'":
+            end = idx + 1
+            while end < len(text) and text[end] not in (char, "\n"):
+                end += 2 if text[end] == "\\" else 1
+            if end >= len(text) or text[end] == "\n":
+                problems.append(f"line {text.count(chr(10), 0, idx) + 1}: string is never closed")
+            # Braces inside strings do not count; the quotes stay for url() matching
+            out.append(text[idx:end + 1].replace("{", " ").replace("}", " "))
+            idx = end + 1
+        else:
+            out.append(char)
+            idx += 1
+    return "".join(out), problems
+
+
+def check_css(path: str, text: str, known: frozenset) -> list[str]:
+    """Comment, string and brace balance, and url()/@import references."""
+    code, problems = _strip_css(text)
+    open_lines = []
+    line = 1
+    for char in code:
+        if char == "\n":
+            line += 1
+        elif char == "{":
+            open_lines.append(line)
+        elif char == "}":
+            if not open_lines:
+                problems.append(f"line {line}: '}}' has no matching '{{'")
+            else:
+                open_lines.pop()
+    problems.extend(f"line {opened}: '{{' is never closed" for opened in open_lines)
+    for match in CSS_REFERENCE.finditer(code):
+        ref = match.group(1) or match.group(2)
+        if is_local_reference(ref):
+            problem = _missing(path, ref, known)
+            if problem:
+                problems.append(f"line {code.count(chr(10), 0, match.start()) + 1}: {problem}")
+    return problems
+
+
+def check_js_syntax(text: str, first_line: int = 1) -> list[str]:
+    """Checks that brackets, strings, template literals, regexes and comments are balanced.
+
+    Not a full parser, but it catches the truncated and mismatched code models
+    usually produce, and works without node.
+    """
+    stack: list[tuple[str, int]] = []  # (opening char or "${", line)
+    idx, line, last = 0, first_line, ""
+    length = len(text)
+
+    def scan_string(quote: str, pos: int) -> int:
+        """Scans from just after an opening quote to the end of the string, or -1 if it is never closed.
+
+        In a template literal the scan also stops at "${"; the closing brace
+        of the expression resumes it.
+        """
+        nonlocal line
+        while pos < length:
+            char = text[pos]
+            if char == "\\":
+                pos += 2
+                continue
+            if char == "\n":
+                if quote != "`":
+                    return -1
+                line += 1
+            if char == quote:
+                return pos + 1
+            if quote == "`" and text.startswith("${", pos):
+                # The template continues after the expression's closing brace
+                stack.append(("${", line))
+                return pos + 2
+            pos += 1
+        return -1
+
+    while idx < length:
+        char = text[idx]
+        if char == "\n":
+            line += 1
+            idx += 1
+        elif char.isspace():
+            idx += 1
+        elif text.startswith("//", idx):
+            end = text.find("\n", idx)
+            idx = length if end < 0 else end
+        elif text.startswith("/*", idx):
+            end = text.find("*/", idx + 2)
+            if end < 0:
+                return [f"line {line}: comment is never closed"]
+            line += text.count("\n", idx, end)
+            idx = end + 2
+        elif char in "\"'`":
+            start_line = line
+            idx = scan_string(char, idx + 1)
+            if idx < 0:
+                return [f"line {start_line}: string is never closed"]
+            last = "string"
+        elif char == "/" and (last in REGEX_PRECEDERS or last == ""):
+            pos, in_class = idx + 1, False
+            while pos < length and text[pos] != "\n":
+                if text[pos] == "\\":
+                    pos += 2
+                    continue
+                if text[pos] == "[":
+                    in_class = True
+                elif text[pos] == "]":
+                    in_class = False
+                elif text[pos] == "/" and not in_class:
+                    break
+                pos += 1
+            if pos >= length or text[pos] != "/":
+                return [f"line {line}: regular expression is never closed"]
+            idx = pos + 1
+            while idx < length and text[idx].isalpha():
+                idx += 1
+            last = "regex"
+        elif char in "([{":
+            stack.append((char, line))
+            last = char
+            idx += 1
+        elif char in ")]}":
+            expected = {")": "(", "]": "[", "}": "{"}[char]
+            if not stack:
+                return [f"line {line}: '{char}' has no matching opening bracket"]
+            opened, opened_line = stack.pop()
+            if opened == "${" and char == "}":
+                idx = scan_string("`", idx + 1)
+                if idx < 0:
+                    return [f"line {opened_line}: template literal is never closed"]
+                last = "string"
+                continue
+            if opened != expected:
+                return [f"line {line}: '{char}' does not match '{opened}' opened on line {opened_line}"]
+            last = char
+            idx += 1
+        elif char.isalnum() or char in "_$":
+            end = idx
+            while end < length and (text[end].isalnum() or text[end] in "_$"):
+                end += 1
+            last = text[idx:end]
+            idx = end
+        else:
+            last = char
+            idx += 1
+    if stack:
+        opened, opened_line = stack[-1]
+        what = "template expression" if opened == "${" else f"'{opened}'"
+        return [f"line {opened_line}: {what} is never closed"]
+    return []
+
+
+def _node_check(node: str, text: str, module: bool) -> Optional[list[str]]:
+    # node picks the module system from the extension
+    with tempfile.NamedTemporaryFile("w", suffix=".mjs" if module else ".cjs", delete=False,
+                                     encoding="utf-8") as f:
+        f.write(text)
+    try:
+        result = subprocess.run([node, "--check", f.name], capture_output=True, text=True, timeout=NODE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    finally:
+        os.unlink(f.name)
+    if result.returncode == 0:
+        return []
+    # node prints "<file>:<line>", the offending line, a caret and then the error
+    output = result.stderr.replace(f.name, "")
+    line = re.search(r"^:(\d+)", output, re.M)
+    error = next((l for l in output.splitlines() if re.match(r"^\w*Error\b", l)), output.strip()[:200])
+    return [f"line {line.group(1)}: {error}" if line else error]
+
+
+def node_syntax_check(text: str) -> Optional[list[str]]:
+    """Syntax check with ``node --check``; None when node cannot be used.
+
+    Files are checked as ES modules when they look like one and as classic
+    scripts otherwise; a file passes if it parses as either.
+    """
+    node = shutil.which("node") if VALIDATION_USE_NODE else None
+    if node is None:
+        return None
+    module = bool(re.search(r"^\s*(import|export)\b", text, re.M))
+    problems = _node_check(node, text, module)
+    if problems and _node_check(node, text, not module) == []:
+        return []
+    return problems
+
+
+def check_js(path: str, text: str, known: frozenset) -> list[str]:
+    """Syntax (node --check, or the built-in checker) and relative imports."""
+    problems = node_syntax_check(text)
+    if problems is None:
+        problems = check_js_syntax(text)
+    for match in JS_IMPORT.finditer(text):
+        ref = match.group(2)
+        if ref.startswith((".", "/")):
+            problem = _missing(path, ref, known, JS_EXTENSIONS)
+            if problem:
+                problems.append(f"line {text.count(chr(10), 0, match.start()) + 1}: import {problem}")
+    return problems
+
+
+def check_json(path: str, text: str, known: frozenset) -> list[str]:
+    try:
+        json.loads(text)
+    except json.JSONDecodeError as e:
+        return [f"line {e.lineno}: {e.msg}"]
+    return []
+
+
+def check_python(path: str, text: str, known: frozenset) -> list[str]:
+    try:
+        compile(text, path, "exec")
+    except SyntaxError as e:
+        return [f"line {e.lineno}: {e.msg}"]
+    return []
+
+
+CHECKERS = {
+    ".html": check_html,
+    ".htm": check_html,
+    ".css": check_css,
+    ".js": check_js,
+    ".mjs": check_js,
+    ".cjs": check_js,
+    ".json": check_json,
+    ".py": check_python,
+}
+
+
+def check_file(path: str, text: str, known: frozenset) -> list[str]:
+    """Runs the checker for the file's type; files of other types always pass."""
+    checker = CHECKERS.get(posixpath.splitext(path)[1].lower())
+    if checker is None:
+        return []
+    try:
+        problems = checker(path, text, known)
+    except Exception as e:
+        problems = [f"could not be checked: {e}"]
+    if not text.strip():
+        problems.insert(0, "file is empty")
+    return problems[:MAX_DIAGNOSTICS]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Created once and reused, so worker start-up is paid on the first validation only.
+            # Workers are not forked from this process: the server is multithreaded, and a fork
+            # can copy a lock another thread holds
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=VALIDATION_WORKERS,
+                                        mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def validate_files(files: dict[str, str], known: Optional[set[str]] = None) -> dict[str, list[str]]:
+    """Checks every file in parallel; returns the diagnostics of the files that failed.
+
+    ``files`` maps project paths to their text; ``known`` is every path in the
+    project (defaults to the keys of ``files``), used to resolve references.
+    """
+    known = frozenset(known if known is not None else files)
+    paths = [path for path in sorted(files) if posixpath.splitext(path)[1].lower() in CHECKERS]
+    if VALIDATION_WORKERS <= 0 or len(paths) <= 1:
+        results = [check_file(path, files[path], known) for path in paths]
+    else:
+        pool = _get_pool()
+        futures = [pool.submit(check_file, path, files[path], known) for path in paths]
+        results = [future.result() for future in futures]
+    return {path: problems for path, problems in zip(paths, results) if problems}
+
+
+def validate_workspace(workspace) -> dict[str, list[str]]:
+    """Validates the text files of an in-memory workspace, including unflushed changes."""
+    known = set(workspace.paths())
+    files = {}
+    for path in known:
+        if posixpath.splitext(path)[1].lower() not in CHECKERS:
+            continue
+        try:
+            files[path] = workspace.read(path)
+        except UnicodeDecodeError:
+            continue
+    return validate_files(files, known)
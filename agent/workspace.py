@@ -0,0 +1,265 @@
+import hashlib
+import os
+import pathlib
+import posixpath
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Workspaces kept open in memory; the least recently used is flushed and dropped
+MAX_OPEN_WORKSPACES = int(os.getenv("MAX_OPEN_WORKSPACES", "32"))
+
+
+def normalize_relative(path: str) -> str:
+    """Normalizes a project-relative path and refuses paths that leave the project root.
+
+    Returns "" for the root itself. This is pure string work, so sandbox checks
+    cost no syscalls.
+    """
+    path = (path or ".").replace("\\", "/")
+    if path.startswith("/") or (len(path) > 1 and path[1] == ":"):
+        raise ValueError("Attempt to write outside project root")
+    normalized = posixpath.normpath(path)
+    if normalized == ".":
+        return ""
+    if normalized == ".." or normalized.startswith("../"):
+        raise ValueError("Attempt to write outside project root")
+    return normalized
+
+
+class Workspace:
+    """In-memory view of one project directory with write-back to disk.
+
+    The directory is scanned once when the workspace is opened. After that,
+    reads are served from memory (a file is read from disk at most once), the
+    path index is updated in place on every write, and changes reach disk only
+    when ``flush`` is called, e.g. at the end of a coder step.
+
+    Every change bumps a revision counter so clients can ask for what changed
+    since a revision. The counter starts from the clock, so a reopened
+    workspace never reuses revisions handed out before.
+    """
+
+    def __init__(self, root: pathlib.Path):
+        self.root = pathlib.Path(root)
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.index: set[str] = set()
+        self.contents: dict[str, str] = {}
+        self.dirty: set[str] = set()
+        self.deleted: set[str] = set()
+        self.revision = time.time_ns() // 1000
+        self.revisions: dict[str, int] = {}
+        self.removed: dict[str, int] = {}
+        self.hashes: dict[str, str] = {}
+        self.scan()
+
+    def scan(self) -> None:
+        """Rebuilds the index from disk, e.g. after a shell command changed files."""
+        with self.lock:
+            index = set()
+            if self.root.is_dir():
+                self._walk(self.root, "", index)
+            # Unflushed changes win over what is on disk
+            index = (index - self.deleted) | self.dirty
+            # Files may have changed on disk, so everything counts as a new revision
+            self.revision += 1
+            for path in self.index - index:
+                self.removed[path] = self.revision
+            self.revisions = {path: self.revision for path in index}
+            self.index = index
+            self.contents = {path: text for path, text in self.contents.items() if path in self.dirty}
+            self.hashes = {path: digest for path, digest in self.hashes.items() if path in self.dirty}
+
+    def _walk(self, directory: pathlib.Path, prefix: str, index: set[str]) -> None:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            rel = prefix + entry.name
+            if entry.is_symlink():
+                # A link is only part of the project if it resolves to a file inside it;
+                # linked directories are not descended into
+                if entry.is_file() and not self._escapes(rel):
+                    index.add(rel)
+            elif entry.is_dir():
+                self._walk(pathlib.Path(entry.path), rel + "/", index)
+            elif entry.is_file():
+                index.add(rel)
+
+    def _escapes(self, rel: str) -> bool:
+        """Whether the file resolves, through symlinks, to a place outside the project root."""
+        root = os.path.realpath(self.root)
+        return os.path.commonpath([root, os.path.realpath(self.disk_path(rel))]) != root
+
+    def disk_path(self, rel_path: str) -> pathlib.Path:
+        return self.root / rel_path if rel_path else self.root
+
+    def exists(self, path: str) -> bool:
+        with self.lock:
+            return normalize_relative(path) in self.index
+
+    def is_dir(self, path: str) -> bool:
+        rel = normalize_relative(path)
+        if not rel:
+            return True
+        prefix = rel + "/"
+        with self.lock:
+            return any(p.startswith(prefix) for p in self.index)
+
+    def read(self, path: str) -> Optional[str]:
+        """Returns the file's text, or None if it does not exist."""
+        rel = normalize_relative(path)
+        with self.lock:
+            if rel not in self.index:
+                return None
+            if rel not in self.contents:
+                # The link may have been changed on disk since the scan
+                if self._escapes(rel):
+                    return None
+                with open(self.disk_path(rel), "r", encoding="utf-8") as f:
+                    self.contents[rel] = f.read()
+            return self.contents[rel]
+
+    def write(self, path: str, content: str) -> str:
+        """Stores new file content in memory and returns the normalized path."""
+        rel = normalize_relative(path)
+        if not rel:
+            raise ValueError("Cannot write to the project root")
+        with self.lock:
+            if rel in self.index and self.read(rel) == content:
+                return rel
+            self.contents[rel] = content
+            self.index.add(rel)
+            self.dirty.add(rel)
+            self.deleted.discard(rel)
+            self.hashes.pop(rel, None)
+            self.removed.pop(rel, None)
+            self.revision += 1
+            self.revisions[rel] = self.revision
+        return rel
+
+    def delete(self, path: str) -> bool:
+        rel = normalize_relative(path)
+        with self.lock:
+            if rel not in self.index:
+                return False
+            self.index.discard(rel)
+            self.contents.pop(rel, None)
+            self.dirty.discard(rel)
+            self.deleted.add(rel)
+            self.hashes.pop(rel, None)
+            self.revisions.pop(rel, None)
+            self.revision += 1
+            self.removed[rel] = self.revision
+            return True
+
+    def content_hash(self, path: str) -> Optional[str]:
+        """Returns the sha256 of a file's content, computed once per revision."""
+        rel = normalize_relative(path)
+        with self.lock:
+            if rel not in self.hashes:
+                content = self.read(rel)
+                if content is None:
+                    return None
+                self.hashes[rel] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            return self.hashes[rel]
+
+    def changes_since(self, revision: int) -> tuple[list[str], list[str]]:
+        """Returns the files changed and the files deleted after ``revision``."""
+        with self.lock:
+            changed = sorted(p for p, rev in self.revisions.items() if rev > revision)
+            deleted = sorted(p for p, rev in self.removed.items() if rev > revision)
+            return changed, deleted
+
+    def paths(self, directory: str = ".") -> list[str]:
+        rel = normalize_relative(directory)
+        prefix = rel + "/" if rel else ""
+        with self.lock:
+            return sorted(p for p in self.index if p.startswith(prefix))
+
+    def flush(self) -> list[str]:
+        """Writes pending changes to disk in one batch and returns the paths written."""
+        with self.flush_lock:
+            return self._flush()
+
+    def _flush(self) -> list[str]:
+        with self.lock:
+            dirty = {path: self.contents[path] for path in self.dirty}
+            deleted = set(self.deleted)
+            self.dirty.clear()
+            self.deleted.clear()
+
+        root = self.root.resolve()
+        for rel, content in dirty.items():
+            p = self.disk_path(rel)
+            p.parent.mkdir(parents=True, exist_ok=True)
+            # Symlinks on disk (the file's or a directory's) could still point elsewhere
+            if root not in p.resolve().parents:
+                raise ValueError("Attempt to write outside project root")
+            with open(p, "w", encoding="utf-8") as f:
+                f.write(content)
+        for rel in deleted:
+            p = self.disk_path(rel)
+            if p.is_file():
+                p.unlink()
+        return sorted(dirty)
+
+
+_workspaces: "OrderedDict[pathlib.Path, Workspace]" = OrderedDict()
+# Roots of running jobs; never evicted, or the job would keep writing to a workspace no one flushes
+_pinned: set[pathlib.Path] = set()
+_workspaces_lock = threading.Lock()
+
+
+def open_workspace(root: pathlib.Path) -> Workspace:
+    """Returns the shared in-memory workspace for a project root, opening it if needed."""
+    root = pathlib.Path(root)
+    with _workspaces_lock:
+        workspace = _workspaces.get(root)
+        if workspace is not None:
+            _workspaces.move_to_end(root)
+            return workspace
+        workspace = _workspaces[root] = Workspace(root)
+        # Pinned workspaces do not count towards the limit
+        unpinned = [key for key in _workspaces if key not in _pinned]
+        evicted = [_workspaces.pop(key) for key in unpinned[:max(len(unpinned) - MAX_OPEN_WORKSPACES, 0)]]
+    for old in evicted:
+        old.flush()
+    return workspace
+
+
+def pin_workspace(root: pathlib.Path) -> None:
+    """Keeps a root's workspace open until close_workspace, whatever else is opened meanwhile."""
+    with _workspaces_lock:
+        _pinned.add(pathlib.Path(root))
+
+
+def close_workspace(root: pathlib.Path) -> None:
+    """Flushes a workspace and drops it from memory."""
+    root = pathlib.Path(root)
+    with _workspaces_lock:
+        _pinned.discard(root)
+        workspace = _workspaces.pop(root, None)
+    if workspace is not None:
+        workspace.flush()
+
+
+def copy_workspace(source: pathlib.Path, target: pathlib.Path) -> None:
+    """Copies a project, including changes of an open workspace not yet flushed, to a new root."""
+    source, target = pathlib.Path(source), pathlib.Path(target)
+    with _workspaces_lock:
+        workspace = _workspaces.get(source)
+    if workspace is not None:
+        workspace.flush()
+    if source.is_dir():
+        # Symlinks are left out: copied as links they could point outside the
+        # new project, and followed they would copy outside files into it
+        shutil.copytree(source, target, dirs_exist_ok=True,
+                        ignore=lambda directory, names: [name for name in names
+                                                         if os.path.islink(os.path.join(directory, name))])
+    else:
+        target.mkdir(parents=True, exist_ok=True)
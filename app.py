@@ -1,9 +1,30 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from agent.graph import agent
+from agent.graph import agent, checkpointer, run_config
+from agent.events import EventBus, format_sse
+from agent.jobs import JOB_RUNNER, AsyncJobManager, JobManager, JobCancelled, QueueFullError
+from agent.jobstore import ACTIVE_STATUSES, JobStore
+from agent.bundle import (ARCHIVE_FORMATS, build_manifest, compress, etag_matches, iter_archive,
+                          manifest_etag, manifest_json, negotiate_encoding)
+from agent.cache import llm_cache
+from agent.preview import LIVE_RELOAD_SCRIPT, load_preview_file, preview_cache
+from agent import metrics
+from agent.ratelimit import rate_limit_stats
+from agent.routing import router_stats
+from agent.tools import PROJECT_ROOT, use_project_root, workspace_for
+from agent.incremental import previous_run
+from agent.artifacts import get_artifact_store
+from agent.tracing import delete_trace
+from agent.workspace import (Workspace, close_workspace, copy_workspace, normalize_relative, open_workspace,
+                             pin_workspace)
 from dotenv import load_dotenv
+import asyncio
+import html
 import os
+import posixpath
+import shutil
 import threading
+import time
 import traceback
 import uuid
 
@@ -13,66 +34,241 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 
-# Store generation results and status
-generation_status = {}
-generation_lock = threading.Lock()
+# Bounded worker pool and queue for generation jobs (JOB_WORKERS / JOB_QUEUE_SIZE)
+job_manager = AsyncJobManager() if JOB_RUNNER == "async" else JobManager()
+
+# Progress events per job, streamed to clients over SSE
+event_bus = EventBus()
+SSE_KEEPALIVE_SECONDS = 15
+
+# Statuses a job can be resumed from, using its last checkpoint
+RESUMABLE_STATUSES = ("error", "cancelled", "interrupted")
+
+
+def remove_job_files(request_ids):
+    """Delete the project directories and trace files of evicted jobs"""
+    for request_id in request_ids:
+        root = workspace_for(request_id)
+        close_workspace(root)
+        shutil.rmtree(root, ignore_errors=True)
+        delete_trace(request_id)
+
+
+def forget_jobs(request_ids):
+    """Drop the event logs, checkpoints, snapshots, files and traces of jobs evicted from the job store"""
+    for request_id in request_ids:
+        event_bus.discard(request_id)
+        checkpointer.delete_thread(request_id)
+    artifact_store = get_artifact_store()
+    artifact_store.delete_runs(request_ids)
+    # Deleting files and scanning the blobs takes a while; this runs inside /api/generate
+    threading.Thread(target=remove_job_files, args=(request_ids,), name="job-cleanup", daemon=True).start()
+    artifact_store.schedule_garbage_collection()
+
+
+# Store generation results and status (SQLite-backed, with TTL/LRU eviction)
+job_store = JobStore(on_evict=forget_jobs)
+
+
+def start_server():
+    """Prepare the job store when a server process starts (not when app is merely imported).
+
+    Jobs a previous server process left queued or processing can no longer
+    finish and are marked interrupted, so they can be resumed.
+    """
+    job_store.mark_interrupted()
+
+# Queue occupancy is read from the job manager whenever /metrics is scraped
+metrics.jobs_queued.set_function(lambda: job_manager.stats()["queued"])
+metrics.jobs_running.set_function(lambda: job_manager.stats()["running"])
 
 @app.route("/", methods=["GET"])
 def home():
     return "Server is running ✅"
 # ------------------- CORE LOGIC ------------------- #
 
-def run_agent(prompt, request_id):
-    """Run the agent in a background thread"""
-    try:
-        with generation_lock:
-            generation_status[request_id] = {
-                "status": "processing",
-                "message": "Analyzing your requirements...",
-                "result": None,
-                "error": None
+def project_dir_for(request_id=None):
+    """Return the project directory for a job, or the shared legacy directory"""
+    if request_id:
+        return str(workspace_for(request_id))
+    return str(PROJECT_ROOT)
+
+
+def project_workspace(request_id=None):
+    """Return the workspace of a job, or of the shared legacy directory as it is on disk right now.
+
+    Raises LookupError for a job the store does not know, so unknown ids
+    cannot fill the open workspaces and push out those of running jobs.
+    """
+    if request_id:
+        root = workspace_for(request_id)
+        if not job_store.get(request_id):
+            raise LookupError("Request not found")
+        return open_workspace(root)
+    # The CLI writes the shared directory from another process, so a cached
+    # workspace would go stale; this one is scanned for every request
+    return Workspace(PROJECT_ROOT)
+
+
+def update_status(request_id, **fields):
+    """Update a job's status entry and publish it to the job's event stream"""
+    status = job_store.update(request_id, **fields)
+    snapshot = {key: status.get(key) for key in ("status", "message", "error")}
+    event_bus.publish(request_id, "status", **snapshot)
+
+
+def node_event(node, update):
+    """Describe a finished graph node as a progress event and status message"""
+    update = update or {}
+    if node == "planner" and update.get("plan"):
+        plan = update["plan"]
+        return {"node": node, "name": plan.name, "files": len(plan.files)}, "Designing implementation tasks..."
+    if node == "architect" and update.get("task_plan"):
+        steps = len(update["task_plan"].implementation_steps)
+        return {"node": node, "steps": steps}, f"Writing code ({steps} steps)..."
+    if node == "coder" and update.get("status") == "DONE":
+        return {"node": node, "status": "DONE"}, "Checking generated files..."
+    if node == "validator":
+        failed = sorted(update.get("validation") or {})
+        if update.get("status") == "REPAIRING":
+            return {"node": node, "status": "REPAIRING", "failed": failed}, f"Repairing {len(failed)} file(s) that failed checks..."
+        return {"node": node, "status": "DONE", "failed": failed}, "Finalizing project files..."
+    if node == "coder" and update.get("coder_state"):
+        coder_state = update["coder_state"]
+        total = len(coder_state.task_plan.implementation_steps)
+        done = coder_state.current_step_idx
+        return {"node": node, "completed": done, "steps": total}, f"Writing code ({done}/{total} steps done)..."
+    return {"node": node}, None
+
+
+def start_run(prompt, request_id, no_cache=False, resume=False, base_request_id=None, previous=None):
+    """Mark a job as processing and return its graph input (None to resume from the checkpoint)"""
+    # Held open until end_run closes it
+    pin_workspace(workspace_for(request_id))
+    if resume:
+        update_status(request_id, status="processing", message="Resuming generation...", error=None)
+        return None
+    update_status(request_id, status="processing", message="Planning project structure...")
+    graph_input = {"user_prompt": prompt, "no_cache": no_cache}
+    if base_request_id:
+        copy_workspace(workspace_for(base_request_id), workspace_for(request_id))
+        graph_input["previous"] = previous
+    return graph_input
+
+
+def publish_chunk(request_id, namespace, mode, chunk):
+    """Forward one streamed graph chunk to the job's events; returns the state of "values" chunks"""
+    if mode == "custom":
+        event_bus.publish(request_id, chunk.pop("event", "progress"), **chunk)
+    elif namespace:
+        return None
+    elif mode == "values":
+        return chunk
+    else:
+        for node, update in chunk.items():
+            data, message = node_event(node, update)
+            event_bus.publish(request_id, "node_finished", **data)
+            if message:
+                update_status(request_id, message=message)
+    return None
+
+
+def finish_run(request_id, result):
+    """Record the outcome of a run that completed"""
+    # Convert result to JSON-serializable format
+    serializable_result = None
+    if result:
+        try:
+            # Only keep basic information, not complex objects
+            serializable_result = {
+                "status": result.get("status", "completed"),
+                "user_prompt": result.get("user_prompt", ""),
+                # Files that still fail the local checks after the repair rounds
+                "validation": result.get("validation") or {},
+                "message": "Project generated successfully"
             }
+        except Exception as e:
+            print(f"Warning: Could not serialize result: {e}")
+            serializable_result = {"message": "Project generated successfully"}
 
-        # Update status for planning phase
-        with generation_lock:
-            generation_status[request_id]["message"] = "Planning project structure..."
-
-        result = agent.invoke({"user_prompt": prompt}, {"recursion_limit": 100})
-
-        # Update status for completion
-        with generation_lock:
-            generation_status[request_id]["message"] = "Finalizing project files..."
-
-        # Convert result to JSON-serializable format
-        serializable_result = None
-        if result:
-            try:
-                # Only keep basic information, not complex objects
-                serializable_result = {
-                    "status": result.get("status", "completed"),
-                    "user_prompt": result.get("user_prompt", ""),
-                    "message": "Project generated successfully"
-                }
-            except Exception as e:
-                print(f"Warning: Could not serialize result: {e}")
-                serializable_result = {"message": "Project generated successfully"}
-
-        with generation_lock:
-            generation_status[request_id] = {
-                "status": "completed",
-                "message": "Project generated successfully!",
-                "result": serializable_result,
-                "error": None
-            }
+    update_status(request_id, status="completed", message="Project generated successfully!",
+                  result=serializable_result, error=None)
+
+
+def fail_run(request_id, error):
+    """Record a run that was cancelled or raised"""
+    if isinstance(error, JobCancelled):
+        update_status(request_id, status="cancelled", message="Generation cancelled", result=None, error=None)
+        return
+    update_status(request_id, status="error", message="Failed to generate project", result=None, error=str(error))
+    traceback.print_exception(error)
+
+
+def end_run(request_id, started):
+    # Write anything still pending and release the job's in-memory files
+    close_workspace(workspace_for(request_id))
+    final = job_store.get(request_id) or {}
+    metrics.job_duration.observe(time.perf_counter() - started, status=final.get("status", "unknown"))
+
+
+def run_agent(prompt, request_id, no_cache=False, resume=False, base_request_id=None, previous=None):
+    """Run the agent on a job worker inside the job's own workspace.
+
+    With resume=True the run continues from the job's last checkpoint
+    instead of starting over from the planner. With base_request_id the job
+    starts from a copy of that job's project and, given its ``previous`` run,
+    only regenerates the files affected by the changes.
+    """
+    started = time.perf_counter()
+    try:
+        graph_input = start_run(prompt, request_id, no_cache, resume, base_request_id, previous)
+        # Stream node updates plus the custom events emitted by the coder and
+        # tools (including the ones inside the ReAct subgraphs).
+        result = None
+        with use_project_root(workspace_for(request_id)):
+            for namespace, mode, chunk in agent.stream(
+                graph_input,
+                run_config(request_id),
+                stream_mode=["updates", "custom", "values"],
+                subgraphs=True
+            ):
+                result = publish_chunk(request_id, namespace, mode, chunk) or result
+        finish_run(request_id, result)
     except Exception as e:
-        with generation_lock:
-            generation_status[request_id] = {
-                "status": "error",
-                "message": "Failed to generate project",
-                "result": None,
-                "error": str(e)
-            }
-        traceback.print_exc()
+        fail_run(request_id, e)
+    finally:
+        end_run(request_id, started)
+
+
+async def run_agent_async(prompt, request_id, no_cache=False, resume=False, base_request_id=None, previous=None):
+    """run_agent for the async job runner: the graph runs with astream on the job loop.
+
+    Model calls are awaited instead of blocking a thread, so many jobs can
+    wait on their providers at once; disk and SQLite work is handed to
+    worker threads.
+    """
+    started = time.perf_counter()
+    try:
+        graph_input = await asyncio.to_thread(start_run, prompt, request_id, no_cache, resume,
+                                              base_request_id, previous)
+        result = None
+        with use_project_root(workspace_for(request_id)):
+            async for namespace, mode, chunk in agent.astream(
+                graph_input,
+                run_config(request_id),
+                stream_mode=["updates", "custom", "values"],
+                subgraphs=True
+            ):
+                result = publish_chunk(request_id, namespace, mode, chunk) or result
+        finish_run(request_id, result)
+    except Exception as e:
+        fail_run(request_id, e)
+    finally:
+        await asyncio.to_thread(end_run, request_id, started)
+
+
+# Generation jobs run on threads, or with JOB_RUNNER=async as tasks on one event loop
+run_job = run_agent_async if JOB_RUNNER == "async" else run_agent
 
 # ------------------- ROUTES ------------------- #
 
@@ -81,28 +277,98 @@ def generate_project():
     """Endpoint to generate a project from a prompt"""
     data = request.json
     prompt = data.get('prompt', '')
+    # Skip the planner/architect response cache for this request
+    no_cache = bool(data.get('no_cache', False))
+
+    # Iterate on the project of an earlier job instead of starting from scratch
+    base_request_id = data.get('base_request_id')
 
     if not prompt:
         return jsonify({"error": "Prompt is required"}), 400
 
+    previous = None
+    if base_request_id:
+        try:
+            workspace_for(base_request_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        base_status = job_store.get(base_request_id)
+        if not base_status:
+            return jsonify({"error": "Base request not found"}), 404
+        if base_status["status"] != "completed":
+            return jsonify({"error": f"Cannot build on a job that is {base_status['status']}"}), 409
+        previous = previous_run(agent.get_state(run_config(base_request_id)).values)
+        if previous is None:
+            return jsonify({"error": "The base request has no stored plan"}), 409
+
     request_id = str(uuid.uuid4())
 
-    thread = threading.Thread(target=run_agent, args=(prompt, request_id))
-    thread.daemon = True
-    thread.start()
+    job_store.evict()
+    update_status(request_id, status="queued", message="Waiting for a free worker...",
+                  prompt=prompt, no_cache=no_cache, base_request_id=base_request_id)
+
+    try:
+        position = job_manager.submit(request_id, run_job, prompt, request_id, no_cache, False,
+                                      base_request_id, previous)
+    except QueueFullError as e:
+        job_store.delete(request_id)
+        event_bus.discard(request_id)
+        return jsonify({"error": str(e)}), 429
 
     return jsonify({
         "request_id": request_id,
-        "status": "processing",
-        "message": "Generation started"
+        "status": "queued" if position > 0 else "processing",
+        "queue_position": position,
+        "message": "Generation queued" if position > 0 else "Generation started"
+    })
+
+
+@app.route('/api/cancel/<request_id>', methods=['POST'])
+def cancel_generation(request_id):
+    """Cancel a queued or running generation request"""
+    if not job_manager.cancel(request_id):
+        return jsonify({"error": "Request not found or already finished"}), 404
+
+    status = job_store.get(request_id)
+    if status and status["status"] == "queued":
+        update_status(request_id, status="cancelled", message="Generation cancelled")
+
+    return jsonify({"request_id": request_id, "message": "Cancellation requested"})
+
+
+@app.route('/api/resume/<request_id>', methods=['POST'])
+def resume_generation(request_id):
+    """Restart a failed, cancelled or interrupted generation from its last completed node"""
+    status = job_store.get(request_id)
+    if not status:
+        return jsonify({"error": "Request not found"}), 404
+    if status["status"] not in RESUMABLE_STATUSES:
+        return jsonify({"error": f"Cannot resume a job that is {status['status']}"}), 409
+
+    snapshot = agent.get_state(run_config(request_id))
+    if not snapshot.next:
+        return jsonify({"error": "No checkpoint to resume from"}), 409
+
+    update_status(request_id, status="queued", message=f"Waiting to resume at {snapshot.next[0]}...")
+    try:
+        position = job_manager.submit(request_id, run_job, None, request_id, False, True)
+    except QueueFullError as e:
+        update_status(request_id, status=status["status"], message=status["message"])
+        return jsonify({"error": str(e)}), 429
+
+    return jsonify({
+        "request_id": request_id,
+        "status": "queued" if position > 0 else "processing",
+        "queue_position": position,
+        "resume_from": snapshot.next[0],
+        "message": "Resume queued" if position > 0 else "Resume started"
     })
 
 
 @app.route('/api/status/<request_id>', methods=['GET'])
 def get_status(request_id):
     """Check the status of a generation request"""
-    with generation_lock:
-        status = generation_status.get(request_id)
+    status = job_store.get(request_id)
 
     if not status:
         return jsonify({"error": "Request not found"}), 404
@@ -113,6 +379,9 @@ def get_status(request_id):
         "message": status.get("message", ""),
         "error": status.get("error", None)
     }
+
+    if safe_status["status"] == "queued":
+        safe_status["queue_position"] = job_manager.position(request_id)
     
     # Only include result if it's serializable
     if status.get("result") and isinstance(status["result"], dict):
@@ -121,40 +390,145 @@ def get_status(request_id):
     return jsonify(safe_status)
 
 
+@app.route('/api/events/<request_id>', methods=['GET'])
+def stream_events(request_id):
+    """Stream a generation's progress events as Server-Sent Events.
+
+    Clients resume after a reconnect by sending the Last-Event-ID header
+    (or a last_event_id query parameter; "latest" skips the history).
+    """
+    log = event_bus.get(request_id)
+    if log is None:
+        # Jobs from before a restart have no event history; replay their last status
+        status = job_store.get(request_id)
+        if status is None:
+            return jsonify({"error": "Request not found"}), 404
+        event_bus.publish(request_id, "status", **{key: status.get(key) for key in ("status", "message", "error")})
+        log = event_bus.get(request_id)
+
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    if last_id == 'latest':
+        # Only new events, e.g. for the preview's live reload
+        last_id = log.last_id
+    try:
+        last_id = int(last_id)
+    except ValueError:
+        last_id = 0
+
+    def generate():
+        nonlocal last_id
+        yield "retry: 3000\n\n"
+        while True:
+            entries = log.read(last_id, timeout=SSE_KEEPALIVE_SECONDS)
+            for entry in entries:
+                last_id = entry["id"]
+                yield format_sse(entry)
+            if log.closed and not log.read(last_id):
+                return
+            if not entries:
+                yield ": keepalive\n\n"
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
 @app.route('/api/files', methods=['GET'])
 def list_project_files():
     """List all files in the generated project directory"""
-    project_dir = os.path.join(os.path.dirname(__file__), 'agent', 'generated_project')
+    try:
+        project_dir = project_dir_for(request.args.get('request_id'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     if not os.path.exists(project_dir):
         return jsonify({"files": []})
 
-    files = []
-    for root, dirs, filenames in os.walk(project_dir):
-        for filename in filenames:
-            filepath = os.path.join(root, filename)
-            rel_path = os.path.relpath(filepath, project_dir)
-            files.append({
-                "name": filename,
-                "path": rel_path.replace('\\', '/'),
-                "fullPath": filepath
-            })
+    try:
+        workspace = project_workspace(request.args.get('request_id'))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    files = [{
+        "name": posixpath.basename(rel_path),
+        "path": rel_path,
+        "fullPath": str(workspace.disk_path(rel_path))
+    } for rel_path in workspace.paths()]
 
     return jsonify({"files": files})
 
 
+@app.route('/api/bundle', methods=['GET'])
+def get_project_bundle():
+    """Return every project file in one response: JSON with contents, or a zip/tar.gz download.
+
+    Query parameters: request_id, format (json, zip or tar.gz) and since, a
+    revision from an earlier bundle to only get what changed after it.
+    Responses carry an ETag over the file hashes and honour If-None-Match.
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt != 'json' and fmt not in ARCHIVE_FORMATS:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+
+    since = request.args.get('since')
+    try:
+        since = int(since) if since is not None else None
+        workspace = project_workspace(request.args.get('request_id'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+
+    manifest = build_manifest(workspace, since)
+    # Archives are compressed already; JSON is sent in the encoding the client accepts
+    encoding = None if fmt in ARCHIVE_FORMATS else negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    etag = manifest_etag(manifest, fmt, encoding)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Project-Revision": str(manifest["revision"])}
+    if fmt not in ARCHIVE_FORMATS:
+        headers["Vary"] = "Accept-Encoding"
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+
+    if fmt in ARCHIVE_FORMATS:
+        name = f"project-{request.args.get('request_id') or 'latest'}.{fmt}"
+        headers["Content-Disposition"] = f'attachment; filename="{name}"'
+        mimetype = 'application/zip' if fmt == 'zip' else 'application/gzip'
+        return Response(iter_archive(manifest, fmt), mimetype=mimetype, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(compress(manifest_json(manifest), encoding), mimetype='application/json', headers=headers)
+
+
+def workspace_file(filepath):
+    """Resolve the request's workspace and the normalized path of a file in it"""
+    workspace = project_workspace(request.args.get('request_id'))
+    return workspace, normalize_relative(filepath)
+
+
+def publish_file_change(event, rel_path):
+    """Tell the job's live previews that a file was edited through the API"""
+    request_id = request.args.get('request_id')
+    if request_id and event_bus.get(request_id):
+        event_bus.publish(request_id, event, path=rel_path)
+
+
 @app.route('/api/file/<path:filepath>', methods=['GET'])
 def get_file_content(filepath):
     """Get the content of a specific file"""
-    project_dir = os.path.join(os.path.dirname(__file__), 'agent', 'generated_project')
-    full_path = os.path.join(project_dir, filepath)
+    try:
+        workspace, rel_path = workspace_file(filepath)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
 
-    if not os.path.exists(full_path):
+    if not workspace.exists(rel_path):
         return jsonify({"error": "File not found"}), 404
 
     try:
-        with open(full_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = workspace.read(rel_path)
         return jsonify({"path": filepath, "content": content})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -163,18 +537,23 @@ def get_file_content(filepath):
 @app.route('/api/file/<path:filepath>', methods=['PUT'])
 def update_file_content(filepath):
     """Update the content of a specific file"""
-    project_dir = os.path.join(os.path.dirname(__file__), 'agent', 'generated_project')
-    full_path = os.path.join(project_dir, filepath)
+    try:
+        workspace, rel_path = workspace_file(filepath)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
 
-    if not os.path.exists(full_path):
+    if not workspace.exists(rel_path):
         return jsonify({"error": "File not found"}), 404
 
     data = request.json
     content = data.get('content', '')
 
     try:
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        workspace.write(rel_path, content)
+        workspace.flush()
+        publish_file_change("file_written", rel_path)
         return jsonify({"message": "File updated successfully", "path": filepath})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -183,39 +562,54 @@ def update_file_content(filepath):
 @app.route('/api/file/<path:filepath>', methods=['DELETE'])
 def delete_file(filepath):
     """Delete a specific file"""
-    project_dir = os.path.join(os.path.dirname(__file__), 'agent', 'generated_project')
-    full_path = os.path.join(project_dir, filepath)
+    try:
+        workspace, rel_path = workspace_file(filepath)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
 
-    if not os.path.exists(full_path):
+    if not workspace.exists(rel_path):
         return jsonify({"error": "File not found"}), 404
 
     try:
-        os.remove(full_path)
+        workspace.delete(rel_path)
+        workspace.flush()
+        publish_file_change("file_deleted", rel_path)
         return jsonify({"message": "File deleted successfully", "path": filepath})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/preview/')
-@app.route('/preview/<path:filepath>')
-def preview_project(filepath='index.html'):
-    """Serve generated project files for preview"""
-    project_dir = os.path.join(os.path.dirname(__file__), 'agent', 'generated_project')
+def serve_preview(project_dir, filepath, base_url, workspace=None, live_reload=None):
+    """Serve one file of a project directory, or a file listing if it has no index.html.
 
+    Files are served from the preview cache with ETag/Last-Modified validators
+    and gzip/brotli variants; a job's files come from its in-memory workspace.
+    """
     if not filepath:
         filepath = 'index.html'
 
-    full_path = os.path.join(project_dir, filepath)
-
-    if not os.path.exists(full_path):
-        if filepath == 'index.html':
-            files = []
-            if os.path.exists(project_dir):
-                for root, dirs, filenames in os.walk(project_dir):
-                    for filename in filenames:
-                        rel_path = os.path.relpath(os.path.join(root, filename), project_dir)
-                        files.append(rel_path.replace('\\', '/'))
-
+    try:
+        rel_path = normalize_relative(filepath)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    entry = load_preview_file(project_dir, rel_path, workspace, live_reload) if rel_path else None
+    if entry is None:
+        if rel_path == 'index.html':
+            if workspace is not None:
+                files = workspace.paths()
+            else:
+                files = []
+                if os.path.exists(project_dir):
+                    for root, dirs, filenames in os.walk(project_dir):
+                        for filename in filenames:
+                            rel = os.path.relpath(os.path.join(root, filename), project_dir)
+                            files.append(rel.replace('\\', '/'))
+
+            items = ''.join(f'<li><a href="{html.escape(base_url + f)}">{html.escape(f)}</a></li>' for f in files)
+            script = (LIVE_RELOAD_SCRIPT % live_reload) if live_reload else ''
             return f"""
             <html>
             <head><title>Generated Project</title></head>
@@ -223,14 +617,45 @@ def preview_project(filepath='index.html'):
                 <h1>Generated Project Files</h1>
                 <p>No index.html found. Available files:</p>
                 <ul>
-                    {''.join([f'<li><a href="/preview/{f}">{f}</a></li>' for f in files])}
+                    {items}
                 </ul>
+                {script}
             </body>
             </html>
             """
         return jsonify({"error": "File not found"}), 404
 
-    return send_from_directory(project_dir, filepath)
+    encoding = entry.encoding_for(negotiate_encoding(request.headers.get('Accept-Encoding', '')))
+    headers = entry.headers(encoding)
+    if entry.not_modified(encoding, request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+        return Response(status=304, headers=headers)
+    body = entry.body(encoding)
+    preview_cache.trim()
+    return Response(body, mimetype=entry.mimetype, headers=headers)
+
+
+@app.route('/preview/')
+@app.route('/preview/<path:filepath>')
+def preview_project(filepath='index.html'):
+    """Serve generated project files for preview"""
+    # The shared directory is also written by the CLI, so it is read from disk
+    return serve_preview(project_dir_for(), filepath, "/preview/")
+
+
+@app.route('/preview/job/<request_id>/')
+@app.route('/preview/job/<request_id>/<path:filepath>')
+def preview_job(request_id, filepath='index.html'):
+    """Serve the files of one generation job for preview, reloading as the coder writes them"""
+    try:
+        project_dir = project_dir_for(request_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    status = job_store.get(request_id)
+    if not status:
+        return jsonify({"error": "Request not found"}), 404
+    live_reload = f"/api/events/{request_id}" if status["status"] in ("queued", "processing") else None
+    return serve_preview(project_dir, filepath, f"/preview/job/{request_id}/",
+                         workspace=open_workspace(project_dir), live_reload=live_reload)
 
 
 @app.route('/api/preview-url', methods=['GET'])
@@ -241,14 +666,93 @@ def get_preview_url():
     else:
         base_url = "http://localhost:5000"
 
+    request_id = request.args.get('request_id')
+    path = f"/preview/job/{request_id}/" if request_id else "/preview/"
+
     return jsonify({
-        "url": f"{base_url}/preview/",
+        "url": f"{base_url}{path}",
         "message": "Open this URL to preview the generated project"
     })
 
+@app.route('/api/snapshots/<request_id>', methods=['GET'])
+def list_snapshots(request_id):
+    """List a job's file snapshots, taken after every coder step and at the end of the run"""
+    return jsonify({"request_id": request_id, "snapshots": get_artifact_store().snapshots(request_id)})
+
+
+@app.route('/api/snapshots/<request_id>/<int:snapshot_id>', methods=['GET'])
+def get_snapshot(request_id, snapshot_id):
+    """Get a snapshot's manifest of file paths and content hashes"""
+    snapshot = get_artifact_store().get_snapshot(snapshot_id)
+    if not snapshot or snapshot["run_id"] != request_id:
+        return jsonify({"error": "Snapshot not found"}), 404
+    return jsonify(snapshot)
+
+
+@app.route('/api/snapshots/diff', methods=['GET'])
+def diff_snapshots():
+    """Compare two snapshots, of the same job or of different jobs (?from=<id>&to=<id>[&patch=1])"""
+    artifact_store = get_artifact_store()
+    try:
+        old = artifact_store.get_snapshot(int(request.args["from"]))
+        new = artifact_store.get_snapshot(int(request.args["to"]))
+    except (KeyError, ValueError):
+        return jsonify({"error": "from and to must be snapshot ids"}), 400
+    if not old or not new:
+        return jsonify({"error": "Snapshot not found"}), 404
+    patch = request.args.get("patch", "").lower() in ("1", "true", "yes")
+    return jsonify({"from": old["id"], "to": new["id"],
+                    **artifact_store.diff(old["manifest"], new["manifest"], patch)})
+
+
+@app.route('/api/snapshots/<request_id>/<int:snapshot_id>/restore', methods=['POST'])
+def restore_snapshot(request_id, snapshot_id):
+    """Roll a finished job's project back (or forward) to one of its snapshots"""
+    status = job_store.get(request_id)
+    if not status:
+        return jsonify({"error": "Request not found"}), 404
+    if status["status"] in ACTIVE_STATUSES:
+        return jsonify({"error": f"Cannot restore a job that is {status['status']}"}), 409
+    artifact_store = get_artifact_store()
+    snapshot = artifact_store.get_snapshot(snapshot_id)
+    if not snapshot or snapshot["run_id"] != request_id:
+        return jsonify({"error": "Snapshot not found"}), 404
+
+    changes = artifact_store.materialize(snapshot["manifest"], open_workspace(workspace_for(request_id)))
+    if event_bus.get(request_id):
+        for path in changes["written"]:
+            event_bus.publish(request_id, "file_written", path=path)
+        for path in changes["deleted"]:
+            event_bus.publish(request_id, "file_deleted", path=path)
+    return jsonify({"request_id": request_id, "snapshot": snapshot_id, **changes})
+
+
+@app.route('/api/jobs', methods=['GET'])
+def get_job_stats():
+    """Report worker pool and queue occupancy"""
+    return jsonify(job_manager.stats())
+
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """Report planner/architect response cache size and hit/miss counters"""
+    return jsonify(llm_cache.stats())
+
+
+@app.route('/api/rate-limits', methods=['GET'])
+def get_rate_limits():
+    """Report rate limiter budgets, time spent waiting and routing statistics per provider/model"""
+    return jsonify({"limiters": rate_limit_stats(), "routes": router_stats()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose node, LLM, tool and job metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
 # ------------------- APP RUNNER ------------------- #
 
 if __name__ == '__main__':
+    start_server()
     port = int(os.getenv("PORT", 5000))
     debug_mode = os.getenv("FLASK_ENV", "development") == "development"
     app.run(host="0.0.0.0", port=port, debug=debug_mode, threaded=True)
@@ -0,0 +1,106 @@
+"""ASGI entry point for serving the API with an ASGI server such as uvicorn:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Generation jobs default to the async runner here (JOB_RUNNER=async), so every
+running job is a task on one event loop rather than a thread. The HTTP routes
+are the Flask app's, unchanged, adapted to ASGI.
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ.setdefault("JOB_RUNNER", "async")
+
+from asgiref.sync import AsyncToSync, sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import app as flask_app, start_server
+
+# Requests served at the same time; open SSE streams (progress, dashboards,
+# live reload) each hold one of these threads
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "200"))
+
+
+class ThreadedWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """Runs one request of the WSGI app on a thread of its own from ``executor``.
+
+    asgiref's adapter runs every request on one shared thread, so a single
+    open SSE stream would hold up all other requests. The client's
+    disconnect is watched while the response streams, and the response is
+    closed at its next chunk, which frees the thread of an abandoned stream.
+    """
+
+    def __init__(self, wsgi_application, executor: ThreadPoolExecutor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+        self.disconnected = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            raise ValueError("WSGI wrapper received a non-HTTP scope")
+        self.scope = scope
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        self.sync_send = AsyncToSync(send)
+        watcher = asyncio.create_task(self.watch_disconnect(receive))
+        try:
+            await sync_to_async(self.run_request, thread_sensitive=False, executor=self.executor)(b"".join(chunks))
+        finally:
+            watcher.cancel()
+
+    async def watch_disconnect(self, receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        self.disconnected = True
+
+    def run_request(self, body: bytes):
+        environ = self.build_environ(self.scope, io.BytesIO(body))
+        response = self.wsgi_application(environ, self.start_response)
+        try:
+            for output in response:
+                if self.disconnected:
+                    return
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                self.sync_send({"type": "http.response.body", "body": output, "more_body": True})
+        finally:
+            # Runs the generator's cleanup, e.g. of an SSE stream
+            if hasattr(response, "close"):
+                response.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({"type": "http.response.body"})
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    def __init__(self, wsgi_application, threads: int = ASGI_THREADS):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="asgi-request")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await asyncio.to_thread(start_server)
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        await ThreadedWsgiToAsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+app = ThreadedWsgiToAsgi(flask_app)
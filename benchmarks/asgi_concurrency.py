@@ -0,0 +1,140 @@
+"""Checks that the ASGI entry point keeps serving while SSE streams are open.
+
+Starts `uvicorn asgi:app` against the scripted fake chat model, starts a slow
+generation, opens several event streams on it and then times plain requests
+made while the streams stay open. Fails if any of them takes longer than
+--max-seconds, which is what happens when requests share one thread.
+
+    python benchmarks/asgi_concurrency.py
+    python benchmarks/asgi_concurrency.py --streams 20 --requests 50
+"""
+import argparse
+import http.client
+import json
+import os
+import pathlib
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+SERVER = """
+import sys
+sys.path.insert(0, {root!r})
+import benchmarks.fake_llm as fake_llm
+fake_llm.configure(latency={latency!r})
+import uvicorn
+uvicorn.run("asgi:app", host="127.0.0.1", port={port}, log_level="warning")
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(port: int, method: str, path: str, body: dict = None, timeout: float = 10) -> tuple[int, dict, float]:
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=timeout) as res:
+        payload = res.read()
+        elapsed = time.perf_counter() - start
+        is_json = res.headers.get_content_type() == "application/json"
+        return res.status, json.loads(payload) if is_json else {}, elapsed
+
+
+def open_stream(port: int, path: str, opened: threading.Semaphore, stop: threading.Event) -> None:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("GET", path, headers={"Accept": "text/event-stream"})
+    res = conn.getresponse()
+    res.readline()
+    opened.release()
+    stop.wait()
+    conn.close()
+
+
+def wait_for_server(port: int, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn exited during start-up")
+        try:
+            request(port, "GET", "/", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("uvicorn did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check request concurrency of the ASGI app with open SSE streams")
+    parser.add_argument("--streams", type=int, default=5, help="Event streams kept open (default: 5)")
+    parser.add_argument("--requests", type=int, default=20, help="Plain requests timed meanwhile (default: 20)")
+    parser.add_argument("--max-seconds", type=float, default=1.0,
+                        help="Slowest allowed plain request in seconds (default: 1.0)")
+    args = parser.parse_args()
+
+    state_dir = pathlib.Path(tempfile.mkdtemp(prefix="asgi-check-"))
+    env = {
+        **os.environ,
+        "LLM_MODEL": "fake:bench",
+        "LLM_CACHE_ENABLED": "false",
+        "CHECKPOINT_PATH": str(state_dir / "checkpoints.sqlite3"),
+        "JOB_STORE_PATH": str(state_dir / "jobs.sqlite3"),
+        "WORKSPACES_ROOT": str(state_dir / "workspaces"),
+        "ARTIFACTS_PATH": str(state_dir / "artifacts"),
+        "TRACE_PATH": str(state_dir / "traces"),
+    }
+    port = free_port()
+    # Slow model calls keep the job, and with it its event stream, running for the whole check
+    code = SERVER.format(root=str(ROOT), latency=30.0, port=port)
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=env)
+    stop = threading.Event()
+    try:
+        wait_for_server(port, process)
+        _, job, _ = request(port, "POST", "/api/generate", {"prompt": "Concurrency check"})
+        request_id = job["request_id"]
+
+        opened = threading.Semaphore(0)
+        for _ in range(args.streams):
+            threading.Thread(target=open_stream, args=(port, f"/api/events/{request_id}", opened, stop),
+                             daemon=True).start()
+        for _ in range(args.streams):
+            if not opened.acquire(timeout=10):
+                raise RuntimeError("An event stream did not open")
+
+        timings = []
+        for i in range(args.requests):
+            path = "/" if i % 2 else f"/api/status/{request_id}"
+            try:
+                timings.append(request(port, "GET", path, timeout=args.max_seconds * 5)[2])
+            except OSError:
+                timings.append(float("inf"))
+        slowest = max(timings)
+        print(f"{args.streams} open streams, {args.requests} requests: slowest {slowest:.3f}s, "
+              f"mean {sum(timings) / len(timings):.3f}s")
+        request(port, "POST", f"/api/cancel/{request_id}")
+        if slowest > args.max_seconds:
+            print(f"FAIL: a request took longer than {args.max_seconds:.1f}s while streams were open")
+            sys.exit(1)
+    finally:
+        stop.set()
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
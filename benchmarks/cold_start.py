@@ -0,0 +1,64 @@
+"""Measures how long importing the backend takes in a fresh interpreter.
+
+Each module is imported in a new process several times and the median is
+reported, together with the chat model client libraries the import pulled in.
+Client libraries must only load when a model is first used, so the script
+fails if any of them is imported at startup or if the median exceeds --budget.
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --budget 1.5 --runs 7 app main
+"""
+import argparse
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+# Packages that belong to a single provider and may only load lazily
+PROVIDER_PACKAGES = ("langchain_google_genai", "langchain_groq", "google.generativeai", "groq")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "providers": [m for m in {providers!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str) -> dict:
+    code = PROBE.format(module=module, providers=PROVIDER_PACKAGES)
+    res = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{res.stderr}")
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend cold start time")
+    parser.add_argument("modules", nargs="*", default=["agent.graph", "app", "main"])
+    parser.add_argument("--runs", type=int, default=5, help="Imports per module (default: 5)")
+    parser.add_argument("--budget", type=float, default=2.0,
+                        help="Maximum median import time in seconds (default: 2.0)")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        results = [measure(module) for _ in range(args.runs)]
+        median = statistics.median(r["seconds"] for r in results)
+        providers = sorted({p for r in results for p in r["providers"]})
+        print(f"{module:<12} median {median:.3f}s  min {min(r['seconds'] for r in results):.3f}s"
+              f"  providers loaded: {', '.join(providers) or 'none'}")
+        if providers:
+            print(f"  FAIL: {module} imports provider clients at startup")
+            failed = True
+        if median > args.budget:
+            print(f"  FAIL: {module} exceeds the {args.budget:.1f}s budget")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Deterministic, offline chat model for benchmarks.
+
+``FakeChatModel`` answers the planner and architect with scripted ``Plan`` /
+``TaskPlan`` objects and drives the coder's ReAct loop with a fixed sequence
+of tool calls, sleeping ``latency`` seconds per call. Importing this module
+registers it as the "fake" provider, so it is selected with e.g.
+``LLM_MODEL=fake:bench``.
+"""
+import asyncio
+import json
+import re
+import time
+from typing import Any, Iterator, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from agent.llm import register_provider
+from agent.states import File, ImplementationTask, Plan, TaskPlan
+
+# Defaults for every fake client created by the registry; see configure()
+settings = {
+    "latency": 0.05,
+    "files": 3,
+    "tasks_per_file": 2,
+    "file_size": 2000,
+    "tool_rounds": 2,
+}
+
+
+def configure(**overrides) -> None:
+    """Changes the scenario of fake clients created after this call."""
+    unknown = set(overrides) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown fake model settings: {', '.join(sorted(unknown))}")
+    settings.update(overrides)
+
+
+def scenario_paths(files: int) -> list[str]:
+    base = ["index.html", "style.css", "app.js"]
+    return base[:files] + [f"js/module{i}.js" for i in range(max(0, files - len(base)))]
+
+
+def scripted_plan(files: int) -> Plan:
+    return Plan(
+        name="Benchmark App",
+        description="A generated app used to benchmark the pipeline",
+        techstack="html, css, javascript",
+        features=["render a list", "add items", "remove items"],
+        files=[File(path=path, purpose=f"Implements {path}") for path in scenario_paths(files)],
+    )
+
+
+def scripted_task_plan(files: int, tasks_per_file: int) -> TaskPlan:
+    steps = []
+    for path in scenario_paths(files):
+        depends_on = [] if path == "index.html" else ["index.html"]
+        for number in range(1, tasks_per_file + 1):
+            steps.append(ImplementationTask(
+                filepath=path,
+                task_description=f"Part {number} of {path}",
+                depends_on=depends_on,
+            ))
+    return TaskPlan(implementation_steps=steps)
+
+
+def _file_content(path: str, size: int, marker: str) -> str:
+    if path.endswith(".html"):
+        # A page that passes the local checks, so benchmarks measure runs without repairs
+        header = f"<!DOCTYPE html>\n<!-- {path} ({marker.replace('--', '')}) -->\n"
+        line = "<p>generated line of benchmark content</p>\n"
+    else:
+        header = f"/* {path} ({marker}) */\n"
+        line = "// generated line of benchmark content\n"
+    return header + line * max(0, (size - len(header)) // len(line))
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model with scripted answers, structured output and tool calling."""
+
+    model: str = "fake"
+    latency: float = 0.05
+    files: int = 3
+    tasks_per_file: int = 2
+    file_size: int = 2000
+    tool_rounds: int = 2
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def with_structured_output(self, schema, **kwargs):
+        return self.bind(structured_output=schema.__name__) | RunnableLambda(
+            lambda message: schema.model_validate_json(message.content)
+        )
+
+    def _reply(self, messages: list[BaseMessage], structured_output: Optional[str]) -> AIMessage:
+        if structured_output == "Plan":
+            return AIMessage(content=scripted_plan(self.files).model_dump_json())
+        if structured_output == "TaskPlan":
+            return AIMessage(content=scripted_task_plan(self.files, self.tasks_per_file).model_dump_json())
+        if structured_output:
+            raise ValueError(f"No scripted response for {structured_output}")
+
+        prompt = next((str(m.content) for m in messages if m.type == "human"), "")
+        if "ARCHITECT agent" in prompt:
+            # Streamed architect (ARCHITECT_PIPELINE) asks for plain JSON text
+            return AIMessage(content=scripted_task_plan(self.files, self.tasks_per_file).model_dump_json())
+
+        # Coder: list the files, then write the file named in the prompt, then stop
+        match = re.search(r"File : (\S+)", prompt)
+        path = match.group(1) if match else "output.txt"
+        round_ = sum(1 for m in messages if isinstance(m, ToolMessage))
+        if round_ >= self.tool_rounds:
+            return AIMessage(content=f"Implemented {path}")
+        if round_ < self.tool_rounds - 1:
+            call = {"name": "list_files", "args": {"directory": "."}}
+        else:
+            call = {"name": "write_file", "args": {"path": path, "content": _file_content(path, self.file_size, prompt[:40])}}
+        return AIMessage(content="", tool_calls=[{**call, "id": f"call_{round_}"}])
+
+    def _usage(self, messages: list[BaseMessage], message: AIMessage) -> dict:
+        input_tokens = sum(_estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = _estimate_tokens(message.content or str(message.tool_calls))
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        message = self._reply(messages, kwargs.get("structured_output"))
+        message.usage_metadata = self._usage(messages, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        """Like ``_generate`` but waits on the event loop, as a network client would."""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = self._reply(messages, kwargs.get("structured_output"))
+        message.usage_metadata = self._usage(messages, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        """Streams text replies in pieces, spreading ``latency`` over them."""
+        message = self._reply(messages, kwargs.get("structured_output"))
+        tool_call_chunks = [
+            {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": idx}
+            for idx, call in enumerate(message.tool_calls)
+        ]
+        content = message.content
+        pieces = [content[i:i + 64] for i in range(0, len(content), 64)] or [""]
+        for idx, piece in enumerate(pieces):
+            if self.latency:
+                time.sleep(self.latency / len(pieces))
+            chunk = AIMessageChunk(content=piece, tool_call_chunks=tool_call_chunks if idx == 0 else [])
+            if idx == len(pieces) - 1:
+                chunk.usage_metadata = self._usage(messages, message)
+            yield ChatGenerationChunk(message=chunk)
+
+
+register_provider("fake", lambda model, **kwargs: FakeChatModel(model=model, **settings, **kwargs))
@@ -0,0 +1,227 @@
+"""Offline throughput/latency benchmark of the generation pipeline.
+
+Runs the LangGraph pipeline ("graph" target) and/or the Flask endpoints
+("app" target) against the scripted fake chat model at several concurrency
+levels and reports per-node latency, end-to-end latency, jobs/minute,
+rate-limiter wait and peak memory. No network access or API keys are needed.
+
+    python benchmarks/pipeline.py
+    python benchmarks/pipeline.py --target graph --jobs 20 --concurrency 1 4 8 --latency 0.1
+    python benchmarks/pipeline.py --json results.json
+    python benchmarks/pipeline.py --baseline results.json --tolerance 0.2
+
+With --baseline the script exits non-zero when jobs/minute of any run drops
+more than --tolerance below the baseline, so it can gate CI.
+"""
+import argparse
+import atexit
+import json
+import os
+import pathlib
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+STATE_DIR = pathlib.Path(tempfile.mkdtemp(prefix="pipeline-bench-"))
+atexit.register(shutil.rmtree, STATE_DIR, ignore_errors=True)
+
+# Everything the pipeline persists goes to a scratch directory, and the cache
+# is off so every job does the full amount of work. These must be set before
+# the agent modules are imported.
+os.environ.update({
+    "LLM_MODEL": "fake:bench",
+    "LLM_CACHE_ENABLED": "false",
+    "CHECKPOINT_PATH": str(STATE_DIR / "checkpoints.sqlite3"),
+    "JOB_STORE_PATH": str(STATE_DIR / "jobs.sqlite3"),
+    "WORKSPACES_ROOT": str(STATE_DIR / "workspaces"),
+    "ARTIFACTS_PATH": str(STATE_DIR / "artifacts"),
+    "TRACE_PATH": str(STATE_DIR / "traces"),
+})
+for name in ("PLANNER_MODEL", "ARCHITECT_MODEL", "CODER_MODEL"):
+    os.environ.pop(name, None)
+sys.path.insert(0, str(ROOT))
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "mean": round(statistics.fmean(values), 4) if values else 0.0,
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+    }
+
+
+def limiter_wait() -> float:
+    from agent.ratelimit import rate_limit_stats
+    return sum(stats["total_wait_seconds"] for stats in rate_limit_stats())
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_graph_job(job_id: str, node_times: dict) -> float:
+    from agent.graph import agent, run_config
+    from agent.tools import use_project_root, workspace_for
+    from agent.workspace import close_workspace
+
+    root = workspace_for(job_id)
+    start = last = time.perf_counter()
+    with use_project_root(root):
+        try:
+            for chunk in agent.stream({"user_prompt": f"Benchmark job {job_id}"}, run_config(job_id),
+                                      stream_mode="updates"):
+                now = time.perf_counter()
+                for node in chunk:
+                    node_times[node].append(now - last)
+                last = now
+        finally:
+            close_workspace(root)
+    return time.perf_counter() - start
+
+
+def bench_graph(jobs: int, concurrency: int) -> dict:
+    node_times: dict[str, list[float]] = defaultdict(list)
+    job_ids = [f"graph-{concurrency}-{i}-{uuid.uuid4().hex[:8]}" for i in range(jobs)]
+    wait_before = limiter_wait()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(lambda job_id: run_graph_job(job_id, node_times), job_ids))
+    elapsed = time.perf_counter() - start
+    return {
+        "target": "graph",
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "seconds": round(elapsed, 3),
+        "jobs_per_minute": round(jobs / elapsed * 60, 2),
+        "job_latency": summarize(latencies),
+        "node_latency": {node: summarize(times) for node, times in node_times.items()},
+        "limiter_wait_seconds": round(limiter_wait() - wait_before, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_app(jobs: int, concurrency: int, poll_interval: float = 0.02) -> dict:
+    import app as server
+    from agent.jobs import JobManager
+
+    # A fresh pool sized to this concurrency level, with room for every job
+    server.job_manager = JobManager(max_workers=concurrency, max_queue=jobs)
+    client = server.app.test_client()
+    wait_before = limiter_wait()
+    start = time.perf_counter()
+
+    submitted = {}
+    for i in range(jobs):
+        res = client.post("/api/generate", json={"prompt": f"Benchmark job {i}"})
+        if res.status_code != 200:
+            raise RuntimeError(f"/api/generate returned {res.status_code}: {res.get_json()}")
+        submitted[res.get_json()["request_id"]] = time.perf_counter()
+
+    latencies, failed = [], 0
+    pending = set(submitted)
+    while pending:
+        for request_id in list(pending):
+            status = client.get(f"/api/status/{request_id}").get_json()
+            if status["status"] in ("completed", "error", "cancelled", "interrupted"):
+                pending.discard(request_id)
+                latencies.append(time.perf_counter() - submitted[request_id])
+                failed += status["status"] != "completed"
+        time.sleep(poll_interval)
+    elapsed = time.perf_counter() - start
+    return {
+        "target": "app",
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "jobs_per_minute": round(jobs / elapsed * 60, 2),
+        "job_latency": summarize(latencies),
+        "limiter_wait_seconds": round(limiter_wait() - wait_before, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_result(result: dict) -> None:
+    latency = result["job_latency"]
+    print(f"{result['target']:<5} c={result['concurrency']:<3} jobs={result['jobs']:<4} "
+          f"{result['jobs_per_minute']:>8.1f} jobs/min  latency p50 {latency['p50']:.3f}s p95 {latency['p95']:.3f}s  "
+          f"limiter wait {result['limiter_wait_seconds']:.2f}s  peak rss {result['peak_rss_mb']} MB")
+    for node, stats in result.get("node_latency", {}).items():
+        print(f"      {node:<10} mean {stats['mean']:.3f}s p50 {stats['p50']:.3f}s p95 {stats['p95']:.3f}s")
+    if result.get("failed"):
+        print(f"      {result['failed']} jobs failed")
+
+
+def check_baseline(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    baseline = {(r["target"], r["concurrency"]): r for r in json.loads(pathlib.Path(baseline_path).read_text())}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["target"], result["concurrency"]))
+        if previous and result["jobs_per_minute"] < previous["jobs_per_minute"] * (1 - tolerance):
+            regressions.append(f"{result['target']} c={result['concurrency']}: {result['jobs_per_minute']} jobs/min "
+                               f"vs baseline {previous['jobs_per_minute']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline with a fake chat model")
+    parser.add_argument("--target", choices=["graph", "app", "both"], default="both")
+    parser.add_argument("--jobs", type=int, default=8, help="Jobs per concurrency level (default: 8)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake model call (default: 0.05)")
+    parser.add_argument("--files", type=int, default=3, help="Files in the scripted plan (default: 3)")
+    parser.add_argument("--tasks-per-file", type=int, default=2)
+    parser.add_argument("--file-size", type=int, default=2000, help="Bytes written per file (default: 2000)")
+    parser.add_argument("--rpm", type=float, default=100000, help="Requests per minute allowed by the limiter")
+    parser.add_argument("--tpm", type=float, default=100000000, help="Tokens per minute allowed by the limiter")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Stream the architect's tasks into the coders (ARCHITECT_PIPELINE)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare jobs/minute against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed jobs/minute drop (default: 0.2)")
+    args = parser.parse_args()
+
+    os.environ["ARCHITECT_PIPELINE"] = "true" if args.pipeline else "false"
+    os.environ["RATE_LIMIT_FAKE_RPM"] = str(args.rpm)
+    os.environ["RATE_LIMIT_FAKE_TPM"] = str(args.tpm)
+    os.environ["RATE_LIMIT_FAKE_BURST"] = str(max(1.0, args.rpm / 60))
+
+    from benchmarks import fake_llm
+    fake_llm.configure(latency=args.latency, files=args.files, tasks_per_file=args.tasks_per_file,
+                       file_size=args.file_size)
+
+    targets = ["graph", "app"] if args.target == "both" else [args.target]
+    results = []
+    for target in targets:
+        for concurrency in args.concurrency:
+            result = bench_graph(args.jobs, concurrency) if target == "graph" else bench_app(args.jobs, concurrency)
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
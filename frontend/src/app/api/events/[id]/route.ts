@@ -0,0 +1,52 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export const dynamic = 'force-dynamic';
+
+// Proxies the backend's Server-Sent Events stream for one generation request.
+// EventSource sends Last-Event-ID when it reconnects, so forward it to resume.
+export async function GET(request: NextRequest, { params }: { params: Promise<{ id: string }> }) {
+  const { id } = await params;
+
+  if (!id) {
+    return NextResponse.json(
+      { error: 'Request ID is required' },
+      { status: 400 }
+    );
+  }
+
+  const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:5000';
+  const headers: Record<string, string> = { Accept: 'text/event-stream' };
+  const lastEventId = request.headers.get('last-event-id');
+  if (lastEventId) {
+    headers['Last-Event-ID'] = lastEventId;
+  }
+
+  try {
+    const response = await fetch(`${backendUrl}/api/events/${id}`, {
+      headers,
+      signal: request.signal,
+      cache: 'no-store',
+    });
+
+    if (!response.ok || !response.body) {
+      return NextResponse.json(
+        { error: 'Event stream not available' },
+        { status: response.status === 404 ? 404 : 503 }
+      );
+    }
+
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache, no-transform',
+        Connection: 'keep-alive',
+      },
+    });
+  } catch (error) {
+    console.log('Backend not available for event stream:', error);
+    return NextResponse.json(
+      { error: 'Backend service unavailable' },
+      { status: 503 }
+    );
+  }
+}
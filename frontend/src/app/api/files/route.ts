@@ -3,9 +3,11 @@ import { NextRequest, NextResponse } from 'next/server';
 export async function GET(request: NextRequest) {
   try {
     const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:5000';
+    const requestId = request.nextUrl.searchParams.get('request_id');
+    const query = requestId ? `?request_id=${encodeURIComponent(requestId)}` : '';
     
     try {
-      const response = await fetch(`${backendUrl}/api/files`, {
+      const response = await fetch(`${backendUrl}/api/files${query}`, {
         method: 'GET',
         headers: { 'Content-Type': 'application/json' },
       });
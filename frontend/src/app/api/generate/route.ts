@@ -31,8 +31,13 @@ export async function POST(request: NextRequest) {
         return NextResponse.json({
           request_id: data.request_id,
           status: data.status,
-          message: data.message
+          message: data.message,
+          queue_position: data.queue_position
         });
+      } else if (response.status === 429) {
+        // Backend queue is full - let the dashboard tell the user to retry later
+        const data = await response.json();
+        return NextResponse.json(data, { status: 429 });
       } else {
         throw new Error('Backend service unavailable');
       }
@@ -29,6 +29,9 @@ interface GenerationProgress {
   progress: number;
 }
 
+// Job statuses that end a run without a project (interrupted: the server restarted mid-run)
+const FAILED_STATUSES = ['error', 'cancelled', 'interrupted'];
+
 export default function Dashboard() {
   const [projectName, setProjectName] = useState('');
   const [projectDescription, setProjectDescription] = useState('');
@@ -41,6 +44,81 @@ export default function Dashboard() {
     progress: 0
   });
 
+  // Follow progress over Server-Sent Events; falls back to polling if the
+  // stream cannot be opened
+  const watchEvents = (requestId: string) => {
+    if (typeof EventSource === 'undefined') {
+      pollStatus(requestId);
+      return;
+    }
+
+    const source = new EventSource(`/api/events/${requestId}`);
+    let totalSteps = 0;
+    let finishedSteps = 0;
+
+    const setProgress = (message: string, progress?: number) => {
+      setGenerationProgress(prev => ({
+        ...prev,
+        status: 'processing',
+        message,
+        progress: progress ?? prev.progress
+      }));
+    };
+
+    source.addEventListener('status', async (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      if (data.status === 'completed') {
+        source.close();
+        setGenerationProgress(prev => ({ ...prev, status: 'completed', message: data.message, progress: 100 }));
+        await handleCompletedGeneration(requestId);
+      } else if (FAILED_STATUSES.includes(data.status)) {
+        source.close();
+        setGenerationProgress(prev => ({
+          ...prev,
+          status: 'error',
+          message: data.error || data.message || 'Generation failed'
+        }));
+      } else {
+        setProgress(data.message);
+      }
+    });
+
+    source.addEventListener('node_finished', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      if (data.node === 'planner') {
+        setProgress(`Planned ${data.files} files for ${data.name}`, 25);
+      } else if (data.node === 'architect') {
+        totalSteps = data.steps;
+        setProgress(`Designed ${data.steps} implementation steps`, 35);
+      }
+    });
+
+    source.addEventListener('step_started', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      setProgress(`Writing ${data.filepath}...`);
+    });
+
+    source.addEventListener('step_finished', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      finishedSteps += 1;
+      const progress = totalSteps ? 35 + Math.round((55 * finishedSteps) / totalSteps) : undefined;
+      setProgress(`Finished ${data.filepath}`, progress);
+    });
+
+    source.addEventListener('file_written', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      setProgress(`Saved ${data.path}`);
+    });
+
+    source.onerror = () => {
+      // The browser retries dropped connections by itself (resuming with
+      // Last-Event-ID); only a refused stream ends up CLOSED.
+      if (source.readyState === EventSource.CLOSED) {
+        pollStatus(requestId);
+      }
+    };
+  };
+
   // Poll for status updates
   const pollStatus = async (requestId: string) => {
     let attempts = 0;
@@ -89,7 +167,7 @@ export default function Dashboard() {
           if (statusData.status === 'completed') {
             await handleCompletedGeneration(requestId);
             return;
-          } else if (statusData.status === 'error') {
+          } else if (FAILED_STATUSES.includes(statusData.status)) {
             setGenerationProgress(prev => ({
               ...prev,
               status: 'error',
@@ -147,13 +225,14 @@ export default function Dashboard() {
   // Handle completed generation
   const handleCompletedGeneration = async (requestId: string) => {
     try {
-      // Fetch the generated files
-      const filesResponse = await fetch('/api/files');
-      if (filesResponse.ok) {
-        const filesData = await filesResponse.json();
+      // Fetch every generated file in one bundle request
+      const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:5000';
+      const bundleResponse = await fetch(`${backendUrl}/api/bundle?request_id=${encodeURIComponent(requestId)}`);
+      if (bundleResponse.ok) {
+        const bundle = await bundleResponse.json();
         
         // Create project from generated files
-        const newProject = await createProjectFromFiles(filesData.files);
+        const newProject = createProjectFromFiles(bundle.files);
         setGeneratedProjects(prev => [newProject, ...prev]);
         setProjectName('');
         setProjectDescription('');
@@ -176,25 +255,16 @@ export default function Dashboard() {
   };
 
   // Create project object from backend files
-  const createProjectFromFiles = async (files: any[]) => {
+  const createProjectFromFiles = (files: { name: string; path: string; content: string }[]) => {
     let html = '', css = '', js = '';
     
     for (const file of files) {
-      try {
-        const response = await fetch(`${process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:5000'}/api/file/${file.path}`);
-        if (response.ok) {
-          const fileData = await response.json();
-          
-          if (file.name.endsWith('.html')) {
-            html = fileData.content;
-          } else if (file.name.endsWith('.css')) {
-            css = fileData.content;
-          } else if (file.name.endsWith('.js')) {
-            js = fileData.content;
-          }
-        }
-      } catch (error) {
-        console.error(`Error fetching file ${file.path}:`, error);
+      if (file.name.endsWith('.html')) {
+        html = file.content;
+      } else if (file.name.endsWith('.css')) {
+        css = file.content;
+      } else if (file.name.endsWith('.js')) {
+        js = file.content;
       }
     }
 
@@ -247,7 +317,7 @@ export default function Dashboard() {
             progress: 20
           }));
           
-          pollStatus(data.request_id);
+          watchEvents(data.request_id);
         } else {
           // Handle mock response (when backend unavailable)
           const newProject = data;
@@ -261,6 +331,13 @@ export default function Dashboard() {
             progress: 0
           });
         }
+      } else if (response.status === 429) {
+        setGenerationProgress({
+          requestId: null,
+          status: 'error',
+          message: 'The server is busy with other projects - please try again in a minute',
+          progress: 0
+        });
       } else {
         throw new Error('Failed to start generation');
       }
@@ -368,6 +445,17 @@ export default function Dashboard() {
                       <Loader2 className="h-4 w-4 animate-spin" />
                       <p className="text-sm font-medium">{generationProgress.message}</p>
                     </div>
+                    {generationProgress.requestId && (
+                      // Live preview: the backend reloads this page whenever the coder writes a file
+                      <div className="border rounded-lg overflow-hidden">
+                        <iframe
+                          src={`${process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:5000'}/preview/job/${generationProgress.requestId}/`}
+                          className="w-full h-96"
+                          title="Live preview"
+                          sandbox="allow-scripts allow-same-origin"
+                        />
+                      </div>
+                    )}
                   </div>
                 )}
                 
@@ -1,22 +1,19 @@
 import argparse
+import os
+import pathlib
 import sys
+import time
 import traceback
 
-from agent.graph import agent
+from agent.graph import agent, run_config
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Run engineering project planner")
-    parser.add_argument("--recursion-limit", "-r", type=int, default=100,
-                        help="Recursion limit for processing (default: 100)")
-
-    args = parser.parse_args()
-
+def run_interactive(args):
     try:
         user_prompt = input("Enter your project prompt: ")
         result = agent.invoke(
-            {"user_prompt": user_prompt},
-            {"recursion_limit": args.recursion_limit}
+            {"user_prompt": user_prompt, "no_cache": args.no_cache},
+            run_config(recursion_limit=args.recursion_limit)
         )
         print("Final State:", result)
     except KeyboardInterrupt:
@@ -28,5 +25,77 @@ def main():
         sys.exit(1)
 
 
+def run_batch_command(args):
+    from agent.batch import load_prompts, run_batch
+
+    output_dir = pathlib.Path(args.output_dir)
+    results_path = pathlib.Path(args.results) if args.results else output_dir / "results.jsonl"
+    # All workers draw from one rate limit budget per provider/model
+    os.environ.setdefault("RATE_LIMIT_SHARED_PATH", str(output_dir / ".ratelimit.sqlite3"))
+
+    entries = load_prompts(pathlib.Path(args.prompts))
+    if args.no_cache:
+        for entry in entries:
+            entry["no_cache"] = True
+    print(f"{len(entries)} prompts, {args.workers} workers, results in {results_path}")
+
+    failed = 0
+    try:
+        for count, result in enumerate(run_batch(entries, output_dir, results_path, args.workers,
+                                                 args.recursion_limit), start=1):
+            failed += result["status"] != "completed"
+            print(f"[{count}] {result['id']}: {result['status']} in {result['seconds']:.1f}s")
+    except KeyboardInterrupt:
+        print("\nBatch interrupted; run the same command again to resume.")
+        sys.exit(130)
+    sys.exit(1 if failed else 0)
+
+
+def run_trace_command(args):
+    from agent.tracing import list_traces, show_trace
+
+    if not args.trace_id:
+        for trace in list_traces()[:args.limit]:
+            modified = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(trace["modified"]))
+            print(f"{modified}  {trace['bytes']:>10}  {trace['trace_id']}")
+        return
+    kinds = set(args.kinds.split(",")) if args.kinds else None
+    try:
+        show_trace(args.trace_id, kinds, args.summary, args.json)
+    except FileNotFoundError:
+        print(f"No trace {args.trace_id!r}", file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run engineering project planner")
+    parser.add_argument("--recursion-limit", "-r", type=int, default=100,
+                        help="Recursion limit for processing (default: 100)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore cached planner/architect responses")
+    subcommands = parser.add_subparsers(dest="command")
+    batch = subcommands.add_parser("batch", help="Generate one project per prompt of a JSONL file, concurrently")
+    batch.add_argument("prompts", help='JSONL file with one {"prompt": ..., "id": ...} object (or string) per line')
+    batch.add_argument("--output-dir", "-o", default="batch_output",
+                       help="Directory that gets one project directory per prompt (default: batch_output)")
+    batch.add_argument("--results", help="JSONL file the results are appended to (default: <output-dir>/results.jsonl)")
+    batch.add_argument("--workers", "-w", type=int, default=2,
+                       help="Projects generated at the same time, each in its own process (default: 2)")
+    trace = subcommands.add_parser("trace", help="List run traces, or show one as a timeline")
+    trace.add_argument("trace_id", nargs="?", help="Request id (thread id) of the run, or a trace file path")
+    trace.add_argument("--kinds", "-k", help="Only these record kinds, comma-separated (run,node,llm,tool)")
+    trace.add_argument("--summary", "-s", action="store_true", help="Time, calls and tokens per node, model and tool")
+    trace.add_argument("--json", action="store_true", help="Print the raw records")
+    trace.add_argument("--limit", "-n", type=int, default=20, help="Traces listed without a trace id (default: 20)")
+
+    args = parser.parse_args()
+    if args.command == "batch":
+        run_batch_command(args)
+    elif args.command == "trace":
+        run_trace_command(args)
+    else:
+        run_interactive(args)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,6 +1,5 @@
 import json
 import requests
-import time
 
 def test_generation_flow():
     """Test the complete generation flow"""
@@ -18,44 +17,36 @@ def test_generation_flow():
         request_id = data.get("request_id")
         print(f"✅ Generation started with ID: {request_id}")
         
-        # Step 2: Poll for status
-        max_attempts = 30  # 5 minutes
-        attempt = 0
-        
-        while attempt < max_attempts:
-            print(f"📊 Checking status (attempt {attempt + 1})...")
-            
-            status_response = requests.get(f"{base_url}/api/status/{request_id}")
-            
-            if status_response.status_code == 200:
-                status_data = status_response.json()
-                print(f"Status: {status_data.get('status')} - {status_data.get('message')}")
-                
-                if status_data.get('status') == 'completed':
-                    print("🎉 Generation completed successfully!")
-                    
-                    # Step 3: Get generated files
-                    files_response = requests.get(f"{base_url}/api/files")
-                    if files_response.status_code == 200:
-                        files_data = files_response.json()
-                        print(f"📁 Generated {len(files_data.get('files', []))} files:")
-                        for file in files_data.get('files', []):
-                            print(f"  - {file.get('name')} ({file.get('path')})")
-                    break
-                    
-                elif status_data.get('status') == 'error':
-                    print(f"❌ Generation failed: {status_data.get('message')}")
-                    break
-                    
-            else:
-                print(f"⚠️  Status check failed: {status_response.status_code}")
-                
-            attempt += 1
-            time.sleep(10)  # Wait 10 seconds between checks
-            
-        if attempt >= max_attempts:
-            print("⏰ Generation timed out")
-            
+        # Step 2: Follow progress events as they happen
+        print("📡 Streaming progress events...")
+        status_data = None
+        with requests.get(f"{base_url}/api/events/{request_id}", stream=True, timeout=300) as events:
+            event_type = None
+            for line in events.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event_type = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    print(f"  [{event_type}] {data}")
+                    if event_type == "status" and data.get("status") in ("completed", "error", "cancelled"):
+                        status_data = data
+                        break
+
+        if status_data is None:
+            print("⏰ Event stream ended before the generation finished")
+        elif status_data.get('status') == 'completed':
+            print("🎉 Generation completed successfully!")
+
+            # Step 3: Get generated files
+            files_response = requests.get(f"{base_url}/api/files", params={"request_id": request_id})
+            if files_response.status_code == 200:
+                files_data = files_response.json()
+                print(f"📁 Generated {len(files_data.get('files', []))} files:")
+                for file in files_data.get('files', []):
+                    print(f"  - {file.get('name')} ({file.get('path')})")
+        else:
+            print(f"❌ Generation failed: {status_data.get('error') or status_data.get('message')}")
+
     else:
         print(f"❌ Failed to start generation: {response.status_code}")
         print(response.text)